@@ -0,0 +1,301 @@
+"""
+Scripted load test of the REST API with a JSON report.
+
+    # In-process, against a fresh seeded SQLite database (no server needed)
+    python benchmarks/api_load.py --iterations 50 --concurrency 4 --output run.json
+
+    # Against a running server; Server-Timing (INSTRUMENTATION_SERVER_TIMING) supplies query counts
+    python benchmarks/api_load.py --base-url http://localhost:8000 \\
+        --customer alice:secret --manager boss:secret --api-key <key>
+
+    # Fail (exit 1) if p95 latency or queries per request regressed against a saved run
+    python benchmarks/api_load.py --compare baseline.json
+
+Every iteration of a virtual user is one realistic session: browse
+categories and the menu, open two item details, add them to the cart, view
+the cart, check out (OrderViewSet.create), then a voice order through
+direct-order/ and a manager listing orders. Choices come from a seeded
+random generator, so runs are reproducible.
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+from pathlib import Path
+
+from common import git_revision, percentile, setup_django
+
+SERVER_TIMING_QUERIES = re.compile(r'db;[^,]*desc="(\d+) queries"')
+
+
+class Result:
+    __slots__ = ('status', 'elapsed', 'queries', 'data')
+
+    def __init__(self, status, elapsed, queries, data):
+        self.status, self.elapsed, self.queries, self.data = status, elapsed, queries, data
+
+
+class TestClientTransport:
+    """Django test client in this process; queries are counted on every database alias."""
+
+    def __init__(self):
+        from django.test import Client
+        self.client_class = Client
+        self.local = threading.local()
+
+    def request(self, method, path, payload=None, headers=None):
+        from django.conf import settings
+        from django.db import connections
+
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = self.client_class(SERVER_NAME='localhost')
+        counter = [0]
+
+        def count(execute, sql, params, many, context):
+            counter[0] += 1
+            return execute(sql, params, many, context)
+
+        extra = {f'HTTP_{name.upper().replace("-", "_")}': value for name, value in (headers or {}).items()}
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in settings.DATABASES:
+                stack.enter_context(connections[alias].execute_wrapper(count))
+            response = getattr(client, method.lower())(path, data=payload, content_type='application/json', **extra)
+        elapsed = time.perf_counter() - started
+        data = response.json() if response.get('Content-Type', '').startswith('application/json') else None
+        return Result(response.status_code, elapsed, counter[0], data)
+
+
+class HttpTransport:
+    """A live server; query counts are read from the Server-Timing header when the server sends it."""
+
+    def __init__(self, base_url):
+        import requests
+        self.base_url = base_url.rstrip('/')
+        self.session_class = requests.Session
+        self.local = threading.local()
+
+    def request(self, method, path, payload=None, headers=None):
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = self.local.session = self.session_class()
+        started = time.perf_counter()
+        response = session.request(method, self.base_url + path, json=payload, headers=headers)
+        elapsed = time.perf_counter() - started
+        match = SERVER_TIMING_QUERIES.search(response.headers.get('Server-Timing', ''))
+        try:
+            data = response.json()
+        except ValueError:
+            data = None
+        return Result(response.status_code, elapsed, int(match.group(1)) if match else None, data)
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = defaultdict(list)
+
+    def add(self, name, result, expected):
+        with self.lock:
+            self.samples[name].append((result.elapsed, result.queries, result.status in expected))
+
+    def report(self, wall_time):
+        endpoints = {}
+        total = 0
+        for name, samples in sorted(self.samples.items()):
+            latencies = sorted(elapsed * 1000 for elapsed, _, _ in samples)
+            queries = [count for _, count, _ in samples if count is not None]
+            total += len(samples)
+            endpoints[name] = {
+                'count': len(samples),
+                'errors': sum(1 for _, _, ok in samples if not ok),
+                'mean_ms': round(sum(latencies) / len(latencies), 2),
+                'p50_ms': round(percentile(latencies, 0.50), 2),
+                'p95_ms': round(percentile(latencies, 0.95), 2),
+                'p99_ms': round(percentile(latencies, 0.99), 2),
+                'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+            }
+        return {'total_requests': total, 'throughput_rps': round(total / wall_time, 1), 'endpoints': endpoints}
+
+
+class Session:
+    """One virtual user."""
+
+    def __init__(self, transport, recorder, rng, customer_token, manager_token, api_key):
+        self.transport, self.recorder, self.rng = transport, recorder, rng
+        self.customer = {'Authorization': f'Bearer {customer_token}'}
+        self.manager = {'Authorization': f'Bearer {manager_token}'}
+        self.voice = {'Authorization': f'Api-Key {api_key}'}
+
+    def call(self, name, method, path, payload=None, headers=None, expected=(200,)):
+        result = self.transport.request(method, path, payload, headers)
+        self.recorder.add(name, result, expected)
+        return result
+
+    def iteration(self):
+        self.call('categories.list', 'GET', '/api/categories/')
+        menu = self.call('menu_items.list', 'GET', '/api/menu-items/').data or []
+        if not menu:
+            return
+        picks = self.rng.sample(menu, min(2, len(menu)))
+
+        for item in picks:
+            detail = self.call('menu_items.retrieve', 'GET', f"/api/menu-items/{item['id']}/").data or {}
+            options = [
+                group['choices'][0]['id']
+                for group in detail.get('option_groups', [])
+                if group['choices'] and group['min_selection'] > 0
+            ]
+            self.call('cart.add', 'POST', '/api/cart/items/', {
+                'menuitem_id': item['id'], 'quantity': self.rng.randint(1, 3), 'selected_options': options,
+            }, self.customer, expected=(200, 201))
+
+        self.call('cart.list', 'GET', '/api/cart/items/', headers=self.customer)
+        self.call('orders.create', 'POST', '/api/orders/', {}, self.customer, expected=(201,))
+        self.call('direct_order.create', 'POST', '/api/direct-order/', {
+            'items': [{'menuitem_id': item['id'], 'quantity': 1} for item in picks],
+            'customer_name': 'Load Test',
+            'customer_phone': f'+4070{self.rng.randint(0, 9999999):07d}',
+            'delivery_address': f'Strada Benchmark {self.rng.randint(1, 200)}, Bucuresti',
+        }, self.voice, expected=(201,))
+        self.call('orders.list_manager', 'GET', '/api/orders/', headers=self.manager)
+
+
+def seed_database(customers, seed):
+    """Menu with option groups, customers, a manager and an API key. Returns (customer tokens, manager token, key)."""
+    from decimal import Decimal
+    from django.contrib.auth.models import Group, User
+    from django.core.management import call_command
+    from rest_framework_api_key.models import APIKey
+    from restaurant.models import Category, MenuItem, OptionChoice, OptionGroup
+    from restaurant.serializers import ClaimsTokenObtainPairSerializer
+
+    rng = random.Random(seed)
+    call_command('migrate', verbosity=0, skip_checks=True)
+
+    categories = Category.objects.bulk_create(Category(slug=f'category-{i}', title=f'Category {i}') for i in range(6))
+    items = MenuItem.objects.bulk_create(
+        MenuItem(title=f'Dish {i}', price=Decimal(rng.randint(1500, 6000)) / 100, category=rng.choice(categories))
+        for i in range(60)
+    )
+    sides = MenuItem.objects.bulk_create(
+        MenuItem(title=f'Side {i}', price=Decimal('5.00'), category=categories[0], is_standalone_item=False)
+        for i in range(8)
+    )
+    groups = OptionGroup.objects.bulk_create(OptionGroup(name='Side', menu_item=item) for item in items[::2])
+    OptionChoice.objects.bulk_create(
+        OptionChoice(group=group, item=side, price_adjustment=Decimal('2.50'))
+        for group in groups for side in rng.sample(sides, 3)
+    )
+
+    def token(user):
+        return str(ClaimsTokenObtainPairSerializer.get_token(user).access_token)
+
+    manager = User.objects.create_user('load-manager', password='load')
+    manager.groups.add(Group.objects.get_or_create(name='Manager')[0])
+    customer_tokens = [token(User.objects.create_user(f'load-customer-{i}', password='load')) for i in range(customers)]
+    _, api_key = APIKey.objects.create_key(name='load-test')
+    return customer_tokens, token(manager), api_key
+
+
+def login(transport, credentials):
+    username, _, password = credentials.partition(':')
+    result = transport.request('POST', '/api/auth/jwt/create/', {'username': username, 'password': password})
+    if result.status != 200:
+        sys.exit(f"Login failed for {username!r} ({result.status}).")
+    return result.data['access']
+
+
+def compare(report, baseline_path, max_regression):
+    """Regressions against a previous report: p95 latency or queries per request up by more than max_regression."""
+    baseline = json.loads(Path(baseline_path).read_text())['endpoints']
+    problems = []
+    for name, current in report['endpoints'].items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        for metric in ('p95_ms', 'queries_per_request'):
+            old, new = previous.get(metric), current.get(metric)
+            if old and new and new > old * (1 + max_regression):
+                problems.append(f"{name}: {metric} {old} -> {new}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=20, help="Sessions per virtual user.")
+    parser.add_argument('--concurrency', type=int, default=4, help="Virtual users (threads).")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--base-url', help="Run against this server instead of the in-process test client.")
+    parser.add_argument('--customer', action='append', default=[], help="username:password (live mode, repeatable).")
+    parser.add_argument('--manager', help="username:password (live mode).")
+    parser.add_argument('--api-key', help="Voice-order API key (live mode).")
+    parser.add_argument('--output', help="Write the JSON report here as well as to stdout.")
+    parser.add_argument('--compare', help="Previous JSON report to check for regressions.")
+    parser.add_argument('--max-regression', type=float, default=0.2, help="Allowed relative increase (default 20%%).")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.base_url:
+            if not (args.customer and args.manager and args.api_key):
+                parser.error("--base-url needs --customer, --manager and --api-key.")
+            transport = HttpTransport(args.base_url)
+            customer_tokens = [login(transport, credentials) for credentials in args.customer]
+            manager_token, api_key = login(transport, args.manager), args.api_key
+        else:
+            setup_django(
+                str(Path(tmp) / 'load.sqlite3'), DEBUG=False, ALLOWED_HOSTS=['localhost'],
+                TOKEN_BUCKET_RATES={}, # Virtual users check out far faster than the per-user limit
+            )
+            transport = TestClientTransport()
+            customer_tokens, manager_token, api_key = seed_database(args.concurrency, args.seed)
+
+        recorder = Recorder()
+
+        def virtual_user(index):
+            rng = random.Random(args.seed * 1000 + index)
+            session = Session(
+                transport, recorder, rng, customer_tokens[index % len(customer_tokens)], manager_token, api_key,
+            )
+            for _ in range(args.iterations):
+                session.iteration()
+
+        threads = [threading.Thread(target=virtual_user, args=(index,)) for index in range(args.concurrency)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall_time = time.perf_counter() - started
+
+    report = {
+        'revision': git_revision(),
+        'target': args.base_url or 'test-client',
+        'concurrency': args.concurrency,
+        'iterations': args.iterations,
+        'seed': args.seed,
+        'duration_s': round(wall_time, 2),
+        **recorder.report(wall_time),
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text + '\n')
+
+    if args.compare:
+        problems = compare(report, args.compare, args.max_regression)
+        for problem in problems:
+            print(f"REGRESSION {problem}", file=sys.stderr)
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
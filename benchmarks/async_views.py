@@ -0,0 +1,190 @@
+"""
+Sync vs async read endpoints under concurrent load on ASGI.
+
+    python benchmarks/async_views.py --requests 400 --concurrency 50 --output async.json
+
+Drives Django's ASGI application directly (no server; network I/O is the
+ASGI server's job either way) against a seeded temporary SQLite database.
+For each endpoint pair, the same number of GETs is sent with --concurrency
+in flight: once to the sync DRF view, once to the async view in
+restaurant/async_views.py with the catalogue cache off, and once with it on.
+Reported per endpoint and mode: throughput, p50/p95 latency, the peak
+number of live threads while the batch ran and the extra threads held per
+connection in flight.
+
+--slow-client simulates mobile connections: 'sender' trickles the request
+in over SLOW_CHUNKS messages, 'reader' drains every response message
+--slow-delay seconds late (the ASGI server's send() blocking on a full
+socket). Threads per connection then shows which views keep a thread busy
+while the client, not the database, is the bottleneck.
+
+    python benchmarks/async_views.py --slow-client reader --slow-delay 0.2
+"""
+import argparse
+import asyncio
+import json
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from common import git_revision, percentile, setup_django
+
+SLOW_CHUNKS = 5 # Request body messages sent by a --slow-client sender
+
+
+def seed():
+    """The load-test menu plus one cart line and one order for the first customer. Returns (token, order)."""
+    from decimal import Decimal
+    from django.contrib.auth.models import User
+    from restaurant.models import Cart, MenuItem, Order
+    from api_load import seed_database
+
+    customer_tokens, _, _ = seed_database(customers=1, seed=1)
+    customer = User.objects.get(username='load-customer-0')
+    for item in MenuItem.objects.filter(is_standalone_item=True)[:3]:
+        Cart.objects.create(user=customer, menuitem=item, quantity=1, unit_price=item.price, price=item.price)
+    order = Order.objects.create(user=customer, total=Decimal('42.00'))
+    return customer_tokens[0], order
+
+
+class ASGIClient:
+    """Minimal ASGI HTTP driver: one GET per call, returns the status code. slow/delay: see --slow-client."""
+
+    def __init__(self, application, slow=None, delay=0.0):
+        self.application = application
+        self.slow = slow
+        self.delay = delay
+
+    async def get(self, path, headers):
+        path, _, query = path.partition('?')
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': path, 'raw_path': path.encode(), 'query_string': query.encode(), 'root_path': '',
+            'headers': [(b'host', b'localhost')] + [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+            'client': ('127.0.0.1', 50000), 'server': ('localhost', 80),
+        }
+        disconnected = asyncio.Event()
+        chunks = SLOW_CHUNKS if self.slow == 'sender' else 1
+        sent = []
+
+        async def receive():
+            if len(sent) < chunks:
+                if self.slow == 'sender':
+                    await asyncio.sleep(self.delay)
+                sent.append(True)
+                return {'type': 'http.request', 'body': b'', 'more_body': len(sent) < chunks}
+            await disconnected.wait() # The handler listens for a disconnect while the view runs
+            return {'type': 'http.disconnect'}
+
+        status = []
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+            if self.slow == 'reader':
+                await asyncio.sleep(self.delay)
+
+        await self.application(scope, receive, send)
+        disconnected.set()
+        return status[0]
+
+
+async def run_batch(client, path, headers, total, concurrency):
+    """total GETs with concurrency in flight. Returns (latencies in ms, errors, wall seconds, peak threads, idle threads)."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], []
+    idle = threading.active_count()
+    peak = [idle]
+    done = asyncio.Event()
+
+    async def sample_threads():
+        while not done.is_set():
+            peak[0] = max(peak[0], threading.active_count())
+            await asyncio.sleep(0.001)
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            status = await client.get(path, headers)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if status != 200:
+                errors.append(status)
+
+    sampler = asyncio.create_task(sample_threads())
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    wall = time.perf_counter() - started
+    done.set()
+    await sampler
+    return sorted(latencies), errors, wall, peak[0], idle
+
+
+async def benchmark(args):
+    from django.conf import settings
+    from django.core.asgi import get_asgi_application
+    from django.core.cache import cache
+    from restaurant.models import MenuItem
+
+    token, order = await asyncio.to_thread(seed)
+    item = await MenuItem.objects.filter(option_groups__isnull=False).afirst()
+    customer = {'Authorization': f'Bearer {token}'}
+    pairs = {
+        'categories.list': ('/api/categories/', '/api/async/categories/', {}),
+        'menu_items.list': ('/api/menu-items/', '/api/async/menu-items/', {}),
+        'menu_items.retrieve': (f'/api/menu-items/{item.pk}/', f'/api/async/menu-items/{item.pk}/', {}),
+        'cart.list': ('/api/cart/items/', '/api/async/cart/items/', customer),
+        'orders.status': (f'/api/orders/{order.pk}/', f'/api/async/orders/{order.order_code}/status/', customer),
+    }
+
+    client = ASGIClient(get_asgi_application(), args.slow_client, args.slow_delay)
+    endpoints = {}
+    for name, (sync_path, async_path, headers) in pairs.items():
+        endpoints[name] = {}
+        for mode, path, ttl in (('sync', sync_path, 0), ('async', async_path, 0), ('async_cached', async_path, 60)):
+            settings.ASYNC_CATALOGUE_CACHE_TTL = ttl
+            await cache.aclear()
+            await run_batch(client, path, headers, min(args.requests, args.concurrency), args.concurrency) # Warm-up
+            latencies, errors, wall, peak, idle = await run_batch(client, path, headers, args.requests, args.concurrency)
+            if errors:
+                sys.exit(f"{mode} {path}: non-200 responses {sorted(set(errors))}")
+            endpoints[name][mode] = {
+                'throughput_rps': round(len(latencies) / wall, 1),
+                'p50_ms': round(percentile(latencies, 0.50), 2),
+                'p95_ms': round(percentile(latencies, 0.95), 2),
+                'peak_threads': peak,
+                'threads_per_connection': round((peak - idle) / min(args.requests, args.concurrency), 2),
+            }
+    return endpoints
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=400, help="Requests per endpoint and mode.")
+    parser.add_argument('--concurrency', type=int, default=50, help="Requests in flight.")
+    parser.add_argument('--slow-client', choices=['sender', 'reader'], help="Simulate slow clients (see above).")
+    parser.add_argument('--slow-delay', type=float, default=0.05, help="Seconds per message for --slow-client.")
+    parser.add_argument('--output', help="Write the JSON report here as well as to stdout.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_django(str(Path(tmp) / 'async.sqlite3'), DEBUG=False, ALLOWED_HOSTS=['localhost'])
+        endpoints = asyncio.run(benchmark(args))
+
+    report = {
+        'revision': git_revision(),
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'slow_client': args.slow_client,
+        'slow_delay': args.slow_delay if args.slow_client else None,
+        'endpoints': endpoints,
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
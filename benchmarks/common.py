@@ -0,0 +1,46 @@
+"""Shared setup for the standalone benchmark scripts."""
+import math
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def setup_django(db_path=None, **overrides):
+    """
+    Configures Django from the project settings, optionally pointed at another
+    SQLite file (every alias) and with settings overridden, then calls django.setup().
+    """
+    sys.path.insert(0, str(ROOT))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'socului_backend.settings')
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    os.environ.setdefault('SENDGRID_API_KEY', 'benchmark')
+    from socului_backend import settings as project_settings
+
+    if db_path:
+        for alias in project_settings.DATABASES.values():
+            alias['NAME'] = db_path
+    for name, value in overrides.items():
+        setattr(project_settings, name, value)
+
+    import django
+    django.setup()
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[index]
@@ -0,0 +1,128 @@
+"""
+Concurrent checkout/menu-read throughput on SQLite, stock vs tuned settings.
+
+    python benchmarks/db_concurrency.py [--seconds 5] [--writers 4] [--readers 8]
+
+Each configuration runs in its own subprocess against a fresh temporary
+database: 'stock' is a single default alias with Django's defaults, 'tuned'
+is the project configuration (read alias + router, WAL and the pragmas in
+SQLITE_PRAGMAS, IMMEDIATE transactions). Writers place orders with items
+inside a transaction, as checkout does; readers list the menu and recent
+orders. Prints one JSON line per configuration.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from decimal import Decimal
+
+from common import setup_django
+
+
+def configure(mode, db_path):
+    if mode == 'stock':
+        setup_django(
+            DATABASES={'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': db_path}},
+            DATABASE_ROUTERS=[],
+            SQLITE_PRAGMAS={},
+        )
+    else:
+        setup_django(db_path)
+
+
+def seed():
+    from django.core.management import call_command
+    from restaurant.models import Category, MenuItem
+
+    call_command('migrate', verbosity=0, skip_checks=True)
+    category = Category.objects.create(slug='bench', title='Bench')
+    MenuItem.objects.bulk_create(
+        MenuItem(title=f'Item {i}', price=Decimal('10.00') + i, category=category) for i in range(200)
+    )
+
+
+def run_workload(seconds, writers, readers):
+    from django.db import OperationalError, close_old_connections, transaction
+    from restaurant.models import MenuItem, Order, OrderItem
+
+    items = list(MenuItem.objects.values_list('pk', 'price')[:20])
+    counts = {'checkouts': 0, 'reads': 0, 'locked_errors': 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def bump(key):
+        with lock:
+            counts[key] += 1
+
+    def writer():
+        while time.monotonic() < deadline:
+            try:
+                with transaction.atomic():
+                    order = Order.objects.create(total=Decimal('0.00'))
+                    OrderItem.objects.bulk_create(
+                        OrderItem(order=order, menuitem_id=pk, quantity=1, price=price)
+                        for pk, price in items[:3]
+                    )
+                    order.total = sum(price for _, price in items[:3])
+                    order.save(update_fields=['total'])
+                bump('checkouts')
+            except OperationalError:
+                bump('locked_errors')
+        close_old_connections()
+
+    def reader():
+        while time.monotonic() < deadline:
+            try:
+                list(MenuItem.objects.select_related('category').order_by('pk')[:50])
+                list(Order.objects.order_by('-pk')[:20])
+                bump('reads')
+            except OperationalError:
+                bump('locked_errors')
+        close_old_connections()
+
+    threads = [threading.Thread(target=writer) for _ in range(writers)] + [threading.Thread(target=reader) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {
+        **counts,
+        'checkouts_per_s': round(counts['checkouts'] / seconds, 1),
+        'reads_per_s': round(counts['reads'] / seconds, 1),
+    }
+
+
+def child(args):
+    configure(args.mode, args.db)
+    seed()
+    result = run_workload(args.seconds, args.writers, args.readers)
+    print(json.dumps({'mode': args.mode, 'writers': args.writers, 'readers': args.readers, **result}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--mode', choices=['stock', 'tuned'], help=argparse.SUPPRESS)
+    parser.add_argument('--db', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        return child(args)
+
+    for mode in ('stock', 'tuned'):
+        with tempfile.TemporaryDirectory() as tmp:
+            subprocess.run(
+                [sys.executable, __file__, '--mode', mode, '--db', os.path.join(tmp, 'bench.sqlite3'),
+                 '--seconds', str(args.seconds), '--writers', str(args.writers), '--readers', str(args.readers)],
+                check=True,
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+Worker startup time: how long a fresh process takes to become useful.
+
+    python benchmarks/startup.py --runs 10 --output startup.json
+
+Every run is a new interpreter that imports Django and the project
+(django.setup() plus the URLconf, as the first request or a WSGI server
+would), then serves two requests through the test client against a
+migrated temporary SQLite database. Reported per run, then as medians:
+
+    import_ms            django.setup() and URLconf import
+    first_request_ms     first request (lazy imports, connection setup, caches)
+    second_request_ms    the same request again, for comparison
+    process_ms           interpreter start to exit, measured by the parent
+    startup_connections  database connections opened before the first request (should be 0)
+    optional_modules     heavy optional packages already imported before the first request
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from common import git_revision
+
+OPTIONAL_MODULES = ('geopy', 'requests', 'twilio', 'sendgrid', 'orjson', 'brotli', 'PIL')
+
+
+def child(db_path, path, migrate):
+    from django.db.backends.signals import connection_created
+
+    connections_opened = []
+    connection_created.connect(lambda sender, connection, **kwargs: connections_opened.append(connection.alias))
+
+    from common import setup_django
+    started = time.perf_counter()
+    setup_django(db_path, DEBUG=False, ALLOWED_HOSTS=['localhost'])
+    from django.conf import settings
+    from django.urls import get_resolver
+    get_resolver(settings.ROOT_URLCONF).url_patterns # Forces the URLconf (and views) import
+    import_seconds = time.perf_counter() - started
+
+    if migrate:
+        from django.core.management import call_command
+        call_command('migrate', verbosity=0)
+        return None
+
+    startup_connections = len(connections_opened)
+    loaded = sorted(name for name in OPTIONAL_MODULES if name in sys.modules)
+
+    from django.test import Client
+    client = Client(SERVER_NAME='localhost')
+    timings = []
+    for _ in range(2):
+        started = time.perf_counter()
+        response = client.get(path)
+        timings.append(time.perf_counter() - started)
+        if response.status_code != 200:
+            sys.exit(f"GET {path} returned {response.status_code}")
+
+    return {
+        'import_ms': round(import_seconds * 1000, 1),
+        'first_request_ms': round(timings[0] * 1000, 1),
+        'second_request_ms': round(timings[1] * 1000, 1),
+        'startup_connections': startup_connections,
+        'optional_modules': loaded,
+    }
+
+
+def run_child(db_path, path, migrate=False):
+    command = [sys.executable, __file__, '--child', '--db', db_path, '--path', path] + (['--migrate'] if migrate else [])
+    started = time.perf_counter()
+    result = subprocess.run(command, capture_output=True, text=True, cwd=Path(__file__).parent)
+    elapsed = time.perf_counter() - started
+    if result.returncode != 0:
+        sys.exit(f"Startup run failed:\n{result.stderr}")
+    if migrate:
+        return None
+    measurement = json.loads(result.stdout.strip().splitlines()[-1])
+    measurement['process_ms'] = round(elapsed * 1000, 1)
+    return measurement
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help="Fresh processes to start.")
+    parser.add_argument('--path', default='/api/categories/', help="Endpoint for the first and second request.")
+    parser.add_argument('--output', help="Write the JSON report here as well as to stdout.")
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--migrate', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--db', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        measurement = child(args.db, args.path, args.migrate)
+        if measurement:
+            print(json.dumps(measurement))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = str(Path(tmp) / 'startup.sqlite3')
+        run_child(db_path, args.path, migrate=True)
+        runs = [run_child(db_path, args.path) for _ in range(args.runs)]
+
+    metrics = ('import_ms', 'first_request_ms', 'second_request_ms', 'process_ms')
+    report = {
+        'revision': git_revision(),
+        'path': args.path,
+        'runs': len(runs),
+        'median': {name: round(statistics.median(run[name] for run in runs), 1) for name in metrics},
+        'startup_connections': max(run['startup_connections'] for run in runs),
+        'optional_modules': runs[-1]['optional_modules'],
+        'samples': runs,
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        Path(args.output).write_text(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,7 @@
 # restaurant/admin.py
 from django.contrib import admin
 from django.utils.html import format_html # Import format_html
-from .models import Cart, Category, MenuItem, Order, OrderItem, StoreLocation, UserAddress, UserProfile, OptionGroup, OptionChoice # Import new models
+from .models import Cart, Category, MenuItem, Order, OrderItem, StoreLocation, UserAddress, UserProfile, OptionGroup, OptionChoice, WebhookOutbox, QueuedEmail # Import new models
 
 # Register your models here.
 
@@ -66,6 +66,19 @@ class UserAddressAdmin(admin.ModelAdmin):
     # Coordinates are set by the system, so they should be read-only
     readonly_fields = ('latitude', 'longitude')
 
+@admin.register(WebhookOutbox)
+class WebhookOutboxAdmin(admin.ModelAdmin):
+    list_display = ('id', 'order', 'status', 'attempts', 'next_attempt_at', 'created_at', 'delivered_at')
+    list_filter = ('status',)
+    readonly_fields = ('created_at', 'delivered_at')
+
+@admin.register(QueuedEmail)
+class QueuedEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'to', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('subject',)
+    readonly_fields = ('created_at', 'sent_at')
+
 # Basic registration for other models
 admin.site.register(Cart)
 admin.site.register(Order)
@@ -0,0 +1,89 @@
+import hashlib
+import hmac
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from rest_framework_api_key.models import APIKey
+
+VERSION_CACHE_KEY = 'api_keys:version'
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _shared_version():
+    return cache.get(VERSION_CACHE_KEY, 0)
+
+
+class VerifiedKeyCache:
+    """
+    In-process LRU of API keys that passed the (deliberately slow) password
+    hasher check. Entries are keyed by an HMAC-SHA256 of the presented key,
+    so plaintext keys are never held, and live for API_KEY_CACHE_TTL seconds,
+    until the key's own expiry_date, or until any APIKey row changes (shared
+    version in the Django cache, compared on every lookup). Failed checks are
+    never cached.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._secret = None
+
+    def digest(self, key):
+        if self._secret is None:
+            self._secret = hashlib.sha256(b'api-key-cache:' + settings.SECRET_KEY.encode('utf-8')).digest()
+        return hmac.new(self._secret, key.encode('utf-8'), hashlib.sha256).digest()
+
+    def is_valid(self, key, model=APIKey):
+        digest = (model._meta.label, self.digest(key))
+        version = _shared_version()
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                cached_until, expires_at, cached_version = entry
+                if now < cached_until and cached_version == version and (expires_at is None or timezone.now() < expires_at):
+                    self._entries.move_to_end(digest)
+                    return True
+                del self._entries[digest]
+
+        try:
+            api_key = model.objects.get_from_key(key) # Runs the password hasher
+        except model.DoesNotExist:
+            return False
+        if api_key.has_expired:
+            return False
+
+        with self._lock:
+            self._entries[digest] = (now + _setting('API_KEY_CACHE_TTL', 300), api_key.expiry_date, version)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > _setting('API_KEY_CACHE_SIZE', 256):
+                self._entries.popitem(last=False)
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+verified_keys = VerifiedKeyCache()
+
+
+def _bump_shared_version():
+    try:
+        cache.incr(VERSION_CACHE_KEY)
+    except ValueError: # Key missing (first change or evicted)
+        cache.set(VERSION_CACHE_KEY, time.time_ns(), None)
+
+
+def invalidate_verified_keys():
+    """Forgets verified keys in this process now and in the others once the change commits."""
+    verified_keys.clear()
+    transaction.on_commit(_bump_shared_version)
@@ -7,3 +7,9 @@ class RestaurantConfig(AppConfig):
 
     def ready(self):
         import restaurant.signals # noqa
+        from django.db.backends.signals import connection_created
+        from django.core import checks
+        from .db import configure_sqlite
+        from .throttling import check_token_bucket_cache
+        connection_created.connect(configure_sqlite, dispatch_uid='restaurant.configure_sqlite')
+        checks.register(check_token_bucket_cache, checks.Tags.caches)
@@ -0,0 +1,166 @@
+"""
+Async versions of the hottest read endpoints, for ASGI deployments.
+
+A sync view holds a worker thread for the whole request; these views only
+use a thread while a query or cache call runs (Django's async ORM and cache
+APIs hand the call to the request's executor thread), so one ASGI worker
+can keep many more slow mobile connections open. Responses match the sync
+endpoints; the catalogue payloads are also cached under a version that
+bumps whenever the menu changes.
+"""
+import hashlib
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.exceptions import FieldError, ValidationError
+from django.http import HttpResponse
+from django.views.decorators.http import require_GET
+from rest_framework import exceptions
+from rest_framework.settings import api_settings
+from .catalogue import acatalogue_version
+from .eta import estimate_eta
+from .models import Category, MenuItem, Order
+from .roles import DELIVERY_CREW, MANAGER, aget_roles
+from .fast_serializers import CATEGORY_VALUES, FastJSONRenderer, categories_from_values, menu_item_values, menu_items_from_values
+from .serializers import CartItemSerializer, MenuItemDetailSerializer
+from .views import cart_queryset, filter_menu_items
+
+_renderer = FastJSONRenderer()
+
+
+def json_response(data, status=200):
+    return HttpResponse(_renderer.render(data), status=status, content_type='application/json')
+
+
+async def cached_catalogue(request, build):
+    """
+    The rendered response body for this URL and host (image URLs are
+    absolute), from the cache when the catalogue has not changed since it was
+    stored; otherwise build() returns (data, status) and 200s are cached for
+    ASYNC_CATALOGUE_CACHE_TTL seconds.
+    """
+    ttl = getattr(settings, 'ASYNC_CATALOGUE_CACHE_TTL', 60)
+    if not ttl:
+        data, status = await build()
+        return json_response(data, status)
+
+    version = await acatalogue_version()
+    digest = hashlib.sha1(f'{request.get_host()}{request.get_full_path()}'.encode()).hexdigest() # Bounded key length for memcached
+    key = f'catalogue:{version}:{digest}'
+    body = await cache.aget(key)
+    if body is None:
+        data, status = await build()
+        body = _renderer.render(data)
+        if status != 200:
+            return HttpResponse(body, status=status, content_type='application/json')
+        await cache.aset(key, body, ttl)
+    return HttpResponse(body, content_type='application/json')
+
+
+async def authenticate(request):
+    """
+    The user from the DRF authentication classes (JWT), or AnonymousUser.
+    Token checks run in the request's executor thread like any other ORM call.
+    """
+    for authentication_class in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+        result = await sync_to_async(authentication_class().authenticate)(request)
+        if result is not None:
+            return result[0]
+    return AnonymousUser()
+
+
+def not_authenticated(request, detail):
+    """
+    DRF's response for failed or missing authentication: a 401 with the first
+    authentication class's WWW-Authenticate challenge, or a 403 when that
+    class has none (as APIView.permission_denied does).
+    """
+    classes = api_settings.DEFAULT_AUTHENTICATION_CLASSES
+    challenge = classes[0]().authenticate_header(request) if classes else None
+    response = json_response({'detail': detail}, status=401 if challenge else 403)
+    if challenge:
+        response['WWW-Authenticate'] = challenge
+    return response
+
+
+async def authenticated_user(request):
+    """(user, None), or (None, error response) in the shape DRF returns for 401s."""
+    try:
+        user = await authenticate(request)
+    except exceptions.AuthenticationFailed as exc:
+        return None, not_authenticated(request, exc.detail)
+    if not user.is_authenticated:
+        return None, not_authenticated(request, exceptions.NotAuthenticated.default_detail)
+    return user, None
+
+
+@require_GET
+async def category_list(request):
+    """Async counterpart of GET categories/. Publicly accessible."""
+    async def build():
+        rows = [row async for row in Category.objects.values(*CATEGORY_VALUES)]
+        return categories_from_values(rows, request), 200
+    return await cached_catalogue(request, build)
+
+
+@require_GET
+async def menu_item_list(request):
+    """Async counterpart of GET menu-items/, with the same filters. Publicly accessible."""
+    async def build():
+        try:
+            queryset = filter_menu_items(MenuItem.objects.all(), request.GET)
+            rows = [row async for row in queryset.values(*menu_item_values())]
+        except (FieldError, ValidationError, ValueError): # Unknown ordering field or malformed to_price
+            return {'detail': 'Invalid filter.'}, 400
+        return menu_items_from_values(rows, request), 200
+    return await cached_catalogue(request, build)
+
+
+@require_GET
+async def menu_item_detail(request, pk):
+    """Async counterpart of GET menu-items/<pk>/ with option groups. Publicly accessible."""
+    async def build():
+        queryset = MenuItem.objects.select_related('category').prefetch_related('option_groups__choices__item')
+        items = [item async for item in queryset.filter(pk=pk)]
+        if not items:
+            return {'detail': 'No MenuItem matches the given query.'}, 404
+        return MenuItemDetailSerializer(items[0], context={'request': request}).data, 200
+    return await cached_catalogue(request, build)
+
+
+@require_GET
+async def cart_list(request):
+    """Async counterpart of GET cart/items/. Authenticated users see their own cart."""
+    user, error = await authenticated_user(request)
+    if error:
+        return error
+    cart_items = [item async for item in cart_queryset(user)]
+    return json_response(CartItemSerializer(cart_items, many=True, context={'request': request}).data)
+
+
+@require_GET
+async def order_status(request, order_code):
+    """
+    Status and ETA of one order by its order_code: the light endpoint for
+    apps polling an order in progress. Owner, managers and delivery crew.
+    """
+    user, error = await authenticated_user(request)
+    if error:
+        return error
+    order = await Order.objects.select_related('store_location', 'delivery_address_link').filter(order_code=order_code).afirst()
+    if order is None:
+        return json_response({'error': 'Order not found.'}, status=404)
+    if not (order.user_id == user.pk or user.is_superuser or not (await aget_roles(user)).isdisjoint({MANAGER, DELIVERY_CREW})):
+        return json_response({'error': 'You do not have permission to view this order.'}, status=403)
+
+    eta = await sync_to_async(estimate_eta)(order) # Store statistics may need a query on first use
+    return json_response({
+        'order_code': order.order_code,
+        'status': order.status,
+        'status_display': order.get_status_display(),
+        'created_at': order.created_at,
+        'delivering_at': order.delivering_at,
+        'delivered_at': order.delivered_at,
+        'eta': eta,
+    })
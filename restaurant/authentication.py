@@ -0,0 +1,93 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+from .models import ClaimsUser, UserProfile
+from .roles import get_roles
+
+# Claims added to tokens when JWT_ROLE_CLAIMS is on
+ROLES_CLAIM = 'roles'
+STORE_CLAIM = 'store_id'
+SUPERUSER_CLAIM = 'is_superuser'
+STAFF_CLAIM = 'is_staff'
+ACTIVE_CLAIM = 'is_active'
+GENERATION_CLAIM = 'token_gen'
+
+_MISSING = -1 # Cached generation of a user without a profile (deleted): never matches a token
+
+
+def role_claims_enabled():
+    return getattr(settings, 'JWT_ROLE_CLAIMS', False)
+
+
+def _generation_key(user_id):
+    return f'token_generation:{user_id}'
+
+
+def current_generation(user_id):
+    """The user's token generation, read from the cache (one query on a miss)."""
+    key = _generation_key(user_id)
+    generation = cache.get(key)
+    if generation is None:
+        generation = UserProfile.objects.filter(user_id=user_id).values_list('token_generation', flat=True).first()
+        generation = _MISSING if generation is None else generation
+        cache.set(key, generation, getattr(settings, 'TOKEN_GENERATION_CACHE_TTL', 300))
+    return generation
+
+
+def bump_token_generation(user_ids):
+    """Invalidates the role claims of every access token issued so far to these users."""
+    user_ids = list(user_ids)
+    if not user_ids or not role_claims_enabled(): # Without claims there is nothing to invalidate
+        return
+    UserProfile.objects.filter(user_id__in=user_ids).update(token_generation=F('token_generation') + 1)
+    forget_token_generation(user_ids)
+
+
+def forget_token_generation(user_ids):
+    keys = [_generation_key(user_id) for user_id in user_ids]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def set_role_claims(token, user):
+    """Writes the user's roles, home store and generation into a token."""
+    profile = UserProfile.objects.filter(user=user).values_list('store_location_id', 'token_generation').first()
+    store_id, generation = profile or (None, _MISSING)
+    token[ROLES_CLAIM] = sorted(get_roles(user))
+    token[STORE_CLAIM] = store_id
+    token[SUPERUSER_CLAIM] = user.is_superuser
+    token[STAFF_CLAIM] = user.is_staff
+    token[ACTIVE_CLAIM] = user.is_active
+    token[GENERATION_CLAIM] = generation
+    return token
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that, for tokens carrying role claims, builds the user
+    from the claims instead of loading it. The only lookup is the cached
+    token generation; the user row is fetched lazily if a view reads any
+    other field. Tokens without claims (or with JWT_ROLE_CLAIMS off) are
+    handled exactly like JWTAuthentication does.
+    """
+
+    def get_user(self, validated_token):
+        if not role_claims_enabled() or GENERATION_CLAIM not in validated_token or ACTIVE_CLAIM not in validated_token:
+            return super().get_user(validated_token)
+
+        user_id = ClaimsUser._meta.pk.to_python(validated_token[api_settings.USER_ID_CLAIM]) # simplejwt stores it as a string
+        if validated_token[GENERATION_CLAIM] != current_generation(user_id):
+            raise AuthenticationFailed("Your roles have changed; refresh your token.", code='token_stale')
+        if not validated_token[ACTIVE_CLAIM]: # Deactivation also bumps the generation; this covers tokens issued while inactive
+            raise AuthenticationFailed("User is inactive", code='user_inactive')
+        return ClaimsUser.from_claims(
+            user_id,
+            roles=validated_token[ROLES_CLAIM],
+            store_id=validated_token[STORE_CLAIM],
+            is_superuser=validated_token[SUPERUSER_CLAIM],
+            is_staff=validated_token[STAFF_CLAIM],
+            is_active=validated_token[ACTIVE_CLAIM],
+        )
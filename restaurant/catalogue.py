@@ -0,0 +1,26 @@
+import time
+from django.core.cache import cache
+from django.db import transaction
+
+# Part of every cached catalogue response key (see async_views.py and compression.py); bumped on any menu change
+VERSION_CACHE_KEY = 'catalogue:version'
+
+
+def _bump_version():
+    try:
+        cache.incr(VERSION_CACHE_KEY)
+    except ValueError: # Key missing (first change or evicted)
+        cache.set(VERSION_CACHE_KEY, time.time_ns(), None)
+
+
+def catalogue_version():
+    return cache.get(VERSION_CACHE_KEY, 0)
+
+
+async def acatalogue_version():
+    return await cache.aget(VERSION_CACHE_KEY, 0)
+
+
+def invalidate_catalogue():
+    """Makes every cached catalogue response stale once the surrounding transaction commits."""
+    transaction.on_commit(_bump_version)
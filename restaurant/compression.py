@@ -0,0 +1,176 @@
+"""
+Response compression with cached variants.
+
+CompressionMiddleware compresses text and JSON responses of at least
+COMPRESSION_MIN_SIZE bytes with Brotli (when the brotli package is
+installed) or gzip, whichever the client's Accept-Encoding prefers, and
+always adds Vary: Accept-Encoding. Responses of the routes in
+COMPRESSION_CACHED_ROUTES (the catalogue: identical bytes for everyone until
+the menu changes) are compressed once per encoding at the highest level and
+stored with their headers under the catalogue version, host, URL and Accept
+header, like the async catalogue cache; later requests that negotiate the
+same encoding get the stored variant before the view runs. The rest are
+compressed per request at a cheaper level. In async chains, bodies of
+COMPRESSION_THREAD_MIN_SIZE bytes or more are compressed in a worker thread
+instead of on the event loop.
+
+Paths under COMPRESSION_EXCLUDED_PATHS (the JWT and djoser endpoints) are
+never compressed: their responses carry tokens next to request-controlled
+input, which is what BREACH-style length attacks need.
+"""
+import gzip
+import hashlib
+import re
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from .catalogue import catalogue_version
+
+COMPRESSIBLE_TYPES = re.compile(r'^(text/|application/(json|javascript|xml)|image/svg\+xml)')
+
+# (level per request, level for cached variants)
+GZIP_LEVELS = (6, 9)
+BROTLI_QUALITIES = (5, 11)
+
+_brotli = None
+
+
+def _load_brotli():
+    global _brotli
+    if _brotli is None:
+        try:
+            import brotli
+        except ImportError:
+            brotli = False
+        _brotli = brotli
+    return _brotli
+
+
+def available_encodings():
+    return ('br', 'gzip') if _load_brotli() else ('gzip',)
+
+
+def negotiate(accept_encoding, encodings):
+    """The first of encodings (in server preference order) with the highest q-value the client accepts, or None."""
+    accepted = {}
+    for part in accept_encoding.split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name.strip() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    best, best_q = None, 0.0
+    for coding in encodings:
+        q = accepted.get(coding, accepted.get('*', 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compress(body, encoding, cached):
+    """body compressed with encoding, at the slow high ratio setting when the result is cached."""
+    if encoding == 'br':
+        return _load_brotli().compress(body, quality=BROTLI_QUALITIES[cached])
+    return gzip.compress(body, compresslevel=GZIP_LEVELS[cached], mtime=0) # mtime=0: identical bytes every time
+
+
+def variant_key(request, encoding):
+    """Cache key of a catalogue response variant; a menu change bumps the version and so retires it."""
+    digest = hashlib.sha1(f"{request.get_host()}{request.get_full_path()}|{request.headers.get('Accept', '')}".encode()).hexdigest()
+    return f'compressed:{encoding}:catalogue:{catalogue_version()}:{digest}'
+
+
+class CompressionMiddleware:
+    """Compresses eligible responses (see module docstring). Works in sync and async middleware chains."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.min_size = getattr(settings, 'COMPRESSION_MIN_SIZE', 1024)
+        self.thread_min_size = getattr(settings, 'COMPRESSION_THREAD_MIN_SIZE', 64 * 1024)
+        self.cached_routes = frozenset(getattr(settings, 'COMPRESSION_CACHED_ROUTES', ()))
+        self.excluded_paths = tuple(getattr(settings, 'COMPRESSION_EXCLUDED_PATHS', ()))
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        response = self.get_response(request)
+        encoding, key = self.plan(request, response)
+        if encoding:
+            self.apply(response, encoding, key)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        encoding, key = self.plan(request, response)
+        if encoding:
+            if key: # Cache round trip, through the request's executor thread like other cache calls
+                await sync_to_async(self.apply)(response, encoding, key)
+            elif len(response.content) >= self.thread_min_size: # CPU only: any thread will do
+                await sync_to_async(self.apply, thread_sensitive=False)(response, encoding, key)
+            else:
+                self.apply(response, encoding, key)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        """The stored variant of a cached route, instead of running the view; otherwise notes where to store it."""
+        match = request.resolver_match
+        if request.method not in ('GET', 'HEAD') or not match or match.url_name not in self.cached_routes:
+            return None
+        if request.path.startswith(self.excluded_paths):
+            return None
+        encoding = negotiate(request.headers.get('Accept-Encoding', ''), available_encodings())
+        if not encoding:
+            return None
+        request._compression_variant_key = key = variant_key(request, encoding) # Version read before the view runs
+        stored = cache.get(key)
+        if stored is None:
+            return None
+        headers, content = stored
+        return HttpResponse(content, headers=headers) # Already encoded: plan() leaves it alone
+
+    def plan(self, request, response):
+        """
+        (encoding, variant cache key or None) for this response, or (None,
+        None) to send it as is. Adds Vary when it could vary.
+        """
+        if response.streaming or response.has_header('Content-Encoding') or response.status_code != 200:
+            return None, None
+        if request.path.startswith(self.excluded_paths):
+            return None, None
+        if not COMPRESSIBLE_TYPES.match(response.get('Content-Type', '')):
+            return None, None
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if len(response.content) < self.min_size or 'no-transform' in response.get('Cache-Control', ''):
+            return None, None
+        encoding = negotiate(request.headers.get('Accept-Encoding', ''), available_encodings())
+        return encoding, getattr(request, '_compression_variant_key', None) # Same encoding as negotiated in process_view
+
+    def apply(self, response, encoding, key):
+        """Compresses response in place; with a variant key, at the cached level and stored with its headers."""
+        body = response.content
+        compressed = compress(body, encoding, cached=bool(key))
+        if len(compressed) >= len(body):
+            return
+        response.content = compressed
+        response.headers['Content-Length'] = str(len(compressed))
+        response.headers['Content-Encoding'] = encoding
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'): # The compressed bytes differ, so the validator can only be weak
+            response.headers['ETag'] = 'W/' + etag
+        if key:
+            cache.set(key, (dict(response.headers), compressed), getattr(settings, 'COMPRESSION_CACHE_TTL', 3600))
@@ -0,0 +1,90 @@
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+PRIMARY_DB = 'default'
+READ_DB = 'read'
+
+# Reads of these models may be served by the read alias (menu, categories, order listings and exports)
+READ_MODELS = frozenset({
+    'restaurant.category', 'restaurant.menuitem', 'restaurant.optiongroup', 'restaurant.optionchoice',
+    'restaurant.order', 'restaurant.orderitem',
+})
+
+# Set once anything is written; reads then stay on the primary until the request ends
+_pinned = ContextVar('db_pinned_to_primary', default=False)
+
+
+def pin_to_primary():
+    _pinned.set(True)
+
+
+def reset_pinning():
+    _pinned.set(False)
+
+
+class ReadWriteRouter:
+    """
+    Sends reads of READ_MODELS to the read alias and every write to the
+    primary. After the first write of a request (or inside a transaction on
+    the primary, e.g. select_for_update) reads go to the primary too, so a
+    request always sees its own writes.
+    """
+
+    def db_for_read(self, model, **hints):
+        if READ_DB not in settings.DATABASES or model._meta.label_lower not in READ_MODELS:
+            return PRIMARY_DB
+        if _pinned.get() or connections[PRIMARY_DB].in_atomic_block:
+            return PRIMARY_DB
+        return READ_DB
+
+    def db_for_write(self, model, **hints):
+        pin_to_primary()
+        return PRIMARY_DB
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True # Both aliases are the same data
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY_DB
+
+
+class ReadYourWritesMiddleware:
+    """Clears primary pinning at the start and end of every request (sync or async)."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        reset_pinning()
+        try:
+            return self.get_response(request)
+        finally:
+            reset_pinning()
+
+    async def __acall__(self, request):
+        reset_pinning()
+        try:
+            return await self.get_response(request)
+        finally:
+            reset_pinning()
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """connection_created hook: applies SQLITE_PRAGMAS, plus query_only on read aliases."""
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = dict(getattr(settings, 'SQLITE_PRAGMAS', {}))
+    if connection.alias != PRIMARY_DB:
+        pragmas['query_only'] = 1 # Guards against a write routed to the read alias by mistake
+    for name, value in pragmas.items():
+        # On the raw sqlite3 connection: not counted as request queries by execute wrappers
+        connection.connection.execute(f'PRAGMA {name} = {value}')
@@ -0,0 +1,137 @@
+from dataclasses import dataclass, field
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, Q
+from .geocoding import get_cached, normalize_address
+from .models import Order
+from .store_index import haversine_km
+from .tracking import tracker
+
+
+@dataclass
+class CourierState:
+    courier: User
+    load: int # Orders currently Pending/Delivering for this courier
+    position: tuple # Where the courier will be after the orders assigned so far
+
+
+@dataclass
+class Assignment:
+    order: Order
+    courier: User
+    distance_km: float | None # From the courier's previous stop (or the store) to this order
+
+
+@dataclass
+class DispatchPlan:
+    store: object
+    assignments: list = field(default_factory=list)
+    unassigned: list = field(default_factory=list)
+
+
+def get_pending_orders(store):
+    """Unassigned pending orders of the store, oldest first."""
+    return list(
+        Order.objects.filter(store_location=store, status=0, delivery_crew__isnull=True)
+        .select_related('delivery_address_link')
+        .order_by('created_at', 'pk')
+    )
+
+
+def get_available_couriers(store):
+    """Active delivery crew whose home store is this store, annotated with their current load (one query)."""
+    return list(
+        User.objects.filter(groups__name='Delivery crew', is_active=True, userprofile__store_location=store)
+        .annotate(active_orders=Count('delivery_crew_orders', filter=Q(delivery_crew_orders__status__in=[0, 1])))
+        .order_by('pk')
+    )
+
+
+def order_positions(orders):
+    """
+    (latitude, longitude) per order id: the linked UserAddress coordinates, or a
+    geocode-cache hit for the delivery address text (voice orders). Never calls a provider.
+    """
+    positions = {}
+    text_keys = {}
+    for order in orders:
+        address = order.delivery_address_link
+        if address and address.latitude is not None and address.longitude is not None:
+            positions[order.pk] = (float(address.latitude), float(address.longitude))
+        elif order.delivery_address:
+            text_keys[order.pk] = normalize_address(order.delivery_address)
+
+    cached = get_cached(text_keys.values()) if text_keys else {}
+    for order_id, key in text_keys.items():
+        latitude, longitude = cached.get(key, (None, None))
+        if latitude is not None and longitude is not None:
+            positions[order_id] = (float(latitude), float(longitude))
+    return positions
+
+
+def plan_dispatch(store, orders=None, couriers=None, max_orders_per_courier=None, load_penalty_km=None):
+    """
+    Greedy proximity/load assignment in one pass. Orders are taken oldest
+    first; each goes to the courier with the lowest cost, where cost is the
+    distance from the courier's last planned stop plus load_penalty_km for
+    every order the courier already carries. Couriers at
+    max_orders_per_courier are skipped.
+    """
+    orders = get_pending_orders(store) if orders is None else orders
+    couriers = get_available_couriers(store) if couriers is None else couriers
+    max_orders = max_orders_per_courier or getattr(settings, 'DISPATCH_MAX_ORDERS_PER_COURIER', 3)
+    penalty = load_penalty_km if load_penalty_km is not None else getattr(settings, 'DISPATCH_LOAD_PENALTY_KM', 2.0)
+
+    store_position = None
+    if store.latitude is not None and store.longitude is not None:
+        store_position = (float(store.latitude), float(store.longitude))
+    # Couriers reporting GPS start from where they are; the rest from the store
+    live = tracker.live_positions([courier.pk for courier in couriers])
+    states = [
+        CourierState(courier, getattr(courier, 'active_orders', 0), live.get(courier.pk, store_position))
+        for courier in couriers
+    ]
+    positions = order_positions(orders)
+
+    plan = DispatchPlan(store=store)
+    for order in orders:
+        destination = positions.get(order.pk)
+        best, best_cost, best_distance = None, None, None
+        for state in states:
+            if state.load >= max_orders:
+                continue
+            distance = None
+            if destination and state.position:
+                distance = haversine_km(*state.position, *destination)
+            # Unknown locations only compete on load
+            cost = (distance or 0.0) + penalty * state.load
+            if best is None or cost < best_cost:
+                best, best_cost, best_distance = state, cost, distance
+
+        if best is None:
+            plan.unassigned.append(order)
+            continue
+        plan.assignments.append(Assignment(order=order, courier=best.courier, distance_km=best_distance))
+        best.load += 1
+        if destination:
+            best.position = destination # Next order is measured from this drop-off
+    return plan
+
+
+def apply_plan(plan):
+    """
+    Writes the plan with a single bulk_update. Orders assigned by someone else
+    since planning are left alone. Returns the applied assignments.
+    """
+    with transaction.atomic():
+        still_open = set(
+            Order.objects.select_for_update()
+            .filter(pk__in=[a.order.pk for a in plan.assignments], delivery_crew__isnull=True, status=0)
+            .values_list('pk', flat=True)
+        )
+        applied = [a for a in plan.assignments if a.order.pk in still_open]
+        for assignment in applied:
+            assignment.order.delivery_crew = assignment.courier
+        Order.objects.bulk_update([a.order for a in applied], ['delivery_crew'])
+    return applied
@@ -0,0 +1,166 @@
+import base64
+import logging
+import smtplib
+import time
+from dataclasses import dataclass
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.utils import timezone
+from .models import QueuedEmail
+from .outbox import FAILED, claim_due, retry_delay
+
+logger = logging.getLogger(__name__)
+
+SENT = 1
+
+STATUS_FIELDS = ['attempts', 'last_error', 'status', 'next_attempt_at', 'sent_at']
+
+
+def _delivery_backend():
+    """The backend that actually sends queued mail (SMTP in production, console/file locally)."""
+    return getattr(settings, 'QUEUED_EMAIL_DELIVERY_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
+
+
+def _encode_attachment(attachment):
+    filename, content, mimetype = attachment
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    return [filename, base64.b64encode(content).decode('ascii'), mimetype]
+
+
+class QueuedEmailBackend(BaseEmailBackend):
+    """
+    EMAIL_BACKEND that only persists messages; no network I/O happens in the
+    request that sends them (e.g. Djoser's activation email on signup).
+    """
+
+    def send_messages(self, email_messages):
+        rows = []
+        for message in email_messages:
+            if not message.recipients():
+                continue
+            # MIMEBase attachments cannot be stored as JSON; only (filename, content, mimetype) ones are kept
+            attachments = [_encode_attachment(a) for a in message.attachments if isinstance(a, tuple)]
+            rows.append(QueuedEmail(
+                subject=message.subject,
+                body=message.body,
+                from_email=message.from_email or settings.DEFAULT_FROM_EMAIL,
+                to=list(message.to),
+                cc=list(message.cc),
+                bcc=list(message.bcc),
+                reply_to=list(message.reply_to),
+                headers=dict(message.extra_headers),
+                alternatives=[[content, mimetype] for content, mimetype in getattr(message, 'alternatives', [])],
+                attachments=attachments,
+            ))
+        QueuedEmail.objects.bulk_create(rows)
+        return len(rows)
+
+
+def build_message(queued, connection=None):
+    message = EmailMultiAlternatives(
+        subject=queued.subject,
+        body=queued.body,
+        from_email=queued.from_email,
+        to=queued.to,
+        cc=queued.cc,
+        bcc=queued.bcc,
+        reply_to=queued.reply_to,
+        headers=queued.headers,
+        connection=connection,
+    )
+    for content, mimetype in queued.alternatives:
+        message.attach_alternative(content, mimetype)
+    for filename, content, mimetype in queued.attachments:
+        message.attach(filename, base64.b64decode(content), mimetype)
+    return message
+
+
+@dataclass
+class SendResult:
+    sent: int = 0
+    retried: int = 0
+    failed: int = 0
+    elapsed: float = 0.0
+
+
+def is_permanent(error):
+    """Whether retrying cannot help: the server refused the message or every recipient with a 5xx reply."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return bool(error.recipients) and all(code >= 500 for code, _ in error.recipients.values())
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+
+def is_disconnect(error):
+    """Whether the session is gone (dropped socket, timeout, 421 closing), so the rest of the batch needs a new one."""
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return True
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code == 421
+    return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException) # Socket errors; SMTPException is an OSError too
+
+
+def send_queued_emails(batch_size=100, max_batches=None, backend=None):
+    """
+    Sends due queued emails over one connection per batch (a single SMTP/TLS
+    handshake for the whole batch), rescheduling failures with backoff. Each
+    message's outcome is saved as soon as it is known, so a worker that dies
+    or outlives its lease mid-batch does not send the earlier ones again.
+    """
+    result = SendResult()
+    started = time.monotonic()
+    max_attempts = getattr(settings, 'QUEUED_EMAIL_MAX_ATTEMPTS', 5)
+    batches = 0
+
+    while max_batches is None or batches < max_batches:
+        emails = claim_due(QueuedEmail, batch_size)
+        if not emails:
+            break
+        batches += 1
+
+        connection = get_connection(backend or _delivery_backend(), fail_silently=False)
+        done = 0
+        try:
+            connection.open()
+            for queued in emails:
+                try:
+                    connection.send_messages([build_message(queued, connection)])
+                except Exception as e:
+                    done += 1
+                    _record_failure(queued, e, max_attempts, result)
+                    queued.save(update_fields=STATUS_FIELDS)
+                    if is_disconnect(e): # The rest of the batch would fail on this session
+                        connection.close()
+                        connection.open()
+                else:
+                    done += 1
+                    queued.status = SENT
+                    queued.sent_at = timezone.now()
+                    queued.last_error = ''
+                    queued.save(update_fields=STATUS_FIELDS)
+                    result.sent += 1
+        except Exception as e:
+            # Could not (re)connect: everything not yet attempted is retried later
+            logger.warning("Email connection failed: %s", e)
+            for queued in emails[done:]:
+                _record_failure(queued, e, max_attempts, result)
+            QueuedEmail.objects.bulk_update(emails[done:], STATUS_FIELDS)
+        finally:
+            connection.close()
+
+    result.elapsed = time.monotonic() - started
+    return result
+
+
+def _record_failure(queued, error, max_attempts, result):
+    queued.attempts += 1
+    queued.last_error = str(error) or error.__class__.__name__
+    if queued.attempts >= max_attempts or is_permanent(error):
+        queued.status = FAILED
+        result.failed += 1
+        logger.error("Giving up on queued email %s to %s after %s attempts: %s",
+                     queued.pk, queued.to, queued.attempts, queued.last_error)
+    else:
+        queued.next_attempt_at = timezone.now() + retry_delay(queued.attempts)
+        result.retried += 1
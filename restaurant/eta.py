@@ -0,0 +1,217 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import Order, StoreDeliveryStats
+from .store_index import haversine_km
+
+logger = logging.getLogger(__name__)
+
+# Bounds for a single observed courier speed; outside them the sample is treated as noise
+MIN_SPEED_KMH, MAX_SPEED_KMH = 3.0, 80.0
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+@dataclass
+class StoreStats:
+    prep_seconds: float
+    delivery_seconds: float
+    speed_kmh: float
+    samples: int = 0
+    loaded_at: float = field(default_factory=time.monotonic)
+
+
+_stats = {}
+_lock = threading.Lock()
+
+
+def _defaults():
+    return StoreStats(
+        prep_seconds=_setting('ETA_DEFAULT_PREP_MINUTES', 20) * 60,
+        delivery_seconds=_setting('ETA_DEFAULT_DELIVERY_MINUTES', 20) * 60,
+        speed_kmh=_setting('ETA_DEFAULT_SPEED_KMH', 20.0),
+    )
+
+
+def get_store_stats(store_id):
+    """
+    In-memory stats for a store, loaded from StoreDeliveryStats on first use
+    in this process and again every ETA_STATS_RELOAD_INTERVAL seconds, which
+    picks up what `manage.py refresh_eta_stats` merged from every worker's orders.
+    """
+    stats = _stats.get(store_id)
+    if stats is None or time.monotonic() - stats.loaded_at >= _setting('ETA_STATS_RELOAD_INTERVAL', 60):
+        row = StoreDeliveryStats.objects.filter(store_id=store_id).first()
+        if row:
+            loaded = StoreStats(row.prep_seconds, row.delivery_seconds, row.speed_kmh, row.samples)
+        elif stats:
+            loaded = StoreStats(stats.prep_seconds, stats.delivery_seconds, stats.speed_kmh, stats.samples) # Not refreshed yet
+        else:
+            loaded = _defaults()
+        with _lock:
+            current = _stats.get(store_id)
+            if current is stats: # Nobody reloaded it meanwhile
+                _stats[store_id] = current = loaded
+            stats = current
+    return stats
+
+
+def distance_km(*points):
+    """Haversine distance between (lat, lon, lat, lon), or None when any coordinate is missing."""
+    if any(value is None for value in points):
+        return None
+    return haversine_km(*map(float, points))
+
+
+def order_distance_km(order):
+    """Store-to-address distance, or None when either side has no coordinates."""
+    store, address = order.store_location, order.delivery_address_link
+    if not store or not address:
+        return None
+    return distance_km(store.latitude, store.longitude, address.latitude, address.longitude)
+
+
+def _fold(stats, name, sample):
+    """Moves one rolling average towards a new observation. `stats` is a StoreStats or a StoreDeliveryStats row."""
+    alpha = _setting('ETA_SMOOTHING', 0.2)
+    setattr(stats, name, (1 - alpha) * getattr(stats, name) + alpha * sample)
+    if name != 'speed_kmh': # A delivery contributes a duration and a speed but counts once
+        stats.samples += 1
+
+
+def prep_observations(order):
+    prep = (order.delivering_at - order.created_at).total_seconds()
+    return [('prep_seconds', prep)] if prep > 0 else []
+
+
+def delivery_observations(order):
+    travel = (order.delivered_at - order.delivering_at).total_seconds()
+    if travel <= 0:
+        return []
+    found = [('delivery_seconds', travel)]
+    distance = order_distance_km(order)
+    if distance:
+        speed = distance / (travel / 3600)
+        if MIN_SPEED_KMH <= speed <= MAX_SPEED_KMH:
+            found.append(('speed_kmh', speed))
+    return found
+
+
+def observations(order):
+    """The (field, value) observations an order that just moved to 'Delivering' or 'Delivered' contributes."""
+    if order.status == 1 and order.delivering_at and order.created_at:
+        return prep_observations(order)
+    if order.status == 2 and order.delivered_at and order.delivering_at:
+        return delivery_observations(order)
+    return []
+
+
+def record_transition(order):
+    """
+    Folds the durations of an order that just moved to 'Delivering' or
+    'Delivered' into this process's copy of its store's statistics, once the
+    current transaction commits (a rolled-back change is not an observation).
+    Nothing is written: refresh_store_stats() derives the stored statistics
+    from the orders themselves.
+    """
+    if not order.store_location_id:
+        return
+    found = observations(order) # Taken now; the instance may change before the commit
+    if found:
+        store_id = order.store_location_id
+        transaction.on_commit(lambda: _record(store_id, found))
+
+
+def _record(store_id, found):
+    stats = get_store_stats(store_id)
+    with _lock:
+        for name, sample in found:
+            _fold(stats, name, sample)
+
+
+def refresh_store_stats(now=None):
+    """
+    Folds the order transitions since each store's last refresh into
+    StoreDeliveryStats, oldest first; a store without samples starts from
+    ETA_STATS_HISTORY_DAYS of history. Run periodically by `manage.py
+    refresh_eta_stats`; workers reload the rows (see get_store_stats).
+    Returns the number of observations folded in.
+    """
+    now = now or timezone.now()
+    defaults = _defaults()
+    folded = 0
+    with transaction.atomic():
+        store_ids = list(Order.objects.exclude(store_location=None).values_list('store_location_id', flat=True).distinct())
+        StoreDeliveryStats.objects.bulk_create(
+            [
+                StoreDeliveryStats(store_id=store_id, prep_seconds=defaults.prep_seconds,
+                                   delivery_seconds=defaults.delivery_seconds, speed_kmh=defaults.speed_kmh)
+                for store_id in store_ids
+            ],
+            ignore_conflicts=True, # Rows that exist keep their values
+        )
+        history_start = now - timedelta(days=_setting('ETA_STATS_HISTORY_DAYS', 30))
+        rows = list(StoreDeliveryStats.objects.select_for_update().filter(store_id__in=store_ids))
+        for row in rows:
+            since = row.updated_at if row.samples else history_start
+            transitions = (
+                Order.objects.filter(store_location_id=row.store_id)
+                .filter(Q(delivering_at__gt=since, delivering_at__lte=now) | Q(delivered_at__gt=since, delivered_at__lte=now))
+                .select_related('store_location', 'delivery_address_link')
+            )
+            timeline = []
+            for order in transitions.iterator():
+                if order.delivering_at and since < order.delivering_at <= now:
+                    timeline.append((order.delivering_at, prep_observations(order)))
+                if order.delivered_at and order.delivering_at and since < order.delivered_at <= now:
+                    timeline.append((order.delivered_at, delivery_observations(order)))
+            timeline.sort(key=lambda entry: entry[0])
+            for _, found in timeline:
+                for name, sample in found:
+                    _fold(row, name, sample)
+                    folded += 1
+            row.updated_at = now # bulk_update skips auto_now; also the next run's starting point
+        StoreDeliveryStats.objects.bulk_update(
+            rows, ['prep_seconds', 'delivery_seconds', 'speed_kmh', 'samples', 'updated_at'],
+        )
+    return folded
+
+
+def estimate_eta(order, now=None):
+    """
+    Expected delivery time for an order, or None if it has no store.
+    Pending: max(now, created + prep) + travel. Delivering: left store + travel.
+    Travel is distance / rolling speed when both coordinates are known,
+    otherwise the rolling average delivery duration.
+    """
+    if order.status == 2:
+        return order.delivered_at
+    if not order.store_location_id:
+        return None
+    return estimate_eta_from(
+        order.status, order.store_location_id, order.created_at, order.delivering_at, order_distance_km(order), now,
+    )
+
+
+def estimate_eta_from(status, store_id, created_at, delivering_at, distance, now=None):
+    """estimate_eta() for a pending or delivering order given as column values (e.g. from values())."""
+    now = now or timezone.now()
+    stats = get_store_stats(store_id)
+    if distance is not None:
+        travel = timedelta(hours=distance / stats.speed_kmh)
+    else:
+        travel = timedelta(seconds=stats.delivery_seconds)
+
+    if status == 1:
+        departed = delivering_at or now
+        return max(now, departed + travel)
+    ready = created_at + timedelta(seconds=stats.prep_seconds) if created_at else now
+    return max(now, ready) + travel
@@ -0,0 +1,144 @@
+import csv
+import json
+from datetime import datetime, time, timedelta
+from django.db.models import Prefetch
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from .models import Order, OrderItem
+
+# Number of orders fetched (and prefetched) per database round trip
+DEFAULT_CHUNK_SIZE = 2000
+
+EXPORT_FORMATS = ('csv', 'jsonl')
+
+# One row per order item; orders without items still produce a single row
+EXPORT_COLUMNS = [
+    'order_code', 'created_at', 'status', 'store_id', 'store_name',
+    'user_id', 'customer_name', 'customer_phone', 'delivery_address',
+    'is_voice_order', 'order_total', 'item_id', 'menuitem_id',
+    'menuitem_title', 'quantity', 'item_price', 'selected_options',
+]
+
+STATUS_LABELS = dict(Order.STATUS_CHOICES)
+
+
+class ExportFilterError(ValueError):
+    """Raised when export filters (dates, store id) cannot be parsed."""
+
+
+def parse_export_filters(start=None, end=None, store=None):
+    """
+    Validates raw filter values (query params or command options).
+    Returns a tuple: (start date or None, end date or None, store id or None)
+    """
+    parsed = []
+    for label, value in (('start', start), ('end', end)):
+        if value:
+            try:
+                day = parse_date(value)
+            except ValueError: # Well formatted but invalid, e.g. month 13
+                day = None
+            if day is None:
+                raise ExportFilterError(f"Invalid {label} date '{value}'. Use YYYY-MM-DD.")
+            parsed.append(day)
+        else:
+            parsed.append(None)
+    start_date, end_date = parsed
+
+    if start_date and end_date and start_date > end_date:
+        raise ExportFilterError("start must not be after end.")
+
+    store_id = None
+    if store:
+        try:
+            store_id = int(store)
+        except (TypeError, ValueError):
+            raise ExportFilterError(f"Invalid store id '{store}'.")
+
+    return start_date, end_date, store_id
+
+
+def start_of_day(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def get_export_queryset(start_date=None, end_date=None, store_id=None):
+    """
+    Orders to export, oldest first. Nested items are prefetched, which
+    Django performs once per iterator chunk rather than once per order.
+    """
+    queryset = Order.objects.select_related('store_location').order_by('created_at', 'pk')
+    # Plain datetime ranges (dates in the current time zone), so the created_at index applies
+    if start_date:
+        queryset = queryset.filter(created_at__gte=start_of_day(start_date))
+    if end_date:
+        queryset = queryset.filter(created_at__lt=start_of_day(end_date + timedelta(days=1))) # End date is inclusive
+    if store_id:
+        queryset = queryset.filter(store_location_id=store_id)
+
+    items = OrderItem.objects.select_related('menuitem').prefetch_related('selected_options__item').order_by('pk')
+    return queryset.prefetch_related(Prefetch('order_items', queryset=items))
+
+
+def iter_order_rows(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yields one flat dict per order item without caching the queryset."""
+    for order in queryset.iterator(chunk_size=chunk_size):
+        store = order.store_location
+        order_fields = {
+            'order_code': order.order_code,
+            'created_at': order.created_at.isoformat() if order.created_at else '',
+            'status': STATUS_LABELS.get(order.status, order.status),
+            'store_id': store.pk if store else '',
+            'store_name': store.name if store else '',
+            'user_id': order.user_id or '',
+            'customer_name': order.customer_name,
+            'customer_phone': order.customer_phone,
+            'delivery_address': order.delivery_address,
+            'is_voice_order': order.is_voice_order,
+            'order_total': str(order.total),
+        }
+
+        order_items = order.order_items.all()
+        if not order_items:
+            yield {**order_fields, 'item_id': '', 'menuitem_id': '', 'menuitem_title': '',
+                   'quantity': '', 'item_price': '', 'selected_options': ''}
+            continue
+
+        for item in order_items:
+            yield {
+                **order_fields,
+                'item_id': item.pk,
+                'menuitem_id': item.menuitem_id,
+                'menuitem_title': item.menuitem.title,
+                'quantity': item.quantity,
+                'item_price': str(item.price),
+                'selected_options': '; '.join(option.item.title for option in item.selected_options.all()),
+            }
+
+
+class _Echo:
+    """Pseudo-buffer for csv.writer: returns each line instead of storing it."""
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows):
+    writer = csv.DictWriter(_Echo(), fieldnames=EXPORT_COLUMNS)
+    yield writer.writerow(dict(zip(EXPORT_COLUMNS, EXPORT_COLUMNS)))
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def iter_jsonl(rows):
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+def iter_export(export_format, queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Returns a generator of text fragments for the requested format."""
+    rows = iter_order_rows(queryset, chunk_size=chunk_size)
+    if export_format == 'csv':
+        return iter_csv(rows)
+    if export_format == 'jsonl':
+        return iter_jsonl(rows)
+    raise ExportFilterError(f"Unsupported format '{export_format}'. Allowed values are: {', '.join(EXPORT_FORMATS)}")
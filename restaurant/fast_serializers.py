@@ -0,0 +1,235 @@
+"""
+Fast path for the hot list endpoints (categories, menu items, orders).
+
+Rows come from values() and are turned straight into the dicts that
+CategorySerializer, MenuItemSerializer and OrderSerializer produce, without
+DRF's per-object field machinery; image URLs are built from a media prefix
+resolved once per request instead of build_absolute_uri per row. The output
+is the same, key order included (see tests/test_fast_serializers.py), so
+any change to those serializers' fields must be mirrored here.
+
+FastJSONRenderer encodes with orjson when it is installed, falling back to
+DRF's JSONRenderer for anything orjson would render differently.
+"""
+from django.core.files.storage import FileSystemStorage
+from django.utils.encoding import filepath_to_uri
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from .eta import distance_km, estimate_eta_from
+from .instrumentation import timed_serialization
+from .models import Category, MenuItem, OptionChoice, OrderItem
+from .serializers import order_date
+
+# Stateless DRF fields, reused so decimals and datetimes are formatted exactly as the serializers do
+_money = serializers.DecimalField(max_digits=6, decimal_places=2)
+_total = serializers.DecimalField(max_digits=8, decimal_places=2)
+_datetime = serializers.DateTimeField()
+
+CATEGORY_VALUES = ('id', 'slug', 'title', 'image')
+MENU_ITEM_VALUES = (
+    'id', 'title', 'price', 'featured', 'image', 'is_standalone_item', 'is_available',
+    'allergens', 'ingredient_list', 'nutritional_info',
+)
+ORDER_VALUES = (
+    'id', 'user_id', 'delivery_crew_id', 'status', 'total', 'is_voice_order', 'created_at', 'delivering_at',
+    'delivered_at', 'customer_name', 'customer_phone', 'delivery_address', 'store_location_id',
+    'store_location__latitude', 'store_location__longitude',
+    'delivery_address_link_id', 'delivery_address_link__latitude', 'delivery_address_link__longitude',
+)
+
+
+def image_url_builder(request, model):
+    """
+    name -> what request.build_absolute_uri(model.image.url) returns, or None
+    for an empty name. With the filesystem storage the absolute media prefix
+    is resolved once; other storages are asked per name.
+    """
+    storage = model._meta.get_field('image').storage
+    if request is None:
+        return lambda name: None
+    if storage.__class__.url is FileSystemStorage.url: # Not a subclass with its own URL scheme
+        prefix = request.build_absolute_uri(storage.base_url)
+        return lambda name: prefix + filepath_to_uri(name).lstrip('/') if name else None
+    return lambda name: request.build_absolute_uri(storage.url(name)) if name else None
+
+
+def _prefixed(prefix, names):
+    return [prefix + name for name in names]
+
+
+def menu_item_values(prefix=''):
+    """values() names for menu_item_dict(), related through prefix (e.g. 'menuitem__')."""
+    return _prefixed(prefix, MENU_ITEM_VALUES) + _prefixed(f'{prefix}category__', CATEGORY_VALUES)
+
+
+def category_dict(row, category_image, prefix=''):
+    return {
+        'id': row[prefix + 'id'],
+        'slug': row[prefix + 'slug'],
+        'title': row[prefix + 'title'],
+        'image_url': category_image(row[prefix + 'image']),
+    }
+
+
+def menu_item_dict(row, item_image, category_image, prefix=''):
+    """MenuItemSerializer output for a menu_item_values(prefix) row."""
+    return {
+        'id': row[prefix + 'id'],
+        'title': row[prefix + 'title'],
+        'price': _money.to_representation(row[prefix + 'price']),
+        'featured': row[prefix + 'featured'],
+        'category': category_dict(row, category_image, f'{prefix}category__'),
+        'image_url': item_image(row[prefix + 'image']),
+        'is_standalone_item': row[prefix + 'is_standalone_item'],
+        'is_available': row[prefix + 'is_available'],
+        'allergens': row[prefix + 'allergens'],
+        'ingredient_list': row[prefix + 'ingredient_list'],
+        'nutritional_info': row[prefix + 'nutritional_info'],
+    }
+
+
+def categories_from_values(rows, request):
+    """CategorySerializer output for rows of values(*CATEGORY_VALUES), e.g. fetched with the async ORM."""
+    with timed_serialization():
+        image = image_url_builder(request, Category)
+        return [category_dict(row, image) for row in rows]
+
+
+def menu_items_from_values(rows, request):
+    """MenuItemSerializer output for rows of values(*menu_item_values())."""
+    with timed_serialization():
+        item_image, category_image = image_url_builder(request, MenuItem), image_url_builder(request, Category)
+        return [menu_item_dict(row, item_image, category_image) for row in rows]
+
+
+def serialize_categories(queryset, request):
+    """CategorySerializer(queryset, many=True).data as plain dicts."""
+    with timed_serialization():
+        return categories_from_values(queryset.values(*CATEGORY_VALUES), request)
+
+
+def serialize_menu_items(queryset, request):
+    """MenuItemSerializer(queryset, many=True).data as plain dicts."""
+    with timed_serialization():
+        return menu_items_from_values(queryset.values(*menu_item_values()), request)
+
+
+def _eta(row):
+    # OrderSerializer.get_eta() from the row's columns
+    if row['status'] == 2:
+        eta = row['delivered_at']
+    elif not row['store_location_id']:
+        eta = None
+    else:
+        distance = None
+        if row['delivery_address_link_id']:
+            distance = distance_km(
+                row['store_location__latitude'], row['store_location__longitude'],
+                row['delivery_address_link__latitude'], row['delivery_address_link__longitude'],
+            )
+        eta = estimate_eta_from(row['status'], row['store_location_id'], row['created_at'], row['delivering_at'], distance)
+    return _datetime.to_representation(eta) if eta else None
+
+
+def serialize_orders(queryset):
+    """
+    OrderSerializer(queryset, many=True).data as plain dicts: three queries
+    (orders, their items with menu item and category, the items' options)
+    whatever the number of orders. Like OrderSerializer, which the order
+    views use without a request, nested image URLs are null.
+    """
+    with timed_serialization():
+        orders = list(queryset.values(*ORDER_VALUES))
+        if not orders:
+            return []
+        no_image = image_url_builder(None, MenuItem)
+        order_ids = [row['id'] for row in orders]
+
+        items_by_order = {order_id: [] for order_id in order_ids}
+        item_rows = OrderItem.objects.filter(order_id__in=order_ids).values(
+            'id', 'order_id', 'quantity', 'price', *menu_item_values('menuitem__'),
+        )
+        items_by_id = {}
+        for row in item_rows:
+            item = {
+                'id': row['id'],
+                'order': row['order_id'],
+                'menuitem': menu_item_dict(row, no_image, no_image, 'menuitem__'),
+                'quantity': row['quantity'],
+                'price': _money.to_representation(row['price']),
+                'selected_options': [],
+            }
+            items_by_id[row['id']] = item
+            items_by_order[row['order_id']].append(item)
+
+        if items_by_id:
+            options = OptionChoice.objects.filter(orderitem__in=list(items_by_id)).values(
+                'orderitem', 'id', 'item__title', 'price_adjustment', 'is_default', 'item__is_available',
+            )
+            for row in options:
+                items_by_id[row['orderitem']]['selected_options'].append({
+                    'id': row['id'],
+                    'item_title': row['item__title'],
+                    'price_adjustment': _money.to_representation(row['price_adjustment']),
+                    'is_default': row['is_default'],
+                    'is_available': row['item__is_available'],
+                })
+
+        return [{
+            'id': row['id'],
+            'user': row['user_id'],
+            'delivery_crew': row['delivery_crew_id'],
+            'status': row['status'],
+            'total': _total.to_representation(row['total']),
+            'order_items': items_by_order[row['id']],
+            'is_voice_order': row['is_voice_order'],
+            'date': order_date(row['created_at']),
+            'created_at': _datetime.to_representation(row['created_at']),
+            'customer_name': row['customer_name'],
+            'customer_phone': row['customer_phone'],
+            'delivery_address': row['delivery_address'],
+            'eta': _eta(row),
+        } for row in orders]
+
+
+_orjson = None
+
+
+def _load_orjson():
+    global _orjson
+    if _orjson is None:
+        try:
+            import orjson
+        except ImportError:
+            orjson = False
+        _orjson = orjson
+    return _orjson
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer with orjson for compact, non-ASCII output (the default
+    settings). Datetimes and dataclasses go through DRF's encoder like
+    everything orjson does not handle natively, so the bytes match
+    JSONRenderer's (floats aside, where orjson writes exponents without a
+    '+', e.g. 1e16, and NaN as null); indented
+    output, ASCII-only settings and values orjson rejects (e.g. integers
+    beyond 64 bits) use JSONRenderer itself.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        orjson = _load_orjson()
+        if (
+            data is None or not orjson or self.ensure_ascii or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(
+                data, default=self.encoder_class().default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_NON_STR_KEYS,
+            )
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # JSONRenderer escapes these so the output is also valid JavaScript
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
@@ -0,0 +1,252 @@
+import abc
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+import unicodedata
+from datetime import timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .models import GeocodeCache
+
+logger = logging.getLogger(__name__)
+
+COORDINATE_PLACES = Decimal('0.000001') # Matches the 6 decimal places of the coordinate fields
+
+
+class GeocodingError(Exception):
+    """Transient provider failure (timeout, HTTP error). Not cached, unlike 'address not found'."""
+
+
+def normalize_address(address_str):
+    """
+    Canonical form used as the cache key: case-folded, diacritics removed
+    ("București" == "Bucuresti"), punctuation other than commas dropped,
+    whitespace collapsed.
+    """
+    text = unicodedata.normalize('NFKD', address_str or '').casefold()
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    text = re.sub(r'[^\w\s,]', ' ', text)
+    text = re.sub(r'\s*,\s*', ', ', text)
+    text = re.sub(r'\s+', ' ', text)
+    return text.strip(' ,')
+
+
+class RateLimiter:
+    """Thread-safe limiter spacing calls at least min_interval seconds apart."""
+
+    def __init__(self, min_interval):
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._next_call = 0.0
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next_call - now
+            self._next_call = max(now, self._next_call) + self.min_interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+class GeocodingProvider(abc.ABC):
+    """Base class. geocode() returns (latitude, longitude), (None, None) if not found, or raises GeocodingError."""
+    name = 'base'
+
+    @abc.abstractmethod
+    def geocode(self, address_str):
+        """Resolves one address with a (possibly network) lookup."""
+
+
+class NominatimProvider(GeocodingProvider):
+    """
+    OpenStreetMap Nominatim, with one client (and HTTP connection pool) per
+    process and a shared limit of one request per GEOCODING_MIN_INTERVAL seconds.
+    """
+    name = 'nominatim'
+
+    def __init__(self):
+        self.rate_limiter = RateLimiter(getattr(settings, 'GEOCODING_MIN_INTERVAL', 1.0))
+        self._geolocator = None
+        self._lock = threading.Lock()
+
+    @property
+    def geolocator(self):
+        if self._geolocator is None:
+            with self._lock:
+                if self._geolocator is None:
+                    # Imported lazily: geopy is only needed by processes that actually geocode
+                    from geopy.adapters import RequestsAdapter
+                    from geopy.geocoders import Nominatim
+
+                    self._geolocator = Nominatim(
+                        user_agent=getattr(settings, 'GEOCODING_USER_AGENT', 'socului_restaurant_app_v1'),
+                        timeout=getattr(settings, 'GEOCODING_TIMEOUT', 10),
+                        adapter_factory=RequestsAdapter, # Keeps a requests.Session, reusing connections
+                    )
+        return self._geolocator
+
+    def geocode(self, address_str):
+        from geopy.exc import GeopyError
+
+        self.rate_limiter.wait()
+        try:
+            location = self.geolocator.geocode(address_str)
+        except GeopyError as e:
+            raise GeocodingError(str(e)) from e
+        if location:
+            return location.latitude, location.longitude
+        return None, None
+
+
+class FixtureProvider(GeocodingProvider):
+    """
+    Deterministic offline provider for tests and local runs. Addresses listed
+    in the GEOCODING_FIXTURE_PATH JSON file ({"address": [lat, lon]}) resolve
+    to those coordinates; any other address maps to a stable point derived
+    from its hash inside GEOCODING_FIXTURE_BOUNDS.
+    """
+    name = 'fixture'
+
+    def __init__(self):
+        self.fixtures = {}
+        path = getattr(settings, 'GEOCODING_FIXTURE_PATH', None)
+        if path:
+            with open(path, encoding='utf-8') as fh:
+                self.fixtures = {normalize_address(k): tuple(v) if v else (None, None) for k, v in json.load(fh).items()}
+        # Default: a box around Bucharest
+        self.bounds = getattr(settings, 'GEOCODING_FIXTURE_BOUNDS', (44.33, 25.97, 44.54, 26.23))
+
+    def geocode(self, address_str):
+        key = normalize_address(address_str)
+        if key in self.fixtures:
+            return self.fixtures[key]
+        if not key:
+            return None, None
+        digest = hashlib.sha256(key.encode('utf-8')).digest()
+        min_lat, min_lon, max_lat, max_lon = self.bounds
+        lat_fraction = int.from_bytes(digest[:8], 'big') / 2 ** 64
+        lon_fraction = int.from_bytes(digest[8:16], 'big') / 2 ** 64
+        return (
+            round(min_lat + (max_lat - min_lat) * lat_fraction, 6),
+            round(min_lon + (max_lon - min_lon) * lon_fraction, 6),
+        )
+
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def get_provider():
+    """The process-wide provider configured by GEOCODING_PROVIDER."""
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                path = getattr(settings, 'GEOCODING_PROVIDER', 'restaurant.geocoding.NominatimProvider')
+                _provider = import_string(path)()
+    return _provider
+
+
+def to_coordinate(value):
+    """Rounds a latitude or longitude to a Decimal with the precision of the model fields."""
+    return None if value is None else Decimal(str(value)).quantize(COORDINATE_PLACES)
+
+
+def get_cached(normalized_addresses):
+    """
+    Fresh cache entries for the given normalised addresses, as
+    {normalized_address: (latitude, longitude)}. Misses are absent;
+    cached "not found" results map to (None, None).
+    """
+    now = timezone.now()
+    found_after = now - timedelta(days=getattr(settings, 'GEOCODE_CACHE_TTL_DAYS', 90))
+    not_found_after = now - timedelta(hours=getattr(settings, 'GEOCODE_NOT_FOUND_TTL_HOURS', 24))
+
+    results = {}
+    entries = GeocodeCache.objects.filter(normalized_address__in=set(normalized_addresses)).values_list(
+        'normalized_address', 'latitude', 'longitude', 'updated_at'
+    )
+    for key, latitude, longitude, updated_at in entries:
+        if updated_at >= (found_after if latitude is not None else not_found_after):
+            results[key] = (latitude, longitude)
+    return results
+
+
+def store_cached(results, provider_name):
+    """Upserts {normalized_address: (latitude, longitude)} into the cache table."""
+    now = timezone.now()
+    GeocodeCache.objects.bulk_create(
+        [
+            GeocodeCache(
+                normalized_address=key,
+                latitude=to_coordinate(latitude),
+                longitude=to_coordinate(longitude),
+                provider=provider_name,
+                updated_at=now,
+            )
+            for key, (latitude, longitude) in results.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['normalized_address'],
+        update_fields=['latitude', 'longitude', 'provider', 'updated_at'],
+    )
+
+
+def geocode(address_str, provider=None):
+    """
+    Resolves an address to (latitude, longitude) as Decimals, or (None, None).
+    Repeat addresses are answered from the cache without a network call.
+    """
+    key = normalize_address(address_str)
+    if not key:
+        return None, None
+
+    cached = get_cached([key])
+    if key in cached:
+        return cached[key]
+
+    provider = provider or get_provider()
+    try:
+        latitude, longitude = provider.geocode(address_str)
+    except GeocodingError as e:
+        logger.warning("Geocoding error for %r: %s", address_str, e)
+        return None, None
+
+    store_cached({key: (latitude, longitude)}, provider.name)
+    return to_coordinate(latitude), to_coordinate(longitude)
+
+
+def geocode_many(addresses, provider=None, max_lookups=None):
+    """
+    geocode() for a list of addresses, in order: one cache query for all of
+    them and a single provider call per distinct uncached address. With
+    max_lookups, at most that many provider calls are made; the addresses
+    left over yield None (not looked up yet) instead of a (lat, lon) pair.
+    """
+    keys = [normalize_address(address) for address in addresses]
+    resolved = get_cached([key for key in keys if key])
+
+    fetched, skipped = {}, set()
+    for key, address in zip(keys, addresses):
+        if not key or key in resolved or key in fetched or key in skipped:
+            continue
+        if max_lookups is not None and len(fetched) >= max_lookups:
+            skipped.add(key)
+            continue
+        provider = provider or get_provider()
+        try:
+            fetched[key] = provider.geocode(address)
+        except GeocodingError as e:
+            logger.warning("Geocoding error for %r: %s", address, e)
+            fetched[key] = None # Counts as a lookup, but is not cached
+    results = {key: result for key, result in fetched.items() if result is not None}
+    if results:
+        store_cached(results, provider.name)
+        resolved.update({key: (to_coordinate(lat), to_coordinate(lon)) for key, (lat, lon) in results.items()})
+
+    return [None if key in skipped else resolved.get(key, (None, None)) for key in keys]
@@ -0,0 +1,275 @@
+import hmac
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from rest_framework import serializers
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class Histogram:
+    """Cumulative-bucket histogram, as exposed in the Prometheus text format."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Per-process metrics keyed by (name, labels). Updates take one short lock per request."""
+
+    METRICS = {
+        # name: (type, help, buckets)
+        'http_request_duration_seconds': ('histogram', 'Wall time per request.', DURATION_BUCKETS),
+        'http_request_db_queries': ('histogram', 'Database queries per request.', QUERY_BUCKETS),
+        'http_request_db_seconds': ('histogram', 'Time spent in database queries per request.', DURATION_BUCKETS),
+        'http_request_serializer_seconds': ('histogram', 'Time spent in DRF serializers per request.', DURATION_BUCKETS),
+        'http_response_size_bytes': ('histogram', 'Response body size (non-streaming responses).', SIZE_BUCKETS),
+        'http_request_repeated_queries_total': ('counter', 'Requests that ran the same SQL statement repeatedly (likely N+1).', None),
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = Counter()
+
+    def record(self, route, method, status, stats, size):
+        labels = (('route', route), ('method', method))
+        observations = [
+            ('http_request_duration_seconds', labels + (('status', f'{status // 100}xx'),), stats.elapsed),
+            ('http_request_db_queries', labels, stats.queries),
+            ('http_request_db_seconds', labels, stats.db_time),
+            ('http_request_serializer_seconds', labels, stats.serializer_time),
+        ]
+        if size is not None:
+            observations.append(('http_response_size_bytes', labels, size))
+
+        with self._lock:
+            for name, metric_labels, value in observations:
+                key = (name, metric_labels)
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = Histogram(self.METRICS[name][2])
+                histogram.observe(value)
+            if stats.repeated_query:
+                self._counters[('http_request_repeated_queries_total', labels)] += 1
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format (0.0.4)."""
+        with self._lock:
+            histograms = {key: (list(h.counts), h.sum, h.count, h.buckets) for key, h in self._histograms.items()}
+            counters = dict(self._counters)
+
+        lines = []
+        for name, (metric_type, help_text, _) in self.METRICS.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            if metric_type == 'counter':
+                for (metric_name, labels), value in sorted(counters.items()):
+                    if metric_name == name:
+                        lines.append(f'{name}{_labels(labels)} {value}')
+                continue
+            for (metric_name, labels), (counts, total, count, buckets) in sorted(histograms.items()):
+                if metric_name != name:
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip(list(buckets) + ['+Inf'], counts):
+                    cumulative += bucket_count
+                    lines.append(f'{name}_bucket{_labels(labels + (("le", bound),))} {cumulative}')
+                lines.append(f'{name}_sum{_labels(labels)} {total}')
+                lines.append(f'{name}_count{_labels(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+registry = MetricsRegistry()
+
+
+class RequestStats:
+    __slots__ = ('started', 'elapsed', 'queries', 'db_time', 'serializer_time', 'serializer_depth', 'statements', 'repeated_query')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+        self.statements = Counter()
+        self.repeated_query = None
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook: SQL arrives with placeholders, so repeats of one statement share a key
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+            self.statements[sql] += 1
+
+
+_current = ContextVar('request_stats', default=None)
+
+
+@contextmanager
+def timed_serialization():
+    """Adds the enclosed time to the current request's serializer time (outermost serializer only)."""
+    stats = _current.get()
+    if stats is None:
+        yield
+        return
+    stats.serializer_depth += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.serializer_depth -= 1
+        if stats.serializer_depth == 0:
+            stats.serializer_time += time.perf_counter() - started
+
+
+class TimedListSerializer(serializers.ListSerializer):
+    @property
+    def data(self):
+        with timed_serialization():
+            return super().data
+
+
+class TimedSerializerMixin:
+    """Reports the time spent producing serializer.data (single or many=True) to the instrumentation middleware."""
+
+    @property
+    def data(self):
+        with timed_serialization():
+            return super().data
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        serializer = super().many_init(*args, **kwargs)
+        if type(serializer) is serializers.ListSerializer: # Leave custom list serializers alone
+            serializer.__class__ = TimedListSerializer
+        return serializer
+
+
+def wrap_connections(stack, stats):
+    for alias in settings.DATABASES:
+        stack.enter_context(connections[alias].execute_wrapper(stats))
+
+
+class InstrumentationMiddleware:
+    """
+    Records wall time, database query count and time (every alias, through
+    connection.execute_wrapper), serializer time and response size per
+    route, and flags requests that run the same statement
+    INSTRUMENTATION_REPEATED_QUERY_THRESHOLD or more times. Results are kept
+    in per-process histograms served by metrics_view; with
+    INSTRUMENTATION_SERVER_TIMING the totals are also sent as a
+    Server-Timing header. Works in sync and async middleware chains.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'INSTRUMENTATION_ENABLED', True)
+        self.threshold = getattr(settings, 'INSTRUMENTATION_REPEATED_QUERY_THRESHOLD', 5)
+        self.server_timing = getattr(settings, 'INSTRUMENTATION_SERVER_TIMING', False)
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        try:
+            with ExitStack() as stack:
+                wrap_connections(stack, stats)
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, stats)
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        stack = ExitStack()
+        try:
+            # The async ORM runs queries in the request's thread-sensitive
+            # executor thread; connections are per thread, so wrap them there
+            await sync_to_async(wrap_connections)(stack, stats)
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+            _current.reset(token)
+        return self.finish(request, response, stats)
+
+    def finish(self, request, response, stats):
+        stats.elapsed = time.perf_counter() - stats.started
+
+        match = request.resolver_match
+        route = match.route.lstrip('^').rstrip('$') if match else 'unmatched' # Route patterns keep label cardinality bounded
+        if stats.statements:
+            sql, count = stats.statements.most_common(1)[0]
+            if count >= self.threshold:
+                stats.repeated_query = sql
+                logger.warning("Repeated query on %s %s (%d times): %.300s", request.method, route, count, sql)
+
+        size = None if response.streaming else len(response.content)
+        registry.record(route, request.method, response.status_code, stats, size)
+
+        if self.server_timing:
+            response['Server-Timing'] = (
+                f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries", '
+                f'ser;dur={stats.serializer_time * 1000:.1f}, total;dur={stats.elapsed * 1000:.1f}'
+            )
+        return response
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint. Requires 'Authorization: Bearer <METRICS_TOKEN>' or a staff session."""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    keyword, _, presented = request.headers.get('Authorization', '').partition(' ')
+    authorized = bool(token) and keyword.lower() == 'bearer' and hmac.compare_digest(presented, token)
+    if not authorized and not (request.user.is_authenticated and request.user.is_staff):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
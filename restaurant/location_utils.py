@@ -1,45 +1,49 @@
-from geopy.geocoders import Nominatim
-from geopy.distance import great_circle
-from .models import StoreLocation
+from .geocoding import geocode, geocode_many
+from .store_index import get_store_index
+
 
 def geocode_address(address_str):
-    """Converts a street address string into latitude and longitude."""
-    # It's good practice to initialize the geolocator once if this were a class,
-    # but for a simple function, this is fine.
-    geolocator = Nominatim(user_agent="socului_restaurant_app_v1")
-    try:
-        location = geolocator.geocode(address_str, timeout=10) # Added timeout
-        if location:
-            return location.latitude, location.longitude
-    except Exception as e:
-        # It's good to log this error in a real application
-        print(f"Geocoding error: {e}")
-    return None, None
+    """
+    Converts a street address string into latitude and longitude.
+    Served from the geocode cache when possible, otherwise from the configured provider.
+    """
+    return geocode(address_str)
+
 
 def find_nearest_store(latitude, longitude):
     """
     Finds the nearest active store to a given lat/lon and checks if it's in range.
-    
+    A store that delivers to the point wins over a closer one that does not.
+
     Returns a tuple: (StoreLocation object, distance in km, can_deliver boolean)
     """
     if not latitude or not longitude:
         return None, None, False
 
-    user_location = (latitude, longitude)
-    active_stores = StoreLocation.objects.filter(is_active=True)
-    
-    if not active_stores.exists():
-        return None, None, False
+    # Lookups go through the cached, in-memory index of active stores (no query per call)
+    return get_store_index().nearest(latitude, longitude)
+
+
+def find_stores_covering(latitude, longitude):
+    """Returns every active store delivering to the lat/lon as (StoreLocation, distance in km), nearest first."""
+    if not latitude or not longitude:
+        return []
+    return get_store_index().covering(latitude, longitude)
 
-    # Find the closest store using a generator expression for efficiency
-    closest_store = min(
-        active_stores,
-        key=lambda store: great_circle(user_location, (store.latitude, store.longitude)).km
-    )
 
-    distance_km = great_circle(user_location, (closest_store.latitude, closest_store.longitude)).km
+def check_delivery_many(points):
+    """
+    find_nearest_store() for a list of (latitude, longitude) points, with the
+    candidate stores gathered once per grid cell (see StoreIndex.nearest_many).
+    Points with missing coordinates yield (None, None, False).
+    """
+    return get_store_index().nearest_many(points)
 
-    # Check if the user is within the delivery radius of that closest store
-    can_deliver = distance_km <= closest_store.delivery_radius_km
 
-    return closest_store, distance_km, can_deliver
\ No newline at end of file
+def geocode_addresses(address_strs, max_lookups=None):
+    """
+    Converts many address strings at once; see geocode_address(). With
+    max_lookups, addresses beyond that many provider calls yield None.
+    """
+    return geocode_many(address_strs, max_lookups=max_lookups)
+
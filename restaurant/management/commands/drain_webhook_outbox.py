@@ -0,0 +1,25 @@
+import time
+from django.core.management.base import BaseCommand
+from restaurant.outbox import METRICS, drain_outbox
+
+
+class Command(BaseCommand):
+    help = "Deliver queued n8n order webhooks from the outbox, with batching and retry/backoff."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50, help="Events combined into one webhook request.")
+        parser.add_argument('--interval', type=float, default=5.0, help="Seconds to sleep when the outbox is empty.")
+        parser.add_argument('--once', action='store_true', help="Drain what is currently due and exit.")
+
+    def handle(self, *args, **options):
+        while True:
+            result = drain_outbox(batch_size=options['batch_size'])
+            if result.batches:
+                self.stdout.write(
+                    f"Outbox: {result.delivered} delivered, {result.retried} scheduled for retry, "
+                    f"{result.failed} failed in {result.batches} batch(es), {result.elapsed:.2f}s "
+                    f"[totals: {METRICS['delivered']} delivered, {METRICS['failed']} failed]"
+                )
+            if options['once']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from restaurant.exports import (
+    DEFAULT_CHUNK_SIZE, EXPORT_FORMATS, ExportFilterError,
+    get_export_queryset, iter_export, parse_export_filters,
+)
+
+
+class Command(BaseCommand):
+    help = "Stream orders (one row per order item) to a CSV or JSON Lines file for accounting."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', dest='export_format', choices=EXPORT_FORMATS, default='csv')
+        parser.add_argument('--start', help="First day to include (YYYY-MM-DD).")
+        parser.add_argument('--end', help="Last day to include (YYYY-MM-DD).")
+        parser.add_argument('--store', help="Only export orders for this StoreLocation id.")
+        parser.add_argument('--output', '-o', help="File to write to. Defaults to stdout.")
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            start_date, end_date, store_id = parse_export_filters(options['start'], options['end'], options['store'])
+        except ExportFilterError as e:
+            raise CommandError(str(e))
+
+        if options['chunk_size'] <= 0:
+            raise CommandError("--chunk-size must be a positive integer.")
+
+        queryset = get_export_queryset(start_date, end_date, store_id)
+        fragments = iter_export(options['export_format'], queryset, chunk_size=options['chunk_size'])
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as fh:
+                for fragment in fragments:
+                    fh.write(fragment)
+            self.stderr.write(self.style.SUCCESS(f"Orders exported to {options['output']}"))
+        else:
+            for fragment in fragments:
+                self.stdout.write(fragment, ending='')
@@ -0,0 +1,101 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+from restaurant.geocoding import (
+    GeocodingError, get_cached, get_provider, normalize_address, store_cached, to_coordinate,
+)
+from restaurant.models import StoreLocation, UserAddress
+from restaurant.store_index import invalidate_store_index
+
+TARGETS = {
+    'addresses': (UserAddress, lambda row: row.formatted_address),
+    'stores': (StoreLocation, lambda row: row.address),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Geocode UserAddress and StoreLocation rows that have no coordinates. "
+        "Safe to interrupt and re-run: only rows still missing coordinates are processed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', choices=sorted(TARGETS), help="Backfill only addresses or only stores.")
+        parser.add_argument('--workers', type=int, default=4, help="Concurrent provider lookups (still subject to the provider's rate limit).")
+        parser.add_argument('--chunk-size', type=int, default=200, help="Rows read and written per bulk_update.")
+        parser.add_argument('--dry-run', action='store_true', help="Geocode but do not write coordinates back.")
+
+    def handle(self, *args, **options):
+        if options['workers'] <= 0 or options['chunk_size'] <= 0:
+            raise CommandError("--workers and --chunk-size must be positive integers.")
+
+        provider = get_provider()
+        targets = [options['only']] if options['only'] else sorted(TARGETS)
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            for target in targets:
+                model, address_of = TARGETS[target]
+                updated, unresolved = self.backfill(model, address_of, provider, executor, options)
+                if model is StoreLocation and updated and not options['dry_run']:
+                    invalidate_store_index() # bulk_update sends no post_save signals
+                self.stdout.write(self.style.SUCCESS(
+                    f"{target}: {updated} row(s) geocoded, {unresolved} could not be resolved."
+                ))
+
+    def backfill(self, model, address_of, provider, executor, options):
+        missing = model.objects.filter(Q(latitude__isnull=True) | Q(longitude__isnull=True)).order_by('pk')
+        updated = unresolved = 0
+        last_pk = 0
+
+        while True:
+            # Keyset pagination: unresolved rows stay NULL, so offsets would shift between chunks
+            rows = list(missing.filter(pk__gt=last_pk)[:options['chunk_size']])
+            if not rows:
+                break
+            last_pk = rows[-1].pk
+
+            rows_by_key = {}
+            addresses = {}
+            for row in rows:
+                key = normalize_address(address_of(row))
+                if key:
+                    rows_by_key.setdefault(key, []).append(row)
+                    addresses.setdefault(key, address_of(row))
+
+            # Identical addresses are looked up once; cached ones not at all
+            resolved = get_cached(rows_by_key)
+            misses = [key for key in rows_by_key if key not in resolved]
+            fetched = {}
+            for key, result in zip(misses, executor.map(lambda key: self.lookup(provider, addresses[key]), misses)):
+                if result is not None:
+                    fetched[key] = result
+            if fetched:
+                store_cached(fetched, provider.name)
+            resolved.update(fetched)
+
+            to_update = []
+            for key, key_rows in rows_by_key.items():
+                latitude, longitude = resolved.get(key, (None, None))
+                if latitude is None or longitude is None:
+                    unresolved += len(key_rows)
+                    continue
+                for row in key_rows:
+                    row.latitude, row.longitude = to_coordinate(latitude), to_coordinate(longitude)
+                    to_update.append(row)
+            unresolved += len(rows) - sum(len(key_rows) for key_rows in rows_by_key.values()) # Blank addresses
+
+            if to_update and not options['dry_run']:
+                with transaction.atomic():
+                    model.objects.bulk_update(to_update, ['latitude', 'longitude'])
+            updated += len(to_update)
+            self.stdout.write(f"{model.__name__}: processed up to id {last_pk} ({updated} geocoded so far)")
+
+        return updated, unresolved
+
+    def lookup(self, provider, address):
+        """Runs in a worker thread; returns None on transient errors so the row is retried next run."""
+        try:
+            return provider.geocode(address)
+        except GeocodingError as e:
+            self.stderr.write(f"Geocoding failed for {address!r}: {e}")
+            return None
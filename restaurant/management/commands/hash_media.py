@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from restaurant.catalogue import invalidate_catalogue
+from restaurant.models import Category, MenuItem
+from restaurant.storage import content_digest, hashed_name, name_digest
+
+
+class Command(BaseCommand):
+    help = (
+        "Give category and menu item images uploaded before content hashing a hashed name, so they can be "
+        "served with an immutable Cache-Control. Old files are kept, so URLs already handed out keep working."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report the new names without copying files or updating rows.")
+
+    def handle(self, *args, **options):
+        renamed = 0
+        for model in (Category, MenuItem):
+            field = model._meta.get_field('image')
+            rows = model.objects.exclude(image='').exclude(image__isnull=True).values_list('pk', 'image')
+            for pk, name in rows.iterator():
+                if name_digest(name):
+                    continue
+                if not field.storage.exists(name):
+                    self.stderr.write(f"{model.__name__} {pk}: {name} is missing, skipped.")
+                    continue
+                with field.storage.open(name) as content:
+                    new_name = hashed_name(name, content_digest(content), field.max_length)
+                    if not options['dry_run']:
+                        new_name = field.storage.save(new_name, content, max_length=field.max_length)
+                if not options['dry_run']:
+                    with transaction.atomic():
+                        model.objects.filter(pk=pk, image=name).update(image=new_name) # update() sends no signals
+                        invalidate_catalogue()
+                self.stdout.write(f"{model.__name__} {pk}: {name} -> {new_name}")
+                renamed += 1
+        self.stdout.write(self.style.SUCCESS(f"{'Would rename' if options['dry_run'] else 'Renamed'} {renamed} images."))
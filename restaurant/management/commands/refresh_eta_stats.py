@@ -0,0 +1,21 @@
+import time
+from django.core.management.base import BaseCommand
+from restaurant.eta import refresh_store_stats
+
+
+class Command(BaseCommand):
+    help = "Fold recent order status transitions into the per-store ETA statistics (StoreDeliveryStats)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=60.0, help="Seconds between refreshes.")
+        parser.add_argument('--once', action='store_true', help="Refresh once and exit (e.g. from cron).")
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            folded = refresh_store_stats()
+            if folded:
+                self.stdout.write(f"ETA statistics: {folded} observations folded in {time.monotonic() - started:.2f}s")
+            if options['once']:
+                break
+            time.sleep(options['interval'])
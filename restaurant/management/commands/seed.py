@@ -0,0 +1,299 @@
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models, transaction
+from django.utils import timezone
+from restaurant.models import (
+    Cart, Category, MenuItem, OptionChoice, OptionGroup, Order, OrderItem, StoreLocation, UserAddress, UserProfile,
+)
+from restaurant.store_index import invalidate_store_index
+
+BATCH_SIZE = 2000 # Rows per bulk_create INSERT; Django lowers it where the database limits query parameters
+CODE_MULTIPLIER = 0x9E3779B1 # Odd, so id -> id * M mod 2**32 is a bijection: seeded order codes never collide
+STREETS = ['Calea Victoriei', 'Bulevardul Unirii', 'Strada Lipscani', 'Soseaua Kiseleff', 'Bulevardul Magheru',
+           'Strada Polona', 'Calea Dorobantilor', 'Strada Tei', 'Bulevardul Iuliu Maniu', 'Calea Mosilor']
+FIRST_NAMES = ['Andrei', 'Maria', 'Ioana', 'Mihai', 'Elena', 'Alex', 'Ana', 'Vlad', 'Irina', 'Radu']
+LAST_NAMES = ['Popescu', 'Ionescu', 'Dumitru', 'Stan', 'Gheorghe', 'Matei', 'Constantin', 'Marin']
+
+
+@contextmanager
+def explicit_timestamps(model, name):
+    """Lets bulk_create keep the value given for an auto_now_add field (historical rows)."""
+    field = model._meta.get_field(name)
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+def next_id(model):
+    return (model.objects.using('default').aggregate(top=models.Max('pk'))['top'] or 0) + 1
+
+
+def money(value):
+    return Decimal(value).quantize(Decimal('0.01'))
+
+
+def coordinate(value):
+    return Decimal(value).quantize(Decimal('0.000001'))
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with deterministic synthetic data (menu, stores, users, carts and "
+        "historical orders) in chunked transactions. Adds to existing data; use a different "
+        "--seed for a second run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=1, help="RNG seed; the same seed produces the same data.")
+        parser.add_argument('--categories', type=int, default=12)
+        parser.add_argument('--menu-items', type=int, default=300)
+        parser.add_argument('--sides', type=int, default=40, help="Non-standalone items offered as options.")
+        parser.add_argument('--stores', type=int, default=8)
+        parser.add_argument('--couriers-per-store', type=int, default=15)
+        parser.add_argument('--users', type=int, default=20000)
+        parser.add_argument('--cart-fraction', type=float, default=0.05, help="Share of users with a non-empty cart.")
+        parser.add_argument('--orders', type=int, default=100000)
+        parser.add_argument('--max-items-per-order', type=int, default=4)
+        parser.add_argument('--voice-fraction', type=float, default=0.1, help="Share of orders placed by phone.")
+        parser.add_argument('--days', type=int, default=365, help="Orders are spread over this many past days.")
+        parser.add_argument('--chunk-size', type=int, default=20000, help="Orders per transaction.")
+
+    def handle(self, *args, **options):
+        if options['menu_items'] <= 0 or options['stores'] <= 0 or options['chunk_size'] <= 0:
+            raise CommandError("--menu-items, --stores and --chunk-size must be positive.")
+        self.options = options
+        self.rng = random.Random(options['seed'])
+        self.prefix = f"seed{options['seed']}"
+        if User.objects.filter(username__startswith=f'{self.prefix}-').exists():
+            raise CommandError(f"Data for --seed {options['seed']} already exists; pick another seed.")
+
+        started = time.monotonic()
+        menu = self.seed_menu()
+        stores, couriers = self.seed_stores()
+        customers = self.seed_customers()
+        self.seed_carts(customers, menu)
+        self.seed_orders(customers, stores, couriers, menu)
+        invalidate_store_index() # bulk_create sends no post_save signals
+        self.stdout.write(self.style.SUCCESS(f"Seeding finished in {time.monotonic() - started:.1f}s."))
+
+    def log(self, message):
+        self.stdout.write(message)
+        self.stdout.flush()
+
+    def seed_menu(self):
+        """Returns [(menu item id, price, [(choice id, price adjustment) per required group])]."""
+        rng, o = self.rng, self.options
+        with transaction.atomic():
+            categories = Category.objects.bulk_create(
+                Category(slug=f'{self.prefix}-category-{i}', title=f'Category {i}') for i in range(o['categories'])
+            )
+            items = MenuItem.objects.bulk_create(
+                MenuItem(
+                    title=f'Dish {i}', price=money(rng.uniform(12, 75)), category=rng.choice(categories),
+                    featured=rng.random() < 0.1, nutritional_info={'calories': rng.randint(250, 1400)},
+                )
+                for i in range(o['menu_items'])
+            )
+            sides = MenuItem.objects.bulk_create(
+                MenuItem(title=f'Side {i}', price=money(rng.uniform(3, 12)), category=rng.choice(categories), is_standalone_item=False)
+                for i in range(o['sides'])
+            )
+
+            groups = []
+            for item in items:
+                for name in rng.sample(['Side', 'Sauce', 'Drink'], rng.randint(0, 2) if sides else 0):
+                    groups.append(OptionGroup(name=name, menu_item=item, min_selection=rng.randint(0, 1), max_selection=1))
+            groups = OptionGroup.objects.bulk_create(groups)
+            choices = OptionChoice.objects.bulk_create(
+                OptionChoice(group=group, item=side, price_adjustment=money(rng.choice([0, 2, 3.5, 5])), is_default=index == 0)
+                for group in groups
+                for index, side in enumerate(rng.sample(sides, min(len(sides), rng.randint(2, 5))))
+            )
+
+        choices_by_group = {}
+        for choice in choices:
+            choices_by_group.setdefault(choice.group_id, []).append((choice.pk, choice.price_adjustment))
+        groups_by_item = {}
+        for group in groups:
+            groups_by_item.setdefault(group.menu_item_id, []).append(choices_by_group.get(group.pk, []))
+        self.log(f"Menu: {len(categories)} categories, {len(items)} items, {len(sides)} sides, {len(groups)} option groups, {len(choices)} choices")
+        return [(item.pk, item.price, groups_by_item.get(item.pk, [])) for item in items]
+
+    def pick_options(self, option_groups):
+        """One choice from each group; what a customer would send."""
+        return [self.rng.choice(group) for group in option_groups if group]
+
+    def random_point(self):
+        return coordinate(self.rng.uniform(44.36, 44.52)), coordinate(self.rng.uniform(26.00, 26.20))
+
+    def seed_stores(self):
+        rng, o = self.rng, self.options
+        password = make_password(None) # Unusable; seeded accounts cannot log in
+        with transaction.atomic():
+            stores = []
+            for i in range(o['stores']):
+                latitude, longitude = self.random_point()
+                stores.append(StoreLocation(
+                    name=f'Socului {self.prefix} #{i}', address=f'{rng.choice(STREETS)} {rng.randint(1, 200)}, Bucuresti',
+                    latitude=latitude, longitude=longitude, delivery_radius_km=Decimal(rng.choice([4, 5, 6, 8])),
+                ))
+            stores = StoreLocation.objects.bulk_create(stores)
+
+            first_id = next_id(User)
+            count = o['stores'] * o['couriers_per_store']
+            User.objects.bulk_create(
+                User(id=first_id + i, username=f'{self.prefix}-courier-{i}', password=password, email=f'{self.prefix}-courier-{i}@example.com')
+                for i in range(count)
+            )
+            couriers = {store.pk: [] for store in stores}
+            profiles = []
+            for i in range(count):
+                store = stores[i % len(stores)]
+                couriers[store.pk].append(first_id + i)
+                profiles.append(UserProfile(user_id=first_id + i, store_location=store, phone_number=f'+40722{i:06d}'))
+            UserProfile.objects.bulk_create(profiles)
+            crew = Group.objects.get_or_create(name='Delivery crew')[0]
+            User.groups.through.objects.bulk_create(
+                User.groups.through(user_id=first_id + i, group_id=crew.pk) for i in range(count)
+            )
+        self.log(f"Stores: {len(stores)} stores, {count} couriers")
+        return stores, couriers
+
+    def seed_customers(self):
+        """Returns [(user id, [(address id, address text, latitude, longitude)])]."""
+        rng, o = self.rng, self.options
+        password = make_password(None)
+        customers = []
+        first_id = next_id(User)
+        first_address_id = next_id(UserAddress)
+        address_id = first_address_id
+        now = timezone.now()
+
+        for start in range(0, o['users'], o['chunk_size']):
+            ids = range(first_id + start, first_id + min(o['users'], start + o['chunk_size']))
+            users, profiles, addresses = [], [], []
+            for user_id in ids:
+                users.append(User(
+                    id=user_id, username=f'{self.prefix}-user-{user_id}', email=f'{self.prefix}-user-{user_id}@example.com',
+                    password=password, first_name=rng.choice(FIRST_NAMES), last_name=rng.choice(LAST_NAMES),
+                    date_joined=now - timedelta(days=rng.randint(0, o['days'])),
+                ))
+                profiles.append(UserProfile(user_id=user_id, phone_number=f'+4073{rng.randint(0, 9999999):07d}'))
+                user_addresses = []
+                for index, nickname in enumerate(['Home', 'Work'][:rng.randint(1, 2)]):
+                    latitude, longitude = self.random_point()
+                    street = f'{rng.choice(STREETS)} {rng.randint(1, 200)}'
+                    addresses.append(UserAddress(
+                        id=address_id, user_id=user_id, nickname=nickname, street_address=street, city='Bucuresti',
+                        postal_code=f'0{rng.randint(10000, 69999)}', latitude=latitude, longitude=longitude, is_default=index == 0,
+                    ))
+                    user_addresses.append((address_id, f'{street}, Bucuresti', latitude, longitude))
+                    address_id += 1
+                customers.append((user_id, user_addresses))
+            with transaction.atomic():
+                User.objects.bulk_create(users)
+                UserProfile.objects.bulk_create(profiles)
+                UserAddress.objects.bulk_create(addresses)
+        self.log(f"Customers: {len(customers)} users, {address_id - first_address_id} addresses")
+        return customers
+
+    def seed_carts(self, customers, menu):
+        rng = self.rng
+        carts, cart_options = [], []
+        cart_id = next_id(Cart)
+        through = Cart.selected_options.through
+        for user_id, _ in customers:
+            if rng.random() >= self.options['cart_fraction']:
+                continue
+            for _ in range(rng.randint(1, 3)):
+                item_id, price, option_groups = rng.choice(menu)
+                options = self.pick_options(option_groups)
+                unit_price = price + sum(adjustment for _, adjustment in options)
+                quantity = rng.randint(1, 3)
+                carts.append(Cart(id=cart_id, user_id=user_id, menuitem_id=item_id, quantity=quantity, unit_price=unit_price, price=unit_price * quantity))
+                cart_options.extend(through(cart_id=cart_id, optionchoice_id=choice_id) for choice_id, _ in options)
+                cart_id += 1
+        with transaction.atomic():
+            Cart.objects.bulk_create(carts, batch_size=5000)
+            through.objects.bulk_create(cart_options, batch_size=5000)
+        self.log(f"Carts: {len(carts)} cart items")
+
+    def seed_orders(self, customers, stores, couriers, menu):
+        rng, o = self.rng, self.options
+        total_orders = o['orders']
+        if total_orders <= 0:
+            return
+
+        now = timezone.now()
+        span = timedelta(days=o['days']).total_seconds()
+        start_at = now - timedelta(days=o['days'])
+        first_order_id, item_id = next_id(Order), next_id(OrderItem)
+        through = OrderItem.selected_options.through
+        store_ids = [store.pk for store in stores]
+        started = time.monotonic()
+        item_total = option_total = 0
+
+        for chunk_start in range(0, total_orders, o['chunk_size']):
+            orders, items, options = [], [], []
+            for index in range(chunk_start, min(total_orders, chunk_start + o['chunk_size'])):
+                order_id = first_order_id + index
+                # Monotonic timestamps: ids follow time, as in production
+                created_at = start_at + timedelta(seconds=(index + rng.random()) * span / total_orders)
+                store_id = rng.choice(store_ids)
+
+                total = Decimal(0)
+                for _ in range(rng.randint(1, o['max_items_per_order'])):
+                    menuitem_id, price, option_groups = rng.choice(menu)
+                    picked = self.pick_options(option_groups)
+                    quantity = rng.randint(1, 3)
+                    line_price = (price + sum(adjustment for _, adjustment in picked)) * quantity
+                    total += line_price
+                    items.append(OrderItem(id=item_id, order_id=order_id, menuitem_id=menuitem_id, quantity=quantity, price=line_price))
+                    options.extend(through(orderitem_id=item_id, optionchoice_id=choice_id) for choice_id, _ in picked)
+                    item_id += 1
+
+                delivering_at = delivered_at = None
+                status = 2 if (now - created_at).total_seconds() > 3 * 3600 else rng.choice([0, 1, 2])
+                # Recent orders would otherwise get transitions in the future
+                if status >= 1:
+                    delivering_at = min(created_at + timedelta(minutes=rng.uniform(8, 35)), now)
+                if status == 2:
+                    delivered_at = min(delivering_at + timedelta(minutes=rng.uniform(6, 40)), now)
+                courier = rng.choice(couriers[store_id]) if couriers[store_id] and (status or rng.random() < 0.5) else None
+
+                if rng.random() < o['voice_fraction'] or not customers:
+                    user_id, address_id, is_voice = None, None, True
+                    name = f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+                    phone = f'+4074{rng.randint(0, 9999999):07d}'
+                    address_text = f'{rng.choice(STREETS)} {rng.randint(1, 200)}, Bucuresti'
+                else:
+                    user_id, addresses = rng.choice(customers)
+                    address_id, address_text, _, _ = rng.choice(addresses)
+                    name, phone, is_voice = '', '', False
+
+                orders.append(Order(
+                    id=order_id, order_code=f'SOC-{(order_id * CODE_MULTIPLIER) % 2 ** 32:08X}', user_id=user_id,
+                    delivery_crew_id=courier, status=status, total=total, created_at=created_at, delivering_at=delivering_at,
+                    delivered_at=delivered_at, customer_name=name, customer_phone=phone, delivery_address=address_text,
+                    is_voice_order=is_voice, store_location_id=store_id, delivery_address_link_id=address_id,
+                ))
+
+            with transaction.atomic(), explicit_timestamps(Order, 'created_at'):
+                Order.objects.bulk_create(orders, batch_size=BATCH_SIZE)
+                OrderItem.objects.bulk_create(items, batch_size=BATCH_SIZE)
+                through.objects.bulk_create(options, batch_size=BATCH_SIZE)
+            item_total += len(items)
+            option_total += len(options)
+            done = chunk_start + len(orders)
+            self.log(f"Orders: {done}/{total_orders} ({done / (time.monotonic() - started):,.0f} orders/s)")
+
+        self.log(f"Orders: {total_orders} orders, {item_total} items, {option_total} selected options")
+
@@ -0,0 +1,24 @@
+import time
+from django.core.management.base import BaseCommand
+from restaurant.email_queue import send_queued_emails
+
+
+class Command(BaseCommand):
+    help = "Send queued emails in batches over a single persistent connection, with retry/backoff."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help="Emails sent per connection.")
+        parser.add_argument('--interval', type=float, default=5.0, help="Seconds to sleep when the queue is empty.")
+        parser.add_argument('--once', action='store_true', help="Send what is currently due and exit.")
+
+    def handle(self, *args, **options):
+        while True:
+            result = send_queued_emails(batch_size=options['batch_size'])
+            if result.sent or result.retried or result.failed:
+                self.stdout.write(
+                    f"Email queue: {result.sent} sent, {result.retried} scheduled for retry, "
+                    f"{result.failed} failed in {result.elapsed:.2f}s"
+                )
+            if options['once']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,136 @@
+"""
+Production media serving.
+
+Uploads are stored under content-hashed names (see storage.py), so a URL
+always names the same bytes: those responses are sent with an immutable
+one-year Cache-Control and clients and CDNs never ask again. Files saved
+before hashing get `no-cache` and are revalidated with their ETag.
+
+With MEDIA_SERVE_HANDOFF the bytes are left to the front server:
+'x-accel-redirect' (nginx; an internal location for
+MEDIA_ACCEL_REDIRECT_PREFIX aliased to MEDIA_ROOT) or 'x-sendfile'
+(Apache mod_xsendfile, lighttpd). Django then only checks the path and sets
+the caching headers. Otherwise the file is streamed from here, with single
+byte-range requests (If-Range aware) answered as 206.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date, parse_etags
+from django.views.decorators.http import require_safe
+from .storage import name_digest
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+BYTE_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeFile:
+    """File object limited to `length` bytes from `start`, for FileResponse."""
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file, self.remaining = file, length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def media_etag(name, stat):
+    digest = name_digest(name)
+    return f'"{digest}"' if digest else f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def parse_range(header, size):
+    """(start, end) inclusive for a single satisfiable byte range, None to send it all, or 'unsatisfiable'."""
+    match = BYTE_RANGE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None # Multiple or malformed ranges: a full 200 is always allowed
+    first, last = match.groups()
+    if first == '': # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return 'unsatisfiable'
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return 'unsatisfiable'
+    return start, end
+
+
+@require_safe
+def serve_media(request, path):
+    """Serves one file under MEDIA_ROOT with caching headers, conditional GETs and byte ranges."""
+    try:
+        full_path = default_storage.path(path)
+    except SuspiciousFileOperation: # Traversal outside MEDIA_ROOT
+        raise Http404
+    try:
+        stat = os.stat(full_path)
+    except (FileNotFoundError, NotADirectoryError):
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+
+    etag = media_etag(path, stat)
+    headers = {
+        'ETag': etag,
+        'Cache-Control': IMMUTABLE if name_digest(path) else REVALIDATE,
+        'Last-Modified': http_date(stat.st_mtime),
+        'Accept-Ranges': 'bytes',
+    }
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match and (etag in parse_etags(if_none_match) or if_none_match.strip() == '*'):
+        response = HttpResponseNotModified()
+        for name, value in headers.items():
+            response[name] = value
+        return response
+
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or 'application/octet-stream'
+    handoff = getattr(settings, 'MEDIA_SERVE_HANDOFF', None)
+    if handoff:
+        response = HttpResponse(content_type=content_type, headers=headers)
+        if handoff == 'x-accel-redirect': # nginx serves the bytes, ranges included
+            prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+            response['X-Accel-Redirect'] = prefix + quote(path)
+        elif handoff == 'x-sendfile':
+            response['X-Sendfile'] = full_path
+        else:
+            raise ValueError(f"Unknown MEDIA_SERVE_HANDOFF {handoff!r}.")
+        return response
+
+    size = stat.st_size
+    byte_range = None
+    range_header = request.headers.get('Range')
+    if range_header and request.headers.get('If-Range', etag) == etag: # A stale If-Range gets the whole new file
+        byte_range = parse_range(range_header, size)
+    if byte_range == 'unsatisfiable':
+        response = HttpResponse(status=416, headers=headers)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    file = open(full_path, 'rb')
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type, headers=headers)
+    else:
+        start, end = byte_range
+        response = FileResponse(RangeFile(file, start, end - start + 1), status=206, content_type=content_type, headers=headers)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    return response
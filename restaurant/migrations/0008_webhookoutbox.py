@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:23
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurant', '0007_auto_20250624_1856'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='order_code',
+            field=models.CharField(db_index=True, editable=False, max_length=12, unique=True),
+        ),
+        migrations.CreateModel(
+            name='WebhookOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payload', models.JSONField(help_text='List of recipients, sent as-is (batched with other events) to N8N_WEBHOOK_URL.')),
+                ('status', models.SmallIntegerField(choices=[(0, 'Pending'), (1, 'Delivered'), (2, 'Failed')], db_index=True, default=0)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('delivered_at', models.DateTimeField(blank=True, null=True)),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='webhook_events', to='restaurant.order')),
+            ],
+        ),
+    ]
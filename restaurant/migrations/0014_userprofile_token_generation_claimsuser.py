@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:34
+
+import django.contrib.auth.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('restaurant', '0013_courierlocation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClaimsUser',
+            fields=[
+            ],
+            options={
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('auth.user',),
+            managers=[
+                ('objects', django.contrib.auth.models.UserManager()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='token_generation',
+            field=models.PositiveIntegerField(default=0, help_text='Bumped when roles change; access tokens with an older generation are rejected.'),
+        ),
+    ]
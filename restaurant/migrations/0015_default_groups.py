@@ -0,0 +1,25 @@
+from django.db import migrations
+
+# Role groups the API checks for (see restaurant/roles.py). Previously created
+# by restaurant/views.py at import time, which queried the database on every
+# process start and failed before the first migrate.
+GROUP_NAMES = ['Manager', 'Delivery crew']
+
+
+def create_groups(apps, schema_editor):
+    Group = apps.get_model('auth', 'Group')
+    for name in GROUP_NAMES:
+        Group.objects.using(schema_editor.connection.alias).get_or_create(name=name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('restaurant', '0014_userprofile_token_generation_claimsuser'),
+    ]
+
+    operations = [
+        # Reversing leaves the groups in place: they may have members by then
+        migrations.RunPython(create_groups, migrations.RunPython.noop),
+    ]
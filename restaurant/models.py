@@ -1,9 +1,10 @@
-from django.db import models
+from django.db import models, transaction
 import uuid
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.core.validators import RegexValidator
+from django.utils import timezone
 
 # Create your models here.
 class Category(models.Model):
@@ -36,6 +37,10 @@ class UserProfile(models.Model):
         blank=True,
         help_text="The home store for a delivery crew member."
     )
+    token_generation = models.PositiveIntegerField(
+        default=0,
+        help_text="Bumped when roles change; access tokens with an older generation are rejected."
+    )
 
     def __str__(self):
         return f"Profile for {self.user.username} - Phone: {self.phone_number or 'N/A'}"
@@ -152,6 +157,9 @@ class Order(models.Model):
     
     # Replaced 'date' with a precise timestamp
     created_at = models.DateTimeField(db_index=True, auto_now_add=True)
+    # Set when the status changes (see signals.py); used for ETA statistics
+    delivering_at = models.DateTimeField(null=True, blank=True)
+    delivered_at = models.DateTimeField(null=True, blank=True)
     
     customer_name = models.CharField(max_length=255, blank=True)
     customer_phone = models.CharField(max_length=20, blank=True, db_index=True)
@@ -182,7 +190,10 @@ class Order(models.Model):
                 if not Order.objects.filter(order_code=code).exists():
                     self.order_code = code
                     break
-        super().save(*args, **kwargs)
+        # Atomic so that rows written by post_save handlers (e.g. the webhook outbox)
+        # commit or roll back together with the order itself
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
     def __str__(self):
         if self.is_voice_order:
@@ -209,8 +220,9 @@ class StoreLocation(models.Model):
     name = models.CharField(max_length=255)
     address = models.TextField()
     phone_number = models.CharField(max_length=20, blank=True, null=True)
-    latitude = models.DecimalField(max_digits=9, decimal_places=6)
-    longitude = models.DecimalField(max_digits=9, decimal_places=6)
+    # Filled in by `manage.py geocode_backfill`; stores without coordinates are left out of delivery lookups
+    latitude = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
+    longitude = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
     delivery_radius_km = models.DecimalField(
         max_digits=4, 
         decimal_places=1, 
@@ -238,6 +250,141 @@ class UserAddress(models.Model):
     def __str__(self):
         return f"{self.nickname} ({self.street_address}) for {self.user.username}"
 
+    @property
+    def formatted_address(self):
+        """Single-line address used for geocoding."""
+        return ", ".join(part for part in (self.street_address, self.postal_code, self.city) if part)
+
     class Meta:
         # Ensures a user cannot have two addresses with the same nickname
-        unique_together = ('user', 'nickname')
\ No newline at end of file
+        unique_together = ('user', 'nickname')
+
+class WebhookOutbox(models.Model):
+    """
+    Outgoing n8n webhook payloads, written in the same transaction as the
+    order change that produced them and delivered later by
+    `manage.py drain_webhook_outbox`.
+    """
+    STATUS_CHOICES = [
+        (0, 'Pending'),
+        (1, 'Delivered'),
+        (2, 'Failed'),
+    ]
+
+    order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True, related_name='webhook_events')
+    payload = models.JSONField(help_text="List of recipients, sent as-is (batched with other events) to N8N_WEBHOOK_URL.")
+    status = models.SmallIntegerField(choices=STATUS_CHOICES, default=0, db_index=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now, db_index=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Webhook event #{self.pk} for order {self.order_id or 'N/A'} ({self.get_status_display()})"
+
+
+class QueuedEmail(models.Model):
+    """
+    Outgoing email persisted by `restaurant.email_queue.QueuedEmailBackend`
+    and sent in batches by `manage.py send_queued_email`.
+    """
+    STATUS_CHOICES = [
+        (0, 'Pending'),
+        (1, 'Sent'),
+        (2, 'Failed'),
+    ]
+
+    subject = models.CharField(max_length=998)
+    body = models.TextField(blank=True)
+    from_email = models.CharField(max_length=255)
+    to = models.JSONField(default=list)
+    cc = models.JSONField(default=list, blank=True)
+    bcc = models.JSONField(default=list, blank=True)
+    reply_to = models.JSONField(default=list, blank=True)
+    headers = models.JSONField(default=dict, blank=True)
+    alternatives = models.JSONField(default=list, blank=True, help_text="[[content, mimetype], ...], e.g. the HTML part.")
+    attachments = models.JSONField(default=list, blank=True, help_text="[[filename, base64 content, mimetype], ...]")
+    status = models.SmallIntegerField(choices=STATUS_CHOICES, default=0, db_index=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now, db_index=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Email '{self.subject}' to {', '.join(self.to)} ({self.get_status_display()})"
+
+
+class GeocodeCache(models.Model):
+    """
+    Geocoding results keyed by normalised address (see restaurant.geocoding).
+    Null coordinates record "address not found" and expire sooner.
+    """
+    normalized_address = models.CharField(max_length=512, unique=True)
+    latitude = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
+    longitude = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
+    provider = models.CharField(max_length=50)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.normalized_address} -> ({self.latitude}, {self.longitude})"
+
+
+class StoreDeliveryStats(models.Model):
+    """
+    Rolling (exponentially weighted) per-store durations used for delivery ETAs.
+    Derived from order status timestamps by `manage.py refresh_eta_stats`; each worker reloads them periodically.
+    """
+    store = models.OneToOneField(StoreLocation, on_delete=models.CASCADE, related_name='delivery_stats')
+    prep_seconds = models.FloatField(help_text="Average time from order creation to 'Delivering'.")
+    delivery_seconds = models.FloatField(help_text="Average time from 'Delivering' to 'Delivered'.")
+    speed_kmh = models.FloatField(help_text="Average courier speed, store to delivery address.")
+    samples = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Delivery stats for {self.store.name}"
+
+
+
+class CourierLocation(models.Model):
+    """
+    Sampled GPS history of delivery crew. Live positions are kept in memory
+    by restaurant.tracking; only every Nth ping is flushed here in bulk.
+    """
+    courier = models.ForeignKey(User, on_delete=models.CASCADE, related_name='locations')
+    latitude = models.DecimalField(max_digits=9, decimal_places=6)
+    longitude = models.DecimalField(max_digits=9, decimal_places=6)
+    recorded_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [models.Index(fields=['courier', '-recorded_at'])]
+
+    def __str__(self):
+        return f"{self.courier.username} at ({self.latitude}, {self.longitude}) on {self.recorded_at:%Y-%m-%d %H:%M:%S}"
+
+
+class ClaimsUser(User):
+    """
+    A User built from access-token claims by ClaimsJWTAuthentication. Only the
+    id and permission flags are set; reading any other field loads the rest
+    of the row in a single query.
+    """
+
+    class Meta:
+        proxy = True
+
+    @classmethod
+    def from_claims(cls, user_id, roles, store_id, is_superuser, is_staff, is_active):
+        user = cls.from_db(None, ['id', 'is_superuser', 'is_staff', 'is_active'], [user_id, is_superuser, is_staff, is_active])
+        user._roles = frozenset(roles) # Read by restaurant.roles.get_roles
+        user.store_id = store_id
+        return user
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        # Load every deferred field at once instead of one query per field accessed
+        deferred = self.get_deferred_fields()
+        if fields is not None and deferred and set(fields) <= deferred:
+            fields = list(deferred)
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
@@ -0,0 +1,167 @@
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import WebhookOutbox
+
+logger = logging.getLogger(__name__)
+
+PENDING, DELIVERED, FAILED = 0, 1, 2
+
+# Cumulative counters for this worker process (batches, delivered, retried, failed, ...)
+METRICS = Counter()
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def get_session():
+    """Returns a process-wide requests.Session so delivery reuses pooled connections."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=0) # Retries are ours, with backoff
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+
+def retry_delay(attempts, base=None, cap=None):
+    """Exponential backoff with jitter for the given number of failed attempts."""
+    base = base if base is not None else _setting('OUTBOX_BACKOFF_BASE_SECONDS', 5)
+    cap = cap if cap is not None else _setting('OUTBOX_BACKOFF_MAX_SECONDS', 3600)
+    delay = min(cap, base * (2 ** max(attempts - 1, 0)))
+    return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+
+@dataclass
+class DrainResult:
+    batches: int = 0
+    delivered: int = 0
+    retried: int = 0
+    failed: int = 0
+    elapsed: float = 0.0
+
+
+def claim_due(model, batch_size):
+    """
+    Leases up to batch_size due rows of a queue model (status/next_attempt_at)
+    to this worker by pushing their next_attempt_at forward, so concurrent
+    workers do not send them twice.
+    """
+    now = timezone.now()
+    lease_until = now + timedelta(seconds=_setting('OUTBOX_LEASE_SECONDS', 60))
+    with transaction.atomic():
+        rows = list(
+            model.objects.select_for_update(skip_locked=True)
+            .filter(status=PENDING, next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'pk')[:batch_size]
+        )
+        if rows:
+            model.objects.filter(pk__in=[row.pk for row in rows]).update(next_attempt_at=lease_until)
+    return rows
+
+
+def _post(session, url, events):
+    """Sends the concatenated payloads of events in one request. Returns (ok, error, retryable)."""
+    import requests
+
+    payload = []
+    for event in events:
+        payload.extend(event.payload)
+
+    try:
+        response = session.post(url, json=payload, timeout=_setting('OUTBOX_HTTP_TIMEOUT', 10))
+    except requests.exceptions.RequestException as e:
+        return False, str(e), True
+
+    if response.ok:
+        return True, '', False
+    # 4xx means this payload will not succeed as-is; 5xx and 429 are worth retrying
+    retryable = response.status_code >= 500 or response.status_code == 429
+    return False, f"HTTP {response.status_code}: {response.text[:500]}", retryable
+
+
+def _mark_delivered(events, result):
+    WebhookOutbox.objects.filter(pk__in=[event.pk for event in events]).update(
+        status=DELIVERED, delivered_at=timezone.now(), last_error=''
+    )
+    result.delivered += len(events)
+
+
+def _mark_failed_attempt(events, error, result):
+    max_attempts = _setting('OUTBOX_MAX_ATTEMPTS', 8)
+    now = timezone.now()
+    for event in events:
+        event.attempts += 1
+        event.last_error = error
+        if event.attempts >= max_attempts:
+            event.status = FAILED
+            result.failed += 1
+            logger.error("Webhook event %s for order %s gave up after %s attempts: %s",
+                         event.pk, event.order_id, event.attempts, error)
+        else:
+            event.next_attempt_at = now + retry_delay(event.attempts)
+            result.retried += 1
+    WebhookOutbox.objects.bulk_update(events, ['attempts', 'last_error', 'status', 'next_attempt_at'])
+
+
+def drain_outbox(batch_size=50, max_batches=None, session=None, webhook_url=None):
+    """
+    Delivers due outbox events, batch_size events per HTTP request.
+    Stops when nothing is due (or after max_batches) and returns a DrainResult.
+    """
+    webhook_url = webhook_url or _setting('N8N_WEBHOOK_URL', None)
+    result = DrainResult()
+    if not webhook_url:
+        logger.warning("N8N_WEBHOOK_URL not configured in settings; outbox not drained.")
+        return result
+
+    session = session or get_session()
+    started = time.monotonic()
+
+    while max_batches is None or result.batches < max_batches:
+        events = claim_due(WebhookOutbox, batch_size)
+        if not events:
+            break
+        result.batches += 1
+
+        ok, error, retryable = _post(session, webhook_url, events)
+        if ok:
+            _mark_delivered(events, result)
+        elif not retryable and len(events) > 1:
+            # Rejected batch: resend events one by one so a single bad payload cannot block the rest
+            for event in events:
+                ok, error, _ = _post(session, webhook_url, [event])
+                if ok:
+                    _mark_delivered([event], result)
+                else:
+                    _mark_failed_attempt([event], error, result)
+        else:
+            _mark_failed_attempt(events, error, result)
+
+    result.elapsed = time.monotonic() - started
+    METRICS.update({
+        'batches': result.batches,
+        'delivered': result.delivered,
+        'retried': result.retried,
+        'failed': result.failed,
+    })
+    METRICS['delivery_seconds'] += result.elapsed
+    return result
@@ -1,15 +1,28 @@
 from rest_framework import permissions
+from rest_framework_api_key.permissions import HasAPIKey
+from .api_keys import verified_keys
+from .roles import DELIVERY_CREW, MANAGER, has_role, is_manager
 
 class IsManager(permissions.BasePermission):
     """
     Permission class to allow only users in the 'Manager' group.
     """
     def has_permission(self, request, view):
-        return request.user.groups.filter(name='Manager').exists() or request.user.is_superuser # Include is_superuser for admin access
+        return is_manager(request.user) # Include is_superuser for admin access
 
 class IsDeliveryCrew(permissions.BasePermission):
     """
     Permission class to allow only users in the 'Delivery crew' group.
     """
     def has_permission(self, request, view):
-        return request.user.groups.filter(name='Delivery crew').exists() or request.user.groups.filter(name='Manager').exists() or request.user.is_superuser # Delivery crew, Managers, and Admin allowed
\ No newline at end of file
+        return has_role(request.user, DELIVERY_CREW, MANAGER) or request.user.is_superuser # Delivery crew, Managers, and Admin allowed
+
+class CachedHasAPIKey(HasAPIKey):
+    """
+    HasAPIKey that skips the password hasher for keys verified recently (see restaurant/api_keys.py).
+    """
+    def has_permission(self, request, view):
+        key = self.get_key(request)
+        if not key:
+            return False
+        return verified_keys.is_valid(key, self.model)
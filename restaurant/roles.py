@@ -0,0 +1,65 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+MANAGER = 'Manager'
+DELIVERY_CREW = 'Delivery crew'
+
+
+def _cache_key(user_id):
+    return f'user_roles:{user_id}'
+
+
+def get_roles(user):
+    """
+    The user's group names as a frozenset. Loaded at most once per request
+    (memoised on the user object, which lives for one request) and shared
+    across requests through the cache for ROLE_CACHE_TTL seconds. Changes
+    delete the cached entry (see invalidate_roles), which only reaches other
+    workers through a shared cache; hence the short default TTL otherwise.
+    """
+    if user is None or not user.is_authenticated:
+        return frozenset()
+
+    roles = getattr(user, '_roles', None)
+    if roles is None:
+        key = _cache_key(user.pk)
+        roles = cache.get(key)
+        if roles is None:
+            roles = frozenset(user.groups.values_list('name', flat=True))
+            cache.set(key, roles, getattr(settings, 'ROLE_CACHE_TTL', 5))
+        user._roles = roles
+    return roles
+
+
+async def aget_roles(user):
+    """get_roles() for async views, through the async cache and ORM APIs."""
+    if user is None or not user.is_authenticated:
+        return frozenset()
+
+    roles = getattr(user, '_roles', None)
+    if roles is None:
+        key = _cache_key(user.pk)
+        roles = await cache.aget(key)
+        if roles is None:
+            roles = frozenset([name async for name in user.groups.values_list('name', flat=True)])
+            await cache.aset(key, roles, getattr(settings, 'ROLE_CACHE_TTL', 5))
+        user._roles = roles
+    return roles
+
+
+def has_role(user, *names):
+    """Whether the user is in any of the given groups."""
+    return not get_roles(user).isdisjoint(names)
+
+
+def is_manager(user):
+    """Managers and superusers."""
+    return user.is_superuser or has_role(user, MANAGER)
+
+
+def invalidate_roles(user_ids):
+    """Drops cached roles once the surrounding transaction commits."""
+    keys = [_cache_key(user_id) for user_id in user_ids]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
@@ -1,13 +1,25 @@
+import logging
 from rest_framework import serializers
+from rest_framework.exceptions import AuthenticationFailed
 from django.db import transaction
 from .models import Category, MenuItem, Cart, Order, OrderItem, OptionGroup, OptionChoice
 from django.contrib.auth.models import User, Group
 from django.contrib.auth import get_user_model
 from djoser.serializers import UserCreateSerializer as BaseUserCreateSerializer
+from datetime import timedelta
+from django.utils import timezone
+from .eta import estimate_eta
+from .instrumentation import TimedSerializerMixin
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from .authentication import role_claims_enabled, set_role_claims
 
 
 # restaurant/serializers.py
 
+logger = logging.getLogger(__name__)
+
 User = get_user_model()
 
 class UserCreateSerializer(BaseUserCreateSerializer):
@@ -48,11 +60,11 @@ class UserCreateSerializer(BaseUserCreateSerializer):
                 user.userprofile.save()
             else:
                 # This is a good fallback/log for debugging.
-                print(f"!!! CRITICAL: UserProfile not found for {user.email} immediately after creation.")
+                logger.critical("UserProfile not found for user %s immediately after creation", user.pk)
             
         return user
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(TimedSerializerMixin, serializers.ModelSerializer):
     image_url = serializers.SerializerMethodField()
 
     class Meta:
@@ -66,7 +78,7 @@ class CategorySerializer(serializers.ModelSerializer):
             return request.build_absolute_uri(obj.image.url)
         return None
 
-class MenuItemSerializer(serializers.ModelSerializer):
+class MenuItemSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     category = CategorySerializer(read_only=True)
     category_id = serializers.PrimaryKeyRelatedField(queryset=Category.objects.all(), source='category', write_only=True)
     image_url = serializers.SerializerMethodField()
@@ -109,7 +121,7 @@ class MenuItemDetailSerializer(MenuItemSerializer):
         fields = MenuItemSerializer.Meta.fields + ['option_groups']
 
 
-class CartItemSerializer(serializers.ModelSerializer):
+class CartItemSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     menuitem = MenuItemSerializer(read_only=True)
     menuitem_id = serializers.PrimaryKeyRelatedField(queryset=MenuItem.objects.all(), source='menuitem', write_only=True)
     price = serializers.DecimalField(max_digits=6, decimal_places=2, read_only=True)
@@ -124,7 +136,7 @@ class CartItemSerializer(serializers.ModelSerializer):
         fields = ['id', 'menuitem', 'menuitem_id', 'quantity', 'unit_price', 'price', 'selected_options']
         read_only_fields = ['unit_price', 'price']
 
-class CartSerializer(serializers.ModelSerializer):
+class CartSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     cartitem_set = CartItemSerializer(many=True, read_only=True, source='cart_set') # Use related_name if you set it in model
 
     class Meta:
@@ -140,7 +152,12 @@ class OrderItemSerializer(serializers.ModelSerializer):
         model = OrderItem
         fields = ['id', 'order', 'menuitem', 'menuitem_id', 'quantity', 'price', 'selected_options']
 
-class OrderSerializer(serializers.ModelSerializer):
+def order_date(created_at):
+    """What the removed Order.date (a DateField) held: the local creation date, as 'YYYY-MM-DD'."""
+    return timezone.localdate(created_at).isoformat() if created_at else None
+
+
+class OrderSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     user = serializers.PrimaryKeyRelatedField(queryset=User.objects.all()) # Or UserSerializer if you create one
     delivery_crew = serializers.PrimaryKeyRelatedField(queryset=User.objects.filter(groups__name='Delivery crew'), allow_null=True, required=False) # Filter Delivery Crew users
     order_items = OrderItemSerializer(many=True, read_only=True) # Use related_name
@@ -148,23 +165,26 @@ class OrderSerializer(serializers.ModelSerializer):
     customer_phone = serializers.CharField(read_only=True, allow_blank=True)
     delivery_address = serializers.CharField(read_only=True, allow_blank=True)
     is_voice_order = serializers.BooleanField(read_only=True)
+    date = serializers.SerializerMethodField() # The former Order.date, kept for existing clients; see created_at
+    eta = serializers.SerializerMethodField() # Estimated delivery time; clients can poll less often as it approaches
 
     class Meta:
         model = Order
         fields = [
-            'id', 'user', 'delivery_crew', 'status', 'total', 'order_items', 'is_voice_order', 'date','customer_name', 'customer_phone', 'delivery_address',]
+            'id', 'user', 'delivery_crew', 'status', 'total', 'order_items', 'is_voice_order', 'date', 'created_at','customer_name', 'customer_phone', 'delivery_address', 'eta',]
+
+    def get_date(self, obj):
+        return order_date(obj.created_at)
+
+    def get_eta(self, obj):
+        eta = estimate_eta(obj)
+        return serializers.DateTimeField().to_representation(eta) if eta else None
 
 class DirectOrderItemInputSerializer(serializers.Serializer):
     """Serializer for validating items within a direct order request."""
     menuitem_id = serializers.IntegerField(min_value=1)
     quantity = serializers.IntegerField(min_value=1)
 
-    def validate_menuitem_id(self, value):
-        """Check if the menu item exists."""
-        if not MenuItem.objects.filter(pk=value).exists():
-            raise serializers.ValidationError(f"MenuItem with id {value} does not exist.")
-        return value
-
 class DirectOrderInputSerializer(serializers.Serializer):
     """Serializer for validating the entire direct order request payload."""
     items = DirectOrderItemInputSerializer(many=True, required=True, allow_empty=False)
@@ -172,12 +192,96 @@ class DirectOrderInputSerializer(serializers.Serializer):
     customer_phone = serializers.CharField(max_length=20, required=True, allow_blank=False)
     delivery_address = serializers.CharField(required=True, allow_blank=False)
 
-class UserSerializer(serializers.ModelSerializer): # Basic User Serializer for registration/display
+    def validate_items(self, value):
+        """Check that every menu item exists, with one query for the whole order."""
+        existing = set(MenuItem.objects.filter(pk__in={item['menuitem_id'] for item in value}).values_list('pk', flat=True))
+        errors = [
+            {} if item['menuitem_id'] in existing
+            else {'menuitem_id': [f"MenuItem with id {item['menuitem_id']} does not exist."]}
+            for item in value
+        ]
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return value
+
+class CoordinateInputSerializer(serializers.Serializer):
+    latitude = serializers.DecimalField(max_digits=9, decimal_places=6, min_value=-90, max_value=90)
+    longitude = serializers.DecimalField(max_digits=9, decimal_places=6, min_value=-180, max_value=180)
+
+
+class DeliveryEligibilityInputSerializer(serializers.Serializer):
+    """Serializer for validating a batch delivery-eligibility check. At least one list is required."""
+    MAX_POINTS = 100
+
+    address_ids = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False)
+    addresses = serializers.ListField(child=serializers.CharField(max_length=500), required=False)
+    coordinates = CoordinateInputSerializer(many=True, required=False)
+
+    def validate(self, attrs):
+        total = sum(len(attrs.get(key, [])) for key in ('address_ids', 'addresses', 'coordinates'))
+        if total == 0:
+            raise serializers.ValidationError("Provide at least one of address_ids, addresses or coordinates.")
+        if total > self.MAX_POINTS:
+            raise serializers.ValidationError(f"At most {self.MAX_POINTS} locations can be checked per request.")
+        return attrs
+
+class CourierPingSerializer(serializers.Serializer):
+    # Floats: devices report more decimals than the 6 stored, and Decimal parsing would reject them
+    latitude = serializers.FloatField(min_value=-90, max_value=90)
+    longitude = serializers.FloatField(min_value=-180, max_value=180)
+    recorded_at = serializers.DateTimeField(required=False) # Device time; defaults to the time of receipt
+
+    def validate_recorded_at(self, value):
+        if value > timezone.now() + timedelta(seconds=60): # Allow a little clock skew
+            raise serializers.ValidationError("recorded_at cannot be in the future.")
+        return value
+
+
+class CourierPingBatchSerializer(serializers.Serializer):
+    """Serializer for a batch of GPS pings buffered by the courier app."""
+    MAX_PINGS = 500
+
+    pings = CourierPingSerializer(many=True, allow_empty=False)
+
+    def validate_pings(self, value):
+        if len(value) > self.MAX_PINGS:
+            raise serializers.ValidationError(f"At most {self.MAX_PINGS} pings can be sent per request.")
+        return value
+
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer): # Basic User Serializer for registration/display
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'first_name', 'last_name'] # Include 'id'
 
-class GroupSerializer(serializers.ModelSerializer):
+class GroupSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Group
-        fields = ['id', 'name'] # We'll expose 'id' and 'name' for groups
\ No newline at end of file
+        fields = ['id', 'name'] # We'll expose 'id' and 'name' for groups
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Adds role claims to issued tokens when JWT_ROLE_CLAIMS is on (see restaurant/authentication.py)."""
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        if role_claims_enabled():
+            set_role_claims(token, user) # Copied into the access token
+        return token
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    """Re-reads role claims on refresh, so a client with stale claims recovers by refreshing."""
+
+    def validate(self, attrs):
+        try:
+            data = super().validate(attrs) # Rejects inactive users, but lets DoesNotExist through for deleted ones
+        except User.DoesNotExist:
+            raise AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+        if role_claims_enabled():
+            access = AccessToken(data['access'], verify=False) # Just issued above
+            user = User.objects.filter(**{jwt_settings.USER_ID_FIELD: access[jwt_settings.USER_ID_CLAIM]}).first()
+            if user is None or not jwt_settings.USER_AUTHENTICATION_RULE(user): # Deleted or deactivated meanwhile
+                raise AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+            data['access'] = str(set_role_claims(access, user))
+        return data
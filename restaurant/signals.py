@@ -1,9 +1,19 @@
-import requests
-from django.db.models.signals import post_save, pre_save
+import logging
+from django.db.models.signals import m2m_changed, post_save, pre_save, post_delete, pre_delete
 from django.dispatch import receiver
-from django.conf import settings
-from .models import Order, UserProfile
-from django.contrib.auth.models import User
+from .models import Category, ClaimsUser, MenuItem, OptionChoice, OptionGroup, Order, StoreLocation, UserProfile, WebhookOutbox
+from .store_index import invalidate_store_index
+from .catalogue import invalidate_catalogue
+from .eta import record_transition
+from django.utils import timezone
+from django.contrib.auth.models import Group, User
+from .roles import invalidate_roles
+from .api_keys import invalidate_verified_keys
+from rest_framework_api_key.models import APIKey
+from .authentication import bump_token_generation, forget_token_generation, role_claims_enabled
+from .structured_logging import bind
+
+logger = logging.getLogger(__name__)
 
 @receiver(pre_save, sender=Order)
 def store_previous_order_status(sender, instance, **kwargs):
@@ -15,8 +25,29 @@ def store_previous_order_status(sender, instance, **kwargs):
     else:
         instance._previous_status = None
 
+@receiver(pre_save, sender=Order)
+def stamp_order_status_transition(sender, instance, **kwargs):
+    # Record when the order left the store and when it arrived (used for ETAs)
+    if instance.status == instance._previous_status:
+        return
+    now = timezone.now()
+    if instance.status == 1 and not instance.delivering_at:
+        instance.delivering_at = now
+    elif instance.status == 2 and not instance.delivered_at:
+        instance.delivered_at = now
+
+@receiver(post_save, sender=Order)
+def update_eta_statistics(sender, instance, created, **kwargs):
+    if instance.status != instance._previous_status:
+        record_transition(instance) # Applied once the transaction commits
+
 @receiver(post_save, sender=Order)
 def order_status_changed(sender, instance, created, **kwargs):
+    with bind(order_id=instance.pk):
+        queue_delivery_sms(instance, created)
+
+
+def queue_delivery_sms(instance, created):
     # Check if the status has changed to 'Delivering' (status code 1)
     # and it was not 'Delivering' before (or it's a new order set to 'Delivering')
     if instance.status == 1 and (created or instance._previous_status != 1):
@@ -47,16 +78,16 @@ def order_status_changed(sender, instance, created, **kwargs):
             # For demonstration, we'll proceed if we have a name,
             # but Twilio will fail without a valid phone number.
             if not phone_number:
-                print(f"Warning: Phone number not found for user {customer_name} for order {instance.pk}")
+                logger.warning("Phone number not found for user %s", customer_name)
                 # Depending on requirements, you might want to return here if phone is mandatory
                 # return 
         else:
             # This case should ideally not happen if an order always has a user or is a voice order
-            print(f"Warning: Order {instance.pk} has no user and is not a voice order. Cannot send SMS.")
+            logger.warning("Order has no user and is not a voice order; cannot send SMS")
             return
 
         if not phone_number:
-            print(f"Critical: No phone number for order {instance.pk} to send SMS. Name: {customer_name}")
+            logger.error("No phone number to send the SMS to (customer %s)", customer_name)
             return # Cannot send SMS without a phone number
 
         payload = [
@@ -65,22 +96,84 @@ def order_status_changed(sender, instance, created, **kwargs):
                 "phone_number": phone_number
             }
         ]
-        
-        webhook_url = getattr(settings, 'N8N_WEBHOOK_URL', None)
-        if webhook_url:
-            try:
-                print(f"Sending webhook for order {instance.pk} to {webhook_url} with payload: {payload}")
-                response = requests.post(webhook_url, json=payload, timeout=10)
-                response.raise_for_status()  # Raise an exception for HTTP errors (4xx or 5xx)
-                print(f"Webhook for order {instance.pk} sent successfully. Status: {response.status_code}")
-            except requests.exceptions.RequestException as e:
-                print(f"Error sending webhook for order {instance.pk}: {e}")
-        else:
-            print("N8N_WEBHOOK_URL not configured in settings.") 
+
+        # Queue the webhook in the same transaction as the order change;
+        # `manage.py drain_webhook_outbox` delivers it outside the request.
+        WebhookOutbox.objects.create(order=instance, payload=payload)
 
 @receiver(post_save, sender=User)
 def create_or_update_user_profile(sender, instance, created, **kwargs):
     if created:
         UserProfile.objects.create(user=instance)
     else:
-        UserProfile.objects.get_or_create(user=instance) 
\ No newline at end of file
+        UserProfile.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=StoreLocation)
+@receiver(post_delete, sender=StoreLocation)
+def store_location_changed(sender, instance, **kwargs):
+    invalidate_store_index()
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=MenuItem)
+@receiver(post_delete, sender=MenuItem)
+@receiver(post_save, sender=OptionGroup)
+@receiver(post_delete, sender=OptionGroup)
+@receiver(post_save, sender=OptionChoice)
+@receiver(post_delete, sender=OptionChoice)
+def catalogue_changed(sender, instance, **kwargs):
+    invalidate_catalogue() # Cached async catalogue responses (see async_views.py)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def user_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # Covers admin and shell changes; `reverse` means the change was made from the Group side
+    if action in ('post_add', 'post_remove'):
+        user_ids = list(pk_set) if reverse else [instance.pk]
+    elif action == 'pre_clear':
+        user_ids = list(instance.user_set.values_list('pk', flat=True)) if reverse else [instance.pk]
+    else:
+        return
+    invalidate_roles(user_ids)
+    bump_token_generation(user_ids) # Role claims in issued access tokens are now stale
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    # Renaming or deleting a group changes the role names of all its members
+    if instance.pk:
+        user_ids = list(instance.user_set.values_list('pk', flat=True))
+        invalidate_roles(user_ids)
+        bump_token_generation(user_ids)
+
+
+@receiver(pre_save, sender=User)
+@receiver(pre_save, sender=ClaimsUser) # Proxy saves are sent with the proxy as sender
+def revoke_claims_on_user_flags_change(sender, instance, **kwargs):
+    # Deactivation and superuser/staff changes must not wait for tokens to expire
+    if not role_claims_enabled() or instance._state.adding:
+        return
+    previous = User.objects.filter(pk=instance.pk).values_list('is_active', 'is_superuser', 'is_staff').first()
+    if previous and previous != (instance.is_active, instance.is_superuser, instance.is_staff):
+        bump_token_generation([instance.pk])
+
+
+@receiver(pre_save, sender=UserProfile)
+def revoke_claims_on_store_change(sender, instance, **kwargs):
+    # The home store is a claim too
+    if not role_claims_enabled() or instance._state.adding:
+        return
+    previous = UserProfile.objects.filter(pk=instance.pk).values_list('store_location_id', 'token_generation').first()
+    if previous and previous[0] != instance.store_location_id:
+        instance.token_generation = previous[1] + 1
+        forget_token_generation([instance.user_id])
+
+
+@receiver(post_save, sender=APIKey)
+@receiver(post_delete, sender=APIKey)
+def api_key_changed(sender, instance, **kwargs):
+    # Revocation, expiry changes and deletion must reach every process's verified-key cache
+    invalidate_verified_keys()
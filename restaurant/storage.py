@@ -0,0 +1,57 @@
+import hashlib
+import os
+import re
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+# 'menu_items/ciorba.3f2a9c1b7e4d.png': the content hash is part of every uploaded file's name
+HASHED_NAME = re.compile(r'\.(?P<digest>[0-9a-f]{12})(?:\.[^./]+)?$')
+
+
+def content_digest(content):
+    """First 12 hex digits of the SHA-256 of a File, read in chunks."""
+    sha = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks():
+        sha.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return sha.hexdigest()[:12]
+
+
+def hashed_name(name, digest, max_length=None):
+    """'dir/file.ext' -> 'dir/file.<digest>.ext', shortening the file name to fit max_length."""
+    match = HASHED_NAME.search(name)
+    if match: # Re-saving a hashed file: replace the old digest
+        name = name[:match.start()] + name[match.end('digest'):]
+    root, ext = os.path.splitext(name)
+    suffix = f'.{digest}{ext}'
+    if max_length and len(root) + len(suffix) > max_length:
+        root = root[:max_length - len(suffix)]
+    return root + suffix
+
+
+def name_digest(name):
+    """The content hash embedded in a stored name, or None for files saved before hashing."""
+    match = HASHED_NAME.search(name)
+    return match.group('digest') if match else None
+
+
+class HashedMediaStorage(FileSystemStorage):
+    """
+    FileSystemStorage that stores uploads under a name containing a hash of
+    their content, so a file's URL changes whenever its bytes do and can be
+    cached forever (see media.serve_media). Uploading identical content
+    again reuses the existing file.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = hashed_name(name, content_digest(content), max_length)
+        if self.exists(name):
+            return name # Same name, same hash: the same bytes are already stored
+        return super().save(name, content, max_length=max_length)
@@ -0,0 +1,202 @@
+import math
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from .models import StoreLocation
+
+# Mean earth radius used by geopy's great_circle, so distances match the previous implementation
+EARTH_RADIUS_KM = 6371.009
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+# Grid cell size in degrees (~11 km of latitude) for "which stores cover this point" lookups
+CELL_DEGREES = 0.1
+# Stores whose delivery area spans more cells than this are checked on every lookup instead
+MAX_CELLS_PER_STORE = 10000
+
+VERSION_CACHE_KEY = 'store_index:version'
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km between two points given in degrees."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _cell(lat, lon):
+    return (math.floor(lat / CELL_DEGREES), math.floor(lon / CELL_DEGREES))
+
+
+class StoreIndex:
+    """
+    Immutable snapshot of the active stores with coordinates pre-converted to
+    radians, plus a lat/lon grid mapping each cell to the stores whose
+    delivery radius reaches into it.
+    """
+
+    def __init__(self, stores):
+        self.stores = list(stores)
+        self._lat = [math.radians(float(store.latitude)) for store in self.stores]
+        self._lon = [math.radians(float(store.longitude)) for store in self.stores]
+        self._cos_lat = [math.cos(lat) for lat in self._lat]
+        self._radius_km = [float(store.delivery_radius_km) for store in self.stores]
+
+        self._grid = {}
+        self._wide = [] # Indexes of stores with very large delivery areas
+        for i, store in enumerate(self.stores):
+            self._add_to_grid(i, float(store.latitude), float(store.longitude), self._radius_km[i])
+
+    def _add_to_grid(self, i, lat, lon, radius_km):
+        lat_span = radius_km / KM_PER_DEGREE
+        # Use the widest longitude span within the covered latitude band
+        max_abs_lat = min(89.9, abs(lat) + lat_span)
+        lon_span = radius_km / (KM_PER_DEGREE * math.cos(math.radians(max_abs_lat)))
+
+        min_cell = _cell(lat - lat_span, lon - lon_span)
+        max_cell = _cell(lat + lat_span, lon + lon_span)
+        cells = (max_cell[0] - min_cell[0] + 1) * (max_cell[1] - min_cell[1] + 1)
+        if cells > MAX_CELLS_PER_STORE:
+            self._wide.append(i)
+            return
+        for x in range(min_cell[0], max_cell[0] + 1):
+            for y in range(min_cell[1], max_cell[1] + 1):
+                self._grid.setdefault((x, y), []).append(i)
+
+    def __len__(self):
+        return len(self.stores)
+
+    def _distance_km(self, i, lat, lon, cos_lat):
+        d_lat = self._lat[i] - lat
+        d_lon = self._lon[i] - lon
+        a = math.sin(d_lat / 2) ** 2 + cos_lat * self._cos_lat[i] * math.sin(d_lon / 2) ** 2
+        return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+    def distances(self, latitude, longitude):
+        """Distance in km from the point to every indexed store, in index order."""
+        lat, lon = math.radians(float(latitude)), math.radians(float(longitude))
+        cos_lat = math.cos(lat)
+        return [self._distance_km(i, lat, lon, cos_lat) for i in range(len(self.stores))]
+
+    def covering(self, latitude, longitude):
+        """All stores whose delivery radius includes the point, nearest first, as (store, distance_km)."""
+        latitude, longitude = float(latitude), float(longitude)
+        lat, lon = math.radians(latitude), math.radians(longitude)
+        cos_lat = math.cos(lat)
+
+        matches = []
+        for i in self._grid.get(_cell(latitude, longitude), []) + self._wide:
+            distance = self._distance_km(i, lat, lon, cos_lat)
+            if distance <= self._radius_km[i]:
+                matches.append((distance, i))
+        matches.sort()
+        return [(self.stores[i], distance) for distance, i in matches]
+
+    def _nearest(self, latitude, longitude, candidates):
+        """nearest() given the stores that may cover the point (its grid cell's plus the wide ones)."""
+        lat, lon = math.radians(latitude), math.radians(longitude)
+        cos_lat = math.cos(lat)
+        best = None
+        for i in candidates:
+            distance = self._distance_km(i, lat, lon, cos_lat)
+            if distance <= self._radius_km[i] and (best is None or (distance, i) < best):
+                best = (distance, i)
+        if best is not None:
+            return self.stores[best[1]], best[0], True
+
+        distances = [self._distance_km(i, lat, lon, cos_lat) for i in range(len(self.stores))]
+        i = min(range(len(distances)), key=distances.__getitem__)
+        return self.stores[i], distances[i], False
+
+    def nearest(self, latitude, longitude):
+        """
+        The nearest store that delivers to the point or, if none does, the
+        nearest store overall. Returns (store, distance_km, can_deliver).
+        """
+        if not self.stores:
+            return None, None, False
+        latitude, longitude = float(latitude), float(longitude)
+        return self._nearest(latitude, longitude, self._grid.get(_cell(latitude, longitude), []) + self._wide)
+
+    def nearest_many(self, points):
+        """
+        nearest() for a list of (latitude, longitude) points; None entries
+        yield (None, None, False). Points are grouped by grid cell, so each
+        cell's candidate stores are gathered once, and repeated points are
+        resolved once.
+        """
+        results = [(None, None, False)] * len(points)
+        if not self.stores:
+            return results
+
+        by_cell = {}
+        for position, (latitude, longitude) in enumerate(points):
+            if latitude is None or longitude is None:
+                continue
+            point = (float(latitude), float(longitude))
+            by_cell.setdefault(_cell(*point), {}).setdefault(point, []).append(position)
+
+        for cell, cell_points in by_cell.items():
+            candidates = self._grid.get(cell, []) + self._wide
+            for point, positions in cell_points.items():
+                match = self._nearest(*point, candidates)
+                for position in positions:
+                    results[position] = match
+        return results
+
+
+_index = None
+_index_version = None
+_index_built_at = 0.0
+_version_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def _shared_version():
+    return cache.get(VERSION_CACHE_KEY, 0)
+
+
+def get_store_index():
+    """
+    Returns the process-wide StoreIndex, rebuilding it when a store was saved
+    (in this or, through the shared cache, another process) or when it is
+    older than STORE_INDEX_MAX_AGE.
+    """
+    global _index, _index_version, _index_built_at, _version_checked_at
+
+    now = time.monotonic()
+    seen = index = _index
+    if index is not None:
+        if now - _index_built_at > getattr(settings, 'STORE_INDEX_MAX_AGE', 300):
+            index = None
+        # The shared version is polled at most once per STORE_INDEX_VERSION_CHECK_INTERVAL seconds
+        elif now - _version_checked_at > getattr(settings, 'STORE_INDEX_VERSION_CHECK_INTERVAL', 1.0):
+            _version_checked_at = now
+            if _shared_version() != _index_version:
+                index = None
+    if index is not None:
+        return index
+
+    with _lock:
+        if _index is not None and _index is not seen:
+            return _index # Another thread rebuilt it while we waited
+        version = _shared_version()
+        index = StoreIndex(StoreLocation.objects.filter(is_active=True, latitude__isnull=False, longitude__isnull=False))
+        _index, _index_version = index, version
+        _index_built_at = _version_checked_at = time.monotonic()
+    return index
+
+
+def _bump_shared_version():
+    try:
+        cache.incr(VERSION_CACHE_KEY)
+    except ValueError: # Key missing (first save or evicted)
+        cache.set(VERSION_CACHE_KEY, time.time_ns(), None)
+
+
+def invalidate_store_index():
+    """Drops this process's index now and tells other processes once the change commits."""
+    global _index
+    _index = None
+    transaction.on_commit(_bump_shared_version)
@@ -0,0 +1,186 @@
+"""
+Structured, non-blocking logging.
+
+Loggers write to QueueLogHandler, which only copies the record (message
+interpolated, traceback rendered) onto a bounded in-memory queue; a
+QueueListener thread formats it as one JSON object per line and does the
+write. A request never waits on stdout or a log collector, and when the
+queue is full records are dropped and counted instead of blocking.
+
+Every record carries the correlation ids bound for the current context:
+RequestIdMiddleware binds request_id (the incoming X-Request-ID, or a new
+one, echoed on the response) and code can bind more, e.g.
+`with bind(order_id=order.pk):`. Passing the same name in `extra=` wins.
+
+SamplingFilter keeps a fraction of the records below ERROR from the loggers
+in LOG_SAMPLE_RATES. The decision is made per request id, so a sampled
+request keeps all of its records.
+"""
+import json
+import logging
+import queue
+import random
+import re
+import time
+import uuid
+import zlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+_context = ContextVar('log_context', default={})
+
+# Attributes of every LogRecord; anything else on a record came from `extra=` or a filter
+RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+REQUEST_ID_PATTERN = re.compile(r'[A-Za-z0-9._-]{1,64}') # Incoming ids that are safe to log and echo
+
+
+@contextmanager
+def bind(**fields):
+    """Adds correlation fields to every record logged inside the block (in this thread or task)."""
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+class CorrelationFilter(logging.Filter):
+    """Copies the bound correlation ids onto the record. Put it on the handler so it runs in the caller's thread."""
+
+    def filter(self, record):
+        for name, value in _context.get().items():
+            if not hasattr(record, name):
+                setattr(record, name, value)
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps the given fraction of sub-ERROR records per logger name prefix, e.g. {'restaurant.instrumentation': 0.1}."""
+
+    def __init__(self, rates=None):
+        super().__init__()
+        # Longest prefix first, so 'a.b' overrides 'a'
+        self.rates = sorted((rates or {}).items(), key=lambda item: len(item[0]), reverse=True)
+
+    def rate_for(self, name):
+        for prefix, rate in self.rates:
+            if name == prefix or name.startswith(prefix + '.'):
+                return rate
+        return 1.0
+
+    def filter(self, record):
+        if record.levelno >= logging.ERROR:
+            return True
+        rate = self.rate_for(record.name)
+        if rate >= 1:
+            return True
+        request_id = getattr(record, 'request_id', None) or _context.get().get('request_id')
+        if request_id: # Same answer for every record of the request
+            return zlib.crc32(request_id.encode()) % 10_000 < rate * 10_000
+        return random.random() < rate
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message, correlation ids and extra fields."""
+    converter = time.gmtime # UTC, to match the trailing Z
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S') + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for name, value in vars(record).items():
+            if name not in RECORD_ATTRIBUTES and not name.startswith('_'):
+                entry[name] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel) # Waits for room when the queue is full; the thread is draining it
+
+
+class QueueLogHandler(QueueHandler):
+    """
+    Hands records to a background QueueListener that writes them as JSON to
+    `stream` (stderr by default, like StreamHandler). Configure from LOGGING
+    like any handler.
+    """
+
+    def __init__(self, stream=None, maxsize=10_000):
+        super().__init__(queue.Queue(maxsize))
+        self.dropped = 0
+        target = logging.StreamHandler(stream)
+        target.setFormatter(JSONFormatter())
+        self.listener = _Listener(self.queue, target)
+        self.listener.start()
+        self.running = True
+
+    def prepare(self, record):
+        # Runs in the caller's thread: the arguments and traceback may change or be freed once it returns
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def stop(self):
+        """Writes out everything queued and stops the listener thread. Called by logging.shutdown() at exit."""
+        if self.running:
+            self.running = False
+            self.listener.stop()
+
+    def close(self):
+        self.stop()
+        super().close()
+
+
+class RequestIdMiddleware:
+    """Binds request_id for the request's log records and returns it as X-Request-ID."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def request_id(request):
+        incoming = request.headers.get('X-Request-ID', '')
+        if REQUEST_ID_PATTERN.fullmatch(incoming):
+            return incoming # Set by the proxy: the same id in its logs and ours
+        return uuid.uuid4().hex
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        request.request_id = self.request_id(request)
+        with bind(request_id=request.request_id):
+            response = self.get_response(request)
+        response['X-Request-ID'] = request.request_id
+        return response
+
+    async def __acall__(self, request):
+        request.request_id = self.request_id(request)
+        with bind(request_id=request.request_id):
+            response = await self.get_response(request)
+        response['X-Request-ID'] = request.request_id
+        return response
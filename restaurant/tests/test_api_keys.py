@@ -0,0 +1,65 @@
+"""Verified API-key cache: skips the hasher for known keys, forgets them on any key change."""
+from datetime import timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework_api_key.models import APIKey
+
+from restaurant.api_keys import VerifiedKeyCache, _bump_shared_version
+
+
+@override_settings(API_KEY_CACHE_TTL=300, API_KEY_CACHE_SIZE=2)
+class VerifiedKeyCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.keys = VerifiedKeyCache()
+        self.api_key, self.key = APIKey.objects.create_key(name='voice-agent')
+        patcher = mock.patch.object(APIKey.objects, 'get_from_key', wraps=APIKey.objects.get_from_key)
+        self.get_from_key = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_verified_keys_skip_the_hasher(self):
+        self.assertTrue(self.keys.is_valid(self.key))
+        self.assertTrue(self.keys.is_valid(self.key))
+        self.assertEqual(self.get_from_key.call_count, 1)
+
+    def test_failures_are_not_cached(self):
+        self.assertFalse(self.keys.is_valid('nope.nope'))
+        self.assertFalse(self.keys.is_valid('nope.nope'))
+        self.assertEqual(self.get_from_key.call_count, 2)
+        self.assertEqual(self.keys._entries, {})
+
+    def test_revocation_reaches_other_processes(self):
+        self.assertTrue(self.keys.is_valid(self.key))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.api_key.revoked = True
+            self.api_key.save() # The signal clears the module cache; self.keys stands in for another worker
+        self.assertFalse(self.keys.is_valid(self.key))
+
+    def test_expiry_and_ttl(self):
+        self.api_key.expiry_date = timezone.now() + timedelta(seconds=60)
+        self.api_key.save()
+        self.assertTrue(self.keys.is_valid(self.key))
+        with mock.patch('restaurant.api_keys.timezone.now', return_value=timezone.now() + timedelta(seconds=61)):
+            self.assertFalse(self.keys.is_valid(self.key)) # Expired: checked again, and refused
+        self.assertEqual(self.get_from_key.call_count, 2)
+
+        self.api_key.expiry_date = None
+        self.api_key.save()
+        _bump_shared_version()
+        self.assertTrue(self.keys.is_valid(self.key))
+        with override_settings(API_KEY_CACHE_TTL=0):
+            self.keys.clear()
+            self.assertTrue(self.keys.is_valid(self.key))
+            self.assertTrue(self.keys.is_valid(self.key))
+        self.assertEqual(self.get_from_key.call_count, 5)
+
+    def test_least_recently_used_key_is_evicted(self):
+        keys = [self.key] + [APIKey.objects.create_key(name=f'k{i}')[1] for i in range(2)]
+        for key in keys:
+            self.assertTrue(self.keys.is_valid(key))
+        self.assertEqual(len(self.keys._entries), 2)
+        self.assertNotIn((APIKey._meta.label, self.keys.digest(self.key)), self.keys._entries)
+        self.assertNotIn(self.key.encode(), b''.join(digest for _, digest in self.keys._entries)) # Only HMACs are held
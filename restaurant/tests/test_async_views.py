@@ -0,0 +1,89 @@
+"""The async read endpoints return what their sync counterparts return."""
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from restaurant.models import Cart, Category, MenuItem, OptionChoice, OptionGroup, Order, StoreLocation
+from restaurant.serializers import ClaimsTokenObtainPairSerializer
+
+
+@override_settings(INSTRUMENTATION_ENABLED=False, ALLOWED_HOSTS=['testserver'])
+class AsyncViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user('customer', password='x')
+        cls.other = User.objects.create_user('other', password='x')
+        cls.courier = User.objects.create_user('courier', password='x')
+        cls.courier.groups.add(Group.objects.get_or_create(name='Delivery crew')[0])
+        cls.category = Category.objects.create(slug='mains', title='Mains')
+        cls.dish = MenuItem.objects.create(title='Dish', price=Decimal('30.00'), category=cls.category)
+        side = MenuItem.objects.create(title='Side', price=Decimal('5.00'), category=cls.category, is_standalone_item=False)
+        group = OptionGroup.objects.create(name='Side', menu_item=cls.dish)
+        cls.choice = OptionChoice.objects.create(group=group, item=side, price_adjustment=Decimal('1.00'))
+        cart = Cart.objects.create(user=cls.customer, menuitem=cls.dish, quantity=2, unit_price=Decimal('31.00'), price=Decimal('62.00'))
+        cart.selected_options.add(cls.choice)
+        store = StoreLocation.objects.create(name='Central', address='Calea Victoriei 1', latitude=Decimal('44.43'), longitude=Decimal('26.10'))
+        cls.order = Order.objects.create(user=cls.customer, store_location=store, total=Decimal('62.00'))
+
+    def setUp(self):
+        cache.clear()
+
+    def client_for(self, user=None):
+        client = APIClient()
+        if user:
+            token = ClaimsTokenObtainPairSerializer.get_token(user).access_token
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        return client
+
+    def test_same_payload_as_sync_endpoints(self):
+        cases = [
+            (None, '/api/categories/', '/api/async/categories/'),
+            (None, '/api/menu-items/?ordering=-price', '/api/async/menu-items/?ordering=-price'),
+            (None, f'/api/menu-items/{self.dish.pk}/', f'/api/async/menu-items/{self.dish.pk}/'),
+            (self.customer, '/api/cart/items/', '/api/async/cart/items/'),
+        ]
+        for user, sync_path, async_path in cases:
+            with self.subTest(path=async_path):
+                expected = self.client_for(user).get(sync_path)
+                response = self.client_for(user).get(async_path)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json(), expected.json())
+
+    def test_catalogue_cache_is_invalidated_by_menu_changes(self):
+        self.assertEqual(self.client_for().get('/api/async/categories/').json()[0]['title'], 'Mains')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.title = 'Main courses'
+            self.category.save()
+        self.assertEqual(self.client_for().get('/api/async/categories/').json()[0]['title'], 'Main courses')
+
+    def test_order_status_access(self):
+        path = f'/api/async/orders/{self.order.order_code}/status/'
+        self.assertEqual(self.client_for().get(path).status_code, 401)
+        self.assertEqual(self.client_for(self.other).get(path).status_code, 403)
+        self.assertEqual(self.client_for(self.customer).get('/api/async/orders/NOPE/status/').status_code, 404)
+        for user in (self.customer, self.courier):
+            response = self.client_for(user).get(path)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['order_code'], self.order.order_code)
+            self.assertEqual(response.json()['status'], 0)
+            self.assertIsNotNone(response.json()['eta'])
+
+    def test_unauthenticated_responses_carry_the_challenge(self):
+        sync = self.client_for().get('/api/cart/items/')
+        for headers in ({}, {'HTTP_AUTHORIZATION': 'Bearer not-a-token'}):
+            response = self.client_for().get('/api/async/cart/items/', **headers)
+            self.assertEqual(response.status_code, 401)
+            self.assertEqual(response['WWW-Authenticate'], sync['WWW-Authenticate'])
+
+    def test_only_get_is_allowed(self):
+        self.assertEqual(self.client_for().post('/api/async/categories/').status_code, 405)
+
+    def test_catalogue_lists_use_the_async_orm(self):
+        with mock.patch('restaurant.async_views.sync_to_async', side_effect=AssertionError('sync ORM in a thread')):
+            self.assertEqual(self.client_for().get('/api/async/categories/').status_code, 200)
+            self.assertEqual(self.client_for().get('/api/async/menu-items/?category=mains').json()[0]['title'], 'Dish')
+            self.assertEqual(self.client_for().get('/api/async/menu-items/?to_price=cheap').status_code, 400)
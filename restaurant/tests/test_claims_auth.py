@@ -0,0 +1,96 @@
+"""JWT role claims: requests authenticated from the token, revoked by bumping the user's token generation."""
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from restaurant.authentication import ClaimsJWTAuthentication
+from restaurant.models import ClaimsUser, UserProfile
+from restaurant.roles import DELIVERY_CREW
+from restaurant.tracking import tracker
+
+
+@override_settings(JWT_ROLE_CLAIMS=True, TRACKING_BACKGROUND_FLUSH=False, INSTRUMENTATION_ENABLED=False)
+class RoleClaimsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.crew = Group.objects.get_or_create(name=DELIVERY_CREW)[0]
+        cls.courier = User.objects.create_user('courier', password='secret-pass', first_name='Ana')
+        cls.courier.groups.add(cls.crew)
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(tracker.reset)
+        self.client = APIClient()
+
+    def login(self):
+        response = self.client.post('/api/auth/jwt/create/', {'username': 'courier', 'password': 'secret-pass'}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+        self.refresh = response.data['refresh']
+        return response.data['access']
+
+    def refresh_token(self):
+        return APIClient().post('/api/auth/jwt/refresh/', {'refresh': self.refresh}, format='json')
+
+    def post_location(self):
+        return self.client.post('/api/courier/locations/', {'pings': [{'latitude': 44.43, 'longitude': 26.10}]}, format='json')
+
+    def user_queries(self, queries):
+        return [query['sql'] for query in queries if 'auth_user' in query['sql']]
+
+    def test_roles_come_from_the_claims(self):
+        self.login()
+        self.assertEqual(self.post_location().status_code, 202) # Warms the generation cache
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.post_location().status_code, 202)
+        self.assertEqual(self.user_queries(queries.captured_queries), []) # Neither the user nor their groups
+
+    def test_generation_bump_rejects_stale_tokens(self):
+        self.login()
+        self.assertEqual(self.post_location().status_code, 202)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.courier.groups.remove(self.crew)
+        response = self.post_location()
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.data['detail'].code, 'token_stale')
+
+        self.login() # A fresh token carries the new roles
+        self.assertEqual(self.post_location().status_code, 403)
+
+    def test_deactivation_rejects_tokens(self):
+        self.login()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.courier.is_active = False
+            self.courier.save()
+        self.assertEqual(self.post_location().status_code, 401)
+
+    def test_refresh_rejects_deleted_and_inactive_users(self):
+        self.login()
+        self.assertEqual(self.refresh_token().status_code, 200)
+        User.objects.filter(pk=self.courier.pk).update(is_active=False)
+        self.assertEqual(self.refresh_token().status_code, 401)
+        self.courier.delete()
+        response = self.refresh_token()
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.data['detail'].code, 'no_active_account')
+
+    def test_user_is_loaded_lazily(self):
+        access = self.login()
+        authentication = ClaimsJWTAuthentication()
+        with self.assertNumQueries(1): # The token generation only
+            user = authentication.get_user(authentication.get_validated_token(access))
+        self.assertIsInstance(user, ClaimsUser)
+        self.assertTrue(user.is_active)
+        with self.assertNumQueries(1): # Every other field in one query
+            self.assertEqual((user.username, user.first_name, user.email), ('courier', 'Ana', ''))
+
+    def test_without_claims_generation_is_not_bumped(self):
+        generation = UserProfile.objects.get(user=self.courier).token_generation
+        with override_settings(JWT_ROLE_CLAIMS=False), self.captureOnCommitCallbacks(execute=True):
+            with CaptureQueriesContext(connection) as queries:
+                self.courier.groups.remove(self.crew)
+        self.assertFalse([query for query in queries.captured_queries if 'token_generation' in query['sql']])
+        self.assertEqual(UserProfile.objects.get(user=self.courier).token_generation, generation)
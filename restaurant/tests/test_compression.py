@@ -0,0 +1,150 @@
+"""CompressionMiddleware: negotiation, thresholds and the cached catalogue variants."""
+import gzip
+import unittest
+from decimal import Decimal
+from unittest import mock
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+
+from restaurant import compression, views
+from restaurant.compression import CompressionMiddleware, negotiate
+from restaurant.models import Category, MenuItem
+
+
+@override_settings(INSTRUMENTATION_ENABLED=False)
+class CompressionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(slug='mains', title='Mains')
+        MenuItem.objects.bulk_create(
+            MenuItem(title=f'Dish {i}', price=Decimal('10.00'), category=category) for i in range(40)
+        )
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(compression, '_brotli', False) # gzip only, whether or not brotli is installed
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_negotiate(self):
+        self.assertEqual(negotiate('gzip, deflate, br', ('br', 'gzip')), 'br')
+        self.assertEqual(negotiate('gzip;q=1.0, br;q=0.5', ('br', 'gzip')), 'gzip')
+        self.assertEqual(negotiate('br;q=0, *', ('br', 'gzip')), 'gzip')
+        self.assertEqual(negotiate('gzip;q=0', ('gzip',)), None)
+        self.assertEqual(negotiate('', ('gzip',)), None)
+        self.assertEqual(negotiate('identity', ('gzip',)), None)
+
+    def test_gzip_round_trip(self):
+        plain = self.client.get('/api/menu-items/')
+        compressed = self.client.get('/api/menu-items/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertEqual(int(compressed['Content-Length']), len(compressed.content))
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertIn('Accept-Encoding', plain['Vary'])
+        self.assertIn('Accept-Encoding', compressed['Vary'])
+
+    def test_small_and_refused_responses_are_not_compressed(self):
+        with override_settings(COMPRESSION_MIN_SIZE=10 ** 6):
+            response = self.client.get('/api/menu-items/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('Content-Encoding', response)
+        response = self.client.get('/api/menu-items/', HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertNotIn('Content-Encoding', response)
+
+    def test_catalogue_variants_are_served_before_the_view(self):
+        with mock.patch.object(compression, 'compress', wraps=compression.compress) as compress, \
+                mock.patch('restaurant.views.serialize_menu_items', wraps=views.serialize_menu_items) as render:
+            first = self.client.get('/api/menu-items/', HTTP_ACCEPT_ENCODING='gzip')
+            second = self.client.get('/api/menu-items/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual((compress.call_count, render.call_count), (1, 1)) # The second request never reached the view
+        self.assertEqual(first.content, second.content)
+        self.assertEqual((second['Content-Encoding'], second['Content-Type']), ('gzip', first['Content-Type']))
+        self.assertIn('Accept-Encoding', second['Vary'])
+        self.assertNotIn('Content-Encoding', self.client.get('/api/menu-items/')) # No stored identity variant
+
+        with self.captureOnCommitCallbacks(execute=True):
+            dish = MenuItem.objects.get(title='Dish 0')
+            dish.title = 'Renamed'
+            dish.save()
+        with mock.patch.object(compression, 'compress', wraps=compression.compress) as compress:
+            changed = self.client.get('/api/menu-items/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(compress.call_count, 1) # New catalogue version, new variant
+        self.assertIn(b'Renamed', gzip.decompress(changed.content))
+
+    def test_variants_are_per_url_and_accept_header(self):
+        self.client.get('/api/menu-items/', HTTP_ACCEPT_ENCODING='gzip')
+        filtered = self.client.get('/api/menu-items/?search=Dish 1', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotEqual(gzip.decompress(filtered.content), gzip.decompress(self.client.get('/api/menu-items/', HTTP_ACCEPT_ENCODING='gzip').content))
+        browsable = self.client.get('/api/menu-items/', HTTP_ACCEPT_ENCODING='gzip', HTTP_ACCEPT='text/html')
+        self.assertTrue(browsable['Content-Type'].startswith('text/html'))
+
+    async def test_stored_variants_under_asgi(self):
+        first = await self.async_client.get('/api/async/menu-items/', ACCEPT_ENCODING='gzip')
+        with mock.patch('restaurant.async_views.menu_items_from_values', side_effect=AssertionError('view ran')):
+            second = await self.async_client.get('/api/async/menu-items/', ACCEPT_ENCODING='gzip')
+        self.assertEqual((second['Content-Encoding'], second.content), ('gzip', first.content))
+
+    @override_settings(COMPRESSION_MIN_SIZE=1)
+    def test_auth_responses_are_not_compressed(self):
+        User.objects.create_user('customer', password='secret-pass')
+        response = self.client.post('/api/auth/jwt/create/', {'username': 'customer', 'password': 'secret-pass'},
+                                    content_type='application/json', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Content-Encoding', response)
+        self.assertIn(b'access', response.content)
+
+    @override_settings(COMPRESSION_THREAD_MIN_SIZE=4096)
+    def test_large_async_bodies_are_compressed_off_the_event_loop(self):
+        async def view(request):
+            return HttpResponse(request.GET['body'] * 1000, content_type='application/json')
+
+        middleware = CompressionMiddleware(view)
+        calls = []
+
+        def tracking_sync_to_async(func, thread_sensitive=True):
+            calls.append(thread_sensitive)
+            return sync_to_async(func, thread_sensitive=thread_sensitive)
+
+        with mock.patch.object(compression, 'sync_to_async', tracking_sync_to_async):
+            for size in (2, 8):
+                request = RequestFactory().get('/x/', {'body': 'a' * size}, HTTP_ACCEPT_ENCODING='gzip')
+                request.resolver_match = None
+                response = async_to_sync(middleware)(request)
+                self.assertEqual(gzip.decompress(response.content), b'a' * size * 1000)
+        self.assertEqual(calls, [False]) # 2000 bytes inline, 8000 in a thread
+
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+@unittest.skipUnless(brotli, "brotli is not installed")
+class BrotliCompressionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(slug='mains', title='Mains')
+        MenuItem.objects.bulk_create(
+            MenuItem(title=f'Dish {i}', price=Decimal('10.00'), category=category) for i in range(40)
+        )
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(compression, '_brotli', None) # Imported again, for real
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_brotli_round_trip(self):
+        plain = self.client.get('/api/menu-items/')
+        with mock.patch.object(brotli, 'compress', wraps=brotli.compress) as compress:
+            compressed = self.client.get('/api/menu-items/', HTTP_ACCEPT_ENCODING='gzip, deflate, br')
+        self.assertEqual(compressed['Content-Encoding'], 'br')
+        self.assertEqual(compress.call_args.kwargs['quality'], compression.BROTLI_QUALITIES[True]) # Cached catalogue route
+        self.assertEqual(brotli.decompress(compressed.content), plain.content)
+        self.assertEqual(gzip.decompress(self.client.get('/api/menu-items/', HTTP_ACCEPT_ENCODING='gzip').content), plain.content)
+
@@ -0,0 +1,75 @@
+"""Read/write routing with read-your-writes pinning, and the SQLite connection pragmas."""
+import sqlite3
+from types import SimpleNamespace
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connections
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from restaurant.db import PRIMARY_DB, READ_DB, ReadWriteRouter, ReadYourWritesMiddleware, configure_sqlite, reset_pinning
+from restaurant.models import Category, CourierLocation
+
+
+class ReadWriteRouterTests(SimpleTestCase):
+    def setUp(self):
+        reset_pinning()
+        self.addCleanup(reset_pinning)
+        self.router = ReadWriteRouter()
+
+    def test_reads_of_read_models_use_the_read_alias(self):
+        self.assertEqual(self.router.db_for_read(Category), READ_DB)
+        self.assertEqual(self.router.db_for_read(User), PRIMARY_DB)
+        self.assertEqual(self.router.db_for_read(CourierLocation), PRIMARY_DB)
+
+    def test_reads_follow_a_write_to_the_primary(self):
+        self.assertEqual(self.router.db_for_write(Category), PRIMARY_DB)
+        self.assertEqual(self.router.db_for_read(Category), PRIMARY_DB)
+
+    def test_reads_inside_a_primary_transaction_use_the_primary(self):
+        primary = connections[PRIMARY_DB]
+        primary.in_atomic_block = True
+        self.addCleanup(setattr, primary, 'in_atomic_block', False)
+        self.assertEqual(self.router.db_for_read(Category), PRIMARY_DB)
+
+    def test_without_a_read_alias_everything_uses_the_primary(self):
+        with mock.patch.dict(settings.DATABASES):
+            del settings.DATABASES[READ_DB]
+            self.assertEqual(self.router.db_for_read(Category), PRIMARY_DB)
+
+    def test_migrations_only_run_on_the_primary(self):
+        self.assertTrue(self.router.allow_migrate(PRIMARY_DB, 'restaurant'))
+        self.assertFalse(self.router.allow_migrate(READ_DB, 'restaurant'))
+
+    def test_middleware_clears_pinning_between_requests(self):
+        def view(request):
+            self.router.db_for_write(Category)
+            return self.router.db_for_read(Category)
+
+        middleware = ReadYourWritesMiddleware(view)
+        self.assertEqual(middleware(RequestFactory().get('/')), PRIMARY_DB)
+        self.assertEqual(self.router.db_for_read(Category), READ_DB)
+
+
+class ConfigureSqliteTests(SimpleTestCase):
+    def connect(self, alias):
+        connection = SimpleNamespace(vendor='sqlite', alias=alias, connection=sqlite3.connect(':memory:'))
+        self.addCleanup(connection.connection.close)
+        configure_sqlite(None, connection)
+        return connection.connection
+
+    @override_settings(SQLITE_PRAGMAS={'cache_size': -1000, 'temp_store': 'MEMORY'})
+    def test_pragmas_are_applied(self):
+        primary = self.connect(PRIMARY_DB)
+        self.assertEqual(primary.execute('PRAGMA cache_size').fetchone(), (-1000,))
+        self.assertEqual(primary.execute('PRAGMA temp_store').fetchone(), (2,))
+        self.assertEqual(primary.execute('PRAGMA query_only').fetchone(), (0,))
+
+    def test_read_alias_is_query_only(self):
+        read = self.connect(READ_DB)
+        with self.assertRaises(sqlite3.OperationalError):
+            read.execute('CREATE TABLE t (x)')
+
+    def test_other_vendors_are_left_alone(self):
+        configure_sqlite(None, SimpleNamespace(vendor='postgresql', alias=PRIMARY_DB)) # Would fail on .connection
@@ -0,0 +1,97 @@
+"""Batch delivery eligibility: capped geocoding, read-only GET and batched store matching."""
+import random
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from restaurant import geocoding, store_index
+from restaurant.geocoding import FixtureProvider
+from restaurant.models import StoreLocation, UserAddress
+from restaurant.store_index import StoreIndex
+
+
+class CountingFixtureProvider(FixtureProvider):
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    def geocode(self, address_str):
+        self.calls.append(address_str)
+        return super().geocode(address_str)
+
+
+@override_settings(DELIVERY_ELIGIBILITY_MAX_LOOKUPS=2, INSTRUMENTATION_ENABLED=False)
+class DeliveryEligibilityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        StoreLocation.objects.create(name='Central', address='Calea Victoriei 1', latitude=Decimal('44.4355'),
+                                     longitude=Decimal('26.1025'), delivery_radius_km=Decimal('30'))
+        cls.customer = User.objects.create_user('customer', password='x')
+
+    def setUp(self):
+        store_index._index = None
+        self.addCleanup(setattr, store_index, '_index', None)
+        self.provider = CountingFixtureProvider()
+        patcher = mock.patch.object(geocoding, '_provider', self.provider)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def post(self, **payload):
+        response = self.client.post('/api/delivery-eligibility/', payload, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data['results']
+
+    def test_uncached_lookups_are_capped_per_request(self):
+        addresses = [f'Strada Test {i}, Bucuresti' for i in range(5)]
+        results = self.post(addresses=addresses)
+        self.assertEqual(len(self.provider.calls), 2)
+        self.assertEqual([result['pending'] for result in results], [False, False, True, True, True])
+        self.assertTrue(results[0]['can_deliver'])
+        self.assertEqual((results[4]['latitude'], results[4]['store'], results[4]['can_deliver']), (None, None, False))
+
+        # Asking again serves the first two from the cache and looks up the next two
+        results = self.post(addresses=addresses)
+        self.assertEqual(len(self.provider.calls), 4)
+        self.assertEqual([result['pending'] for result in results], [False, False, False, False, True])
+
+    @override_settings(DELIVERY_ELIGIBILITY_MAX_LOOKUPS=0)
+    def test_cache_only_makes_no_provider_calls(self):
+        geocoding.store_cached({geocoding.normalize_address('Strada Test 0, Bucuresti'): (44.43, 26.10)}, 'fixture')
+        results = self.post(addresses=['Strada Test 0, Bucuresti', 'Strada Test 1, Bucuresti'])
+        self.assertEqual(self.provider.calls, [])
+        self.assertEqual([result['pending'] for result in results], [False, True])
+
+    def test_get_does_not_write_coordinates(self):
+        UserAddress.objects.create(user=self.customer, nickname='Home', street_address='Str. Lipscani 5', city='Bucuresti', postal_code='030031')
+        response = self.client.get('/api/delivery-eligibility/')
+        result, = response.data['results']
+        self.assertFalse(result['pending'])
+        self.assertIsNotNone(result['latitude'])
+        self.assertIsNone(UserAddress.objects.get().latitude) # Left to `manage.py geocode_backfill`
+
+    def test_coordinates_need_no_geocoding(self):
+        result, = self.post(coordinates=[{'latitude': 44.43, 'longitude': 26.10}])
+        self.assertEqual((result['pending'], result['can_deliver']), (False, True))
+        self.assertEqual(self.provider.calls, [])
+
+
+class NearestManyTests(TestCase):
+    def test_matches_nearest_for_every_point(self):
+        rng = random.Random(7)
+        stores = [
+            StoreLocation(name=f'S{i}', address='-', latitude=Decimal(f'{rng.uniform(44.3, 44.6):.6f}'),
+                          longitude=Decimal(f'{rng.uniform(25.9, 26.3):.6f}'), delivery_radius_km=Decimal(rng.choice(['1.5', '3', '6'])))
+            for i in range(12)
+        ]
+        stores.append(StoreLocation(name='Wide', address='-', latitude=Decimal('50'), longitude=Decimal('10'), delivery_radius_km=Decimal('999')))
+        index = StoreIndex(stores)
+        self.assertEqual(index._wide, [12]) # Checked for every point, covers none of them
+        points = [(rng.uniform(44.2, 44.7), rng.uniform(25.8, 26.4)) for _ in range(200)]
+        points += [points[0], (None, 26.1), (46.77, 23.59)]
+        expected = [index.nearest(*point) if None not in point else (None, None, False) for point in points]
+        self.assertEqual(index.nearest_many(points), expected)
@@ -0,0 +1,105 @@
+"""Bulk courier dispatch: proximity/load planning and applying the plan."""
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import Group, User
+from django.test import TestCase
+
+from restaurant.dispatch import apply_plan, get_available_couriers, plan_dispatch
+from restaurant.geocoding import normalize_address, store_cached
+from restaurant.models import Order, StoreLocation, UserAddress, UserProfile
+
+# Points east of the store along the same latitude, ~0.8 km per 0.01 degree of longitude
+STORE = (Decimal('44.4300'), Decimal('26.1000'))
+
+
+def east(hundredths):
+    return (44.43, 26.10 + hundredths / 100)
+
+
+class DispatchPlanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.store = StoreLocation.objects.create(name='Central', address='Calea Victoriei 1', latitude=STORE[0], longitude=STORE[1])
+        cls.customer = User.objects.create_user('customer', password='x')
+        crew = Group.objects.get_or_create(name='Delivery crew')[0]
+        cls.couriers = []
+        for name in ('ana', 'ion'):
+            courier = User.objects.create_user(name, password='x')
+            courier.groups.add(crew)
+            UserProfile.objects.filter(user=courier).update(store_location=cls.store)
+            cls.couriers.append(courier)
+
+    def setUp(self):
+        patcher = mock.patch('restaurant.dispatch.tracker')
+        self.tracker = patcher.start()
+        self.tracker.live_positions.return_value = {}
+        self.addCleanup(patcher.stop)
+
+    def order(self, point, **kwargs):
+        address = UserAddress.objects.create(
+            user=self.customer, nickname=f'A{UserAddress.objects.count()}', street_address='-', city='Bucuresti',
+            postal_code='0', latitude=Decimal(f'{point[0]:.6f}'), longitude=Decimal(f'{point[1]:.6f}'),
+        ) if point else None
+        return Order.objects.create(user=self.customer, store_location=self.store, delivery_address_link=address, total=Decimal('10'), **kwargs)
+
+    def plan(self, **kwargs):
+        plan = plan_dispatch(self.store, **kwargs)
+        return [(assignment.order, assignment.courier) for assignment in plan.assignments], plan.unassigned
+
+    def test_orders_go_to_the_nearest_courier(self):
+        ana, ion = self.couriers
+        self.tracker.live_positions.return_value = {ana.pk: east(0), ion.pk: east(10)}
+        near_ion, near_ana = self.order(east(9)), self.order(east(1))
+        assignments, unassigned = self.plan(load_penalty_km=0)
+        self.assertEqual(assignments, [(near_ion, ion), (near_ana, ana)])
+        self.assertEqual(unassigned, [])
+
+    def test_load_penalty_spreads_orders(self):
+        ana, ion = self.couriers
+        self.tracker.live_positions.return_value = {ana.pk: east(0), ion.pk: east(2)}
+        first, second = self.order(east(0)), self.order(east(0))
+        # ana is at both drop-offs, but after the first order a 5 km penalty outweighs ion's 1.6 km
+        assignments, _ = self.plan(load_penalty_km=5)
+        self.assertEqual(assignments, [(first, ana), (second, ion)])
+        assignments, _ = self.plan(load_penalty_km=0)
+        self.assertEqual(assignments, [(first, ana), (second, ana)])
+
+    def test_next_order_is_measured_from_the_last_drop_off(self):
+        ana, ion = self.couriers
+        self.tracker.live_positions.return_value = {ana.pk: east(0), ion.pk: east(-6)}
+        first, second = self.order(east(4)), self.order(east(8))
+        assignments, _ = self.plan(load_penalty_km=0)
+        self.assertEqual(assignments, [(first, ana), (second, ana)]) # ana is then at east(4), nearer than ion
+
+    def test_capacity_and_existing_load(self):
+        ana, ion = self.couriers
+        carried = self.order(east(0))
+        Order.objects.filter(pk=carried.pk).update(delivery_crew=ana, status=1) # Already out with one order
+        orders = [self.order(east(1)) for _ in range(3)]
+        couriers = get_available_couriers(self.store)
+        self.assertEqual({courier.pk: courier.active_orders for courier in couriers}, {ana.pk: 1, ion.pk: 0})
+        assignments, unassigned = self.plan(max_orders_per_courier=2, load_penalty_km=0)
+        self.assertEqual([courier for _, courier in assignments], [ana, ion, ion]) # Then ana is full
+        self.assertEqual(unassigned, [])
+        _, unassigned = self.plan(orders=orders + [self.order(east(1))], max_orders_per_courier=2, load_penalty_km=0)
+        self.assertEqual(len(unassigned), 1)
+
+    def test_voice_orders_use_the_geocode_cache(self):
+        ana, ion = self.couriers
+        self.tracker.live_positions.return_value = {ana.pk: east(0), ion.pk: east(10)}
+        store_cached({normalize_address('Str. Voce 1'): east(10)}, 'test')
+        voice = self.order(None, delivery_address='Str. Voce 1', is_voice_order=True)
+        unknown = self.order(None, delivery_address='Str. Necunoscuta 2', is_voice_order=True)
+        assignments, _ = self.plan(load_penalty_km=1)
+        self.assertEqual(assignments, [(voice, ion), (unknown, ana)]) # Unknown location: least loaded wins
+
+    def test_apply_plan_skips_orders_taken_meanwhile(self):
+        ana, ion = self.couriers
+        first, second = self.order(east(1)), self.order(east(2))
+        plan = plan_dispatch(self.store)
+        Order.objects.filter(pk=second.pk).update(delivery_crew=ion)
+        applied = apply_plan(plan)
+        self.assertEqual([assignment.order for assignment in applied], [first])
+        self.assertEqual(Order.objects.get(pk=second.pk).delivery_crew, ion)
+        self.assertIsNotNone(Order.objects.get(pk=first.pk).delivery_crew)
@@ -0,0 +1,102 @@
+"""Queued email: sending only persists, the worker delivers in batches and retries failures."""
+import smtplib
+
+from django.core import mail
+from django.core.mail import EmailMultiAlternatives
+from django.core.mail.backends.locmem import EmailBackend
+from django.test import TestCase, override_settings
+
+from restaurant.email_queue import SENT, send_queued_emails
+from restaurant.models import QueuedEmail
+from restaurant.outbox import FAILED, PENDING
+
+QUEUE = 'restaurant.email_queue.QueuedEmailBackend'
+LOCMEM = 'django.core.mail.backends.locmem.EmailBackend'
+
+
+class RejectingBackend(EmailBackend):
+    """Refuses messages to anyone at bounce.example."""
+
+    def send_messages(self, messages):
+        if any(address.endswith('@bounce.example') for message in messages for address in message.recipients()):
+            raise ConnectionError('rejected')
+        return super().send_messages(messages)
+
+
+class SMTPLikeBackend(EmailBackend):
+    """Refuses anyone at refused.example with a 550, crashes the worker at crash.example, counts connections."""
+    opened = 0
+
+    def open(self):
+        SMTPLikeBackend.opened += 1
+        return super().open()
+
+    def send_messages(self, messages):
+        for message in messages:
+            for address in message.recipients():
+                if address.endswith('@refused.example'):
+                    raise smtplib.SMTPRecipientsRefused({address: (550, b'No such user')})
+                if address.endswith('@crash.example'):
+                    raise SystemExit('worker killed')
+        return super().send_messages(messages)
+
+
+def queue_message(to, **kwargs):
+    message = EmailMultiAlternatives('Activate', 'Plain body', 'shop@example.com', [to], connection=mail.get_connection(QUEUE), **kwargs)
+    message.attach_alternative('<p>HTML body</p>', 'text/html')
+    message.attach('receipt.txt', 'total: 10', 'text/plain')
+    return message.send()
+
+
+@override_settings(QUEUED_EMAIL_MAX_ATTEMPTS=2)
+class EmailQueueTests(TestCase):
+    def test_sending_only_queues(self):
+        self.assertEqual(queue_message('ana@example.com', reply_to=['help@example.com']), 1)
+        self.assertEqual(mail.outbox, [])
+        queued = QueuedEmail.objects.get()
+        self.assertEqual((queued.to, queued.reply_to, queued.status), (['ana@example.com'], ['help@example.com'], PENDING))
+
+    def test_worker_rebuilds_and_sends_messages(self):
+        queue_message('ana@example.com')
+        queue_message('ion@example.com')
+        result = send_queued_emails(backend=LOCMEM)
+        self.assertEqual(result.sent, 2)
+        self.assertEqual([message.to for message in mail.outbox], [['ana@example.com'], ['ion@example.com']])
+        message = mail.outbox[0]
+        self.assertEqual(message.alternatives[0][0], '<p>HTML body</p>')
+        self.assertEqual(message.attachments[0][:2], ('receipt.txt', 'total: 10'))
+        self.assertEqual(set(QueuedEmail.objects.values_list('status', flat=True)), {SENT})
+
+    def test_failures_are_retried_then_given_up(self):
+        queue_message('ana@example.com')
+        queue_message('nobody@bounce.example')
+        backend = f'{__name__}.RejectingBackend'
+        result = send_queued_emails(backend=backend)
+        self.assertEqual((result.sent, result.retried), (1, 1)) # One bad address does not fail the batch
+        bounced = QueuedEmail.objects.get(to=['nobody@bounce.example'])
+        self.assertEqual((bounced.status, bounced.attempts, bounced.last_error), (PENDING, 1, 'rejected'))
+
+        QueuedEmail.objects.filter(pk=bounced.pk).update(next_attempt_at=bounced.created_at)
+        with self.assertLogs('restaurant.email_queue', 'ERROR'):
+            self.assertEqual(send_queued_emails(backend=backend).failed, 1)
+        bounced.refresh_from_db()
+        self.assertEqual((bounced.status, bounced.attempts), (FAILED, 2))
+
+    def test_permanent_failures_are_not_retried(self):
+        queue_message('nobody@refused.example')
+        queue_message('ana@example.com')
+        SMTPLikeBackend.opened = 0
+        with self.assertLogs('restaurant.email_queue', 'ERROR'):
+            result = send_queued_emails(backend=f'{__name__}.SMTPLikeBackend')
+        self.assertEqual((result.sent, result.retried, result.failed), (1, 0, 1))
+        self.assertEqual(SMTPLikeBackend.opened, 1) # A refused recipient does not mean the session is gone
+        refused = QueuedEmail.objects.get(to=['nobody@refused.example'])
+        self.assertEqual((refused.status, refused.attempts), (FAILED, 1))
+
+    def test_each_outcome_is_saved_as_it_happens(self):
+        queue_message('ana@example.com')
+        queue_message('ion@crash.example')
+        with self.assertRaises(SystemExit):
+            send_queued_emails(backend=f'{__name__}.SMTPLikeBackend')
+        self.assertEqual(QueuedEmail.objects.get(to=['ana@example.com']).status, SENT) # Not sent again by the next worker
+        self.assertEqual(QueuedEmail.objects.get(to=['ion@crash.example']).status, PENDING)
@@ -0,0 +1,84 @@
+"""Rolling ETA statistics: recorded after commit, refreshed from order history by a periodic command."""
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from restaurant import eta
+from restaurant.models import Order, StoreDeliveryStats, StoreLocation
+
+
+@override_settings(ETA_SMOOTHING=0.5, ETA_DEFAULT_PREP_MINUTES=20, ETA_STATS_RELOAD_INTERVAL=3600)
+class EtaStatisticsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.store = StoreLocation.objects.create(name='Central', address='-', latitude=Decimal('44.43'), longitude=Decimal('26.10'))
+        cls.customer = User.objects.create_user('customer', password='x')
+
+    def setUp(self):
+        eta._stats.clear()
+        self.addCleanup(eta._stats.clear)
+
+    def start_delivery(self, prep_minutes):
+        order = Order.objects.create(user=self.customer, store_location=self.store, total=Decimal('10'))
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(minutes=prep_minutes))
+        order.refresh_from_db()
+        order.status = 1
+        with self.assertLogs('restaurant.signals', 'WARNING'): # No phone number for the SMS
+            order.save()
+        return order
+
+    def test_recorded_only_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.start_delivery(prep_minutes=10)
+        self.assertNotIn(self.store.pk, eta._stats) # Nothing recorded inside the transaction
+        for callback in callbacks:
+            callback()
+        self.assertAlmostEqual(eta.get_store_stats(self.store.pk).prep_seconds, 15 * 60, delta=5) # (20 + 10) / 2
+        self.assertFalse(StoreDeliveryStats.objects.exists()) # Nothing written from the request
+
+    def delivered(self, created_at, delivering_at):
+        order = Order.objects.create(user=self.customer, store_location=self.store, total=Decimal('10'))
+        Order.objects.filter(pk=order.pk).update(created_at=created_at, delivering_at=delivering_at, status=1)
+
+    def test_refresh_folds_new_transitions_from_order_history(self):
+        now = timezone.now()
+        self.delivered(now - timedelta(minutes=45), now - timedelta(minutes=15)) # 30-minute prep, folded last
+        self.delivered(now - timedelta(minutes=40), now - timedelta(minutes=30)) # 10-minute prep
+        self.assertEqual(eta.refresh_store_stats(now=now), 2)
+        row = StoreDeliveryStats.objects.get()
+        self.assertEqual(row.samples, 2)
+        self.assertAlmostEqual(row.prep_seconds, ((20 + 10) / 2 + 30) / 2 * 60) # Oldest transition first
+
+        self.delivered(now - timedelta(minutes=39), now + timedelta(minutes=1)) # After the first run
+        self.assertEqual(eta.refresh_store_stats(now=now + timedelta(minutes=2)), 1) # Earlier orders are not folded again
+        row.refresh_from_db()
+        self.assertEqual(row.samples, 3)
+        self.assertAlmostEqual(row.prep_seconds, (22.5 + 40) / 2 * 60)
+
+    def test_workers_reload_refreshed_stats(self):
+        self.assertEqual(eta.get_store_stats(self.store.pk).prep_seconds, 20 * 60)
+        StoreDeliveryStats.objects.create(store=self.store, prep_seconds=600, delivery_seconds=600, speed_kmh=20, samples=1)
+        self.assertEqual(eta.get_store_stats(self.store.pk).prep_seconds, 20 * 60) # Within the reload interval
+        with override_settings(ETA_STATS_RELOAD_INTERVAL=0):
+            self.assertEqual(eta.get_store_stats(self.store.pk).prep_seconds, 600)
+
+    def test_refresh_command(self):
+        now = timezone.now()
+        self.delivered(now - timedelta(minutes=40), now - timedelta(minutes=30))
+        out = StringIO()
+        call_command('refresh_eta_stats', '--once', stdout=out)
+        self.assertIn('1 observations', out.getvalue())
+        self.assertEqual(StoreDeliveryStats.objects.get().samples, 1)
+
+    def test_estimate_uses_rolling_speed(self):
+        now = timezone.now()
+        stats = eta.get_store_stats(self.store.pk)
+        stats.speed_kmh = 30.0
+        self.assertEqual(eta.estimate_eta_from(1, self.store.pk, now, now, 15.0, now=now), now + timedelta(minutes=30))
+        pending = eta.estimate_eta_from(0, self.store.pk, now, None, None, now=now)
+        self.assertEqual(pending, now + timedelta(seconds=stats.prep_seconds + stats.delivery_seconds))
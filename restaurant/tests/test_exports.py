@@ -0,0 +1,96 @@
+"""Order exports: filters, one row per item, constant queries per chunk, and the streaming endpoint."""
+import csv
+import io
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth.models import Group, User
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from restaurant.exports import EXPORT_COLUMNS, ExportFilterError, get_export_queryset, iter_export, iter_order_rows, parse_export_filters
+from restaurant.models import Category, MenuItem, OptionChoice, OptionGroup, Order, OrderItem, StoreLocation
+
+
+@override_settings(INSTRUMENTATION_ENABLED=False)
+class OrderExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.store = StoreLocation.objects.create(name='Central', address='-')
+        other_store = StoreLocation.objects.create(name='North', address='-')
+        category = Category.objects.create(slug='mains', title='Mains')
+        dish = MenuItem.objects.create(title='Ciorbă', price=Decimal('20.00'), category=category)
+        side = MenuItem.objects.create(title='Smântână', price=Decimal('3.00'), category=category, is_standalone_item=False)
+        choice = OptionChoice.objects.create(group=OptionGroup.objects.create(name='Side', menu_item=dish), item=side)
+        cls.customer = User.objects.create_user('customer', password='x')
+        cls.orders = []
+        for i in range(3):
+            order = Order.objects.create(user=cls.customer, store_location=cls.store, total=Decimal('46.00'))
+            for quantity in (1, 2):
+                item = OrderItem.objects.create(order=order, menuitem=dish, quantity=quantity, price=Decimal('23.00') * quantity)
+                item.selected_options.add(choice)
+            cls.orders.append(order)
+        Order.objects.create(is_voice_order=True, customer_name='Ana', store_location=other_store, total=Decimal('0'))
+        cls.manager = User.objects.create_user('manager', password='x')
+        cls.manager.groups.add(Group.objects.get_or_create(name='Manager')[0])
+
+    def test_parse_export_filters(self):
+        self.assertEqual(parse_export_filters('2024-01-01', '2024-01-31', '3'), (date(2024, 1, 1), date(2024, 1, 31), 3))
+        self.assertEqual(parse_export_filters(), (None, None, None))
+        for filters in (('2024-13-01',), ('bad',), ('2024-02-01', '2024-01-01'), (None, None, 'x')):
+            with self.subTest(filters=filters), self.assertRaises(ExportFilterError):
+                parse_export_filters(*filters)
+
+    def test_date_range_is_inclusive_and_uses_the_index(self):
+        at = lambda *args: timezone.make_aware(datetime(*args))
+        for order, created_at in zip(self.orders, (at(2024, 1, 1), at(2024, 1, 31, 23, 59), at(2024, 2, 1))):
+            Order.objects.filter(pk=order.pk).update(created_at=created_at)
+        queryset = get_export_queryset(date(2024, 1, 1), date(2024, 1, 31))
+        self.assertEqual(list(queryset.values_list('pk', flat=True)), [order.pk for order in self.orders[:2]])
+        self.assertNotIn('cast_date', str(queryset.query).lower()) # A plain range on the created_at column
+
+    def test_one_row_per_item(self):
+        rows = list(iter_order_rows(get_export_queryset()))
+        self.assertEqual(len(rows), 7) # Two items per order, plus the item-less voice order
+        self.assertEqual([row['order_code'] for row in rows[:2]], [self.orders[0].order_code] * 2)
+        self.assertEqual((rows[0]['menuitem_title'], rows[0]['selected_options'], rows[1]['item_price']), ('Ciorbă', 'Smântână', '46.00'))
+        self.assertEqual((rows[-1]['customer_name'], rows[-1]['item_id']), ('Ana', ''))
+        self.assertEqual(len(list(iter_order_rows(get_export_queryset(store_id=self.store.pk)))), 6)
+
+    def test_queries_per_chunk_not_per_order(self):
+        with self.assertNumQueries(4): # Orders, items with their menu items, selected options, the options' items
+            list(iter_order_rows(get_export_queryset(), chunk_size=2000))
+        with self.assertNumQueries(7): # One orders cursor, then three prefetch queries per chunk of two
+            list(iter_order_rows(get_export_queryset(), chunk_size=2))
+
+    def test_formats(self):
+        text = ''.join(iter_export('csv', get_export_queryset()))
+        rows = list(csv.DictReader(io.StringIO(text)))
+        self.assertEqual(list(rows[0]), EXPORT_COLUMNS)
+        self.assertEqual(len(rows), 7)
+        lines = ''.join(iter_export('jsonl', get_export_queryset())).splitlines()
+        self.assertEqual(json.loads(lines[0])['menuitem_title'], 'Ciorbă')
+        with self.assertRaises(ExportFilterError):
+            iter_export('xml', get_export_queryset())
+
+    def test_endpoint_streams_for_managers_only(self):
+        client = APIClient()
+        client.force_authenticate(self.customer)
+        self.assertEqual(client.get('/api/orders/export/').status_code, 403)
+        client.force_authenticate(self.manager)
+        response = client.get('/api/orders/export/', {'file_format': 'jsonl', 'store': self.store.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 6)
+        self.assertEqual(client.get('/api/orders/export/', {'start': 'yesterday'}).status_code, 400)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('export_orders', '--format', 'jsonl', '--chunk-size', '2', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 7)
+        with self.assertRaises(CommandError):
+            call_command('export_orders', '--start', '2024-02-30')
@@ -0,0 +1,110 @@
+"""The fast list serializers and FastJSONRenderer produce the same bytes as the DRF serializers and JSONRenderer."""
+import unittest
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from restaurant import eta
+from restaurant.fast_serializers import FastJSONRenderer, serialize_categories, serialize_menu_items, serialize_orders
+from restaurant.models import Category, MenuItem, OptionChoice, OptionGroup, Order, OrderItem, StoreLocation, UserAddress
+from restaurant.serializers import CategorySerializer, MenuItemSerializer, OrderSerializer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'])
+class FastSerializerParityTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        customer = User.objects.create_user('customer', password='x')
+        courier = User.objects.create_user('courier', password='x')
+        mains = Category.objects.create(slug='mains', title='Mains', image='categories/main dish ș.jpg')
+        drinks = Category.objects.create(slug='drinks', title='Drinks \u2028 & more')
+        dish = MenuItem.objects.create(
+            title='Ciorbă', price=Decimal('30.5'), category=mains, image='menu_items/ciorbă (1).png', featured=True,
+            allergens='gluten', nutritional_info={'kcal': 420, 'protein_g': 12.5, 'notes': ['spicy']},
+        )
+        juice = MenuItem.objects.create(title='Juice', price=Decimal('9.99'), category=drinks)
+        side = MenuItem.objects.create(title='Bread', price=Decimal('2.00'), category=mains, is_standalone_item=False)
+        choice = OptionChoice.objects.create(
+            group=OptionGroup.objects.create(name='Side', menu_item=dish), item=side, price_adjustment=Decimal('-1.5'),
+        )
+        store = StoreLocation.objects.create(name='Central', address='Calea Victoriei 1', latitude=Decimal('44.4355'), longitude=Decimal('26.1025'))
+        address = UserAddress.objects.create(
+            user=customer, nickname='Home', street_address='Str. Lipscani 5', city='Bucuresti', postal_code='030031',
+            latitude=Decimal('44.4310'), longitude=Decimal('26.1000'),
+        )
+        orders = [
+            Order.objects.create(user=customer, store_location=store, delivery_address_link=address, total=Decimal('61')),
+            Order.objects.create(user=customer, store_location=store, total=Decimal('9.99'), status=1, delivery_crew=courier,
+                                 delivering_at=timezone.now() + timedelta(minutes=5)),
+            Order.objects.create(user=None, total=Decimal('0'), status=2, delivered_at=timezone.now(), is_voice_order=True,
+                                 customer_name='Ana', customer_phone='+40700000000', delivery_address='Str. X 1'),
+            Order.objects.create(user=customer, total=Decimal('12.00')), # No store: no ETA, no items
+        ]
+        first = OrderItem.objects.create(order=orders[0], menuitem=dish, quantity=2, price=Decimal('58.00'))
+        first.selected_options.add(choice)
+        OrderItem.objects.create(order=orders[0], menuitem=juice, quantity=1, price=Decimal('9.99'))
+        OrderItem.objects.create(order=orders[1], menuitem=juice, quantity=1, price=Decimal('9.99'))
+
+    def setUp(self):
+        eta._stats.clear()
+        self.request = APIRequestFactory().get('/api/menu-items/')
+
+    def assertSameBytes(self, fast, expected):
+        self.assertEqual(FastJSONRenderer().render(fast), JSONRenderer().render(expected))
+        self.assertEqual(JSONRenderer().render(fast), JSONRenderer().render(expected))
+
+    def test_categories(self):
+        queryset = Category.objects.order_by('pk')
+        expected = CategorySerializer(queryset, many=True, context={'request': self.request}).data
+        self.assertSameBytes(serialize_categories(queryset, self.request), expected)
+
+    def test_menu_items(self):
+        queryset = MenuItem.objects.select_related('category').order_by('pk')
+        expected = MenuItemSerializer(queryset, many=True, context={'request': self.request}).data
+        self.assertSameBytes(serialize_menu_items(queryset, self.request), expected)
+
+    def test_image_urls_without_request(self):
+        queryset = MenuItem.objects.select_related('category').order_by('pk')
+        self.assertSameBytes(serialize_menu_items(queryset, None), MenuItemSerializer(queryset, many=True).data)
+
+    def test_orders(self):
+        queryset = Order.objects.order_by('pk')
+        now = timezone.now()
+        with mock.patch.object(eta.timezone, 'now', lambda: now): # Pending ETAs are max(now, ...)
+            expected = OrderSerializer(queryset.prefetch_related('order_items__selected_options__item'), many=True).data
+            fast = serialize_orders(queryset)
+        self.assertSameBytes(fast, expected)
+        self.assertEqual(fast[0]['date'], timezone.localdate(queryset[0].created_at).isoformat()) # Former Order.date, still sent
+
+    def test_renderer_matches_json_renderer(self):
+        data = {
+            'text': 'line\u2028separator \u2029 ș "quoted"', 'when': timezone.now(), 'amount': Decimal('1.10'),
+            'nested': [1, 2.5, None, True, {'k': (1, 2)}], 3: 'int key', 'big': 2 ** 70,
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(
+            FastJSONRenderer().render(data, 'application/json; indent=4'), JSONRenderer().render(data, 'application/json; indent=4'),
+        )
+
+    @unittest.skipUnless(orjson, "orjson is not installed")
+    def test_renderer_uses_orjson(self):
+        data = {'title': 'Ciorbă', 'price': Decimal('12.50'), 'when': timezone.now(), 'items': [1, 2.5, None]}
+        with mock.patch.object(orjson, 'dumps', wraps=orjson.dumps) as dumps:
+            rendered = FastJSONRenderer().render(data)
+        dumps.assert_called_once()
+        self.assertEqual(rendered, JSONRenderer().render(data))
+        with mock.patch.object(orjson, 'dumps') as dumps:
+            FastJSONRenderer().render(data, 'application/json; indent=4') # Pretty output stays with JSONRenderer
+        dumps.assert_not_called()
+
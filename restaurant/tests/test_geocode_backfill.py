@@ -0,0 +1,65 @@
+"""`manage.py geocode_backfill`: fills missing coordinates from the cache and the provider, resumably."""
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+
+from restaurant import geocoding
+from restaurant.geocoding import FixtureProvider, GeocodingError, normalize_address, store_cached
+from restaurant.models import StoreLocation, UserAddress
+
+
+class FlakyFixtureProvider(FixtureProvider):
+    """FixtureProvider that fails for addresses containing 'flaky'."""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    def geocode(self, address_str):
+        self.calls.append(address_str)
+        if 'flaky' in address_str.lower():
+            raise GeocodingError('timeout')
+        return super().geocode(address_str)
+
+
+class GeocodeBackfillTests(TestCase):
+    def setUp(self):
+        self.provider = FlakyFixtureProvider()
+        patcher = mock.patch.object(geocoding, '_provider', self.provider)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        user = User.objects.create_user('customer', password='x')
+        for nickname, street in (('Home', 'Str. Lipscani 5'), ('Work', 'Str. Lipscani 5'), ('Cached', 'Bd. Unirii 1'), ('Flaky', 'Str. Flaky 1')):
+            UserAddress.objects.create(user=user, nickname=nickname, street_address=street, city='Bucuresti', postal_code='030031')
+        StoreLocation.objects.create(name='Central', address='Calea Victoriei 1')
+        store_cached({normalize_address('Bd. Unirii 1, 030031, Bucuresti'): (44.42, 26.11)}, 'test')
+
+    def backfill(self, *args):
+        out, err = StringIO(), StringIO()
+        call_command('geocode_backfill', '--workers', '2', '--chunk-size', '2', *args, stdout=out, stderr=err)
+        return out.getvalue()
+
+    def test_fills_missing_coordinates(self):
+        output = self.backfill()
+        self.assertIn('addresses: 3 row(s) geocoded, 1 could not be resolved.', output)
+        self.assertIn('stores: 1 row(s) geocoded', output)
+        home, work = UserAddress.objects.filter(nickname__in=['Home', 'Work']).order_by('nickname')
+        self.assertEqual((home.latitude, home.longitude), (work.latitude, work.longitude))
+        self.assertEqual(UserAddress.objects.get(nickname='Cached').latitude, Decimal('44.420000'))
+        self.assertEqual(self.provider.calls.count('Str. Lipscani 5, 030031, Bucuresti'), 1) # Same address, one lookup
+        self.assertNotIn('Bd. Unirii 1, 030031, Bucuresti', self.provider.calls)
+
+    def test_rerun_only_retries_unresolved_rows(self):
+        self.backfill()
+        self.provider.calls.clear()
+        output = self.backfill('--only', 'addresses')
+        self.assertIn('addresses: 0 row(s) geocoded, 1 could not be resolved.', output)
+        self.assertEqual(self.provider.calls, ['Str. Flaky 1, 030031, Bucuresti'])
+
+    def test_dry_run_writes_nothing(self):
+        self.backfill('--dry-run')
+        self.assertFalse(UserAddress.objects.filter(latitude__isnull=False).exists())
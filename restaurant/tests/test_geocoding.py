@@ -0,0 +1,76 @@
+"""Address normalisation, the geocode cache and the provider interface."""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.test import TestCase
+from django.utils import timezone
+
+from restaurant.geocoding import (
+    FixtureProvider, GeocodingError, GeocodingProvider, geocode, geocode_many, normalize_address,
+)
+from restaurant.models import GeocodeCache
+
+
+class CountingProvider(GeocodingProvider):
+    name = 'counting'
+
+    def __init__(self, answers):
+        self.answers = answers
+        self.calls = []
+
+    def geocode(self, address_str):
+        self.calls.append(address_str)
+        answer = self.answers.get(normalize_address(address_str), (None, None))
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+
+class GeocodingTests(TestCase):
+    def setUp(self):
+        self.provider = CountingProvider({
+            'calea victoriei 1, bucuresti': (44.4355123456, 26.1025),
+            'str offline 1': GeocodingError('timeout'),
+        })
+
+    def test_normalize_address(self):
+        self.assertEqual(normalize_address('  Calea  Victoriei 1 ,București. '), 'calea victoriei 1, bucuresti')
+        self.assertEqual(normalize_address(None), '')
+
+    def test_provider_subclasses_must_implement_geocode(self):
+        class Incomplete(GeocodingProvider):
+            pass
+
+        with self.assertRaises(TypeError):
+            Incomplete()
+
+    def test_results_are_cached_by_normalised_address(self):
+        self.assertEqual(geocode('Calea Victoriei 1, București', self.provider), (Decimal('44.435512'), Decimal('26.102500')))
+        self.assertEqual(geocode('calea victoriei 1 , bucuresti', self.provider), (Decimal('44.435512'), Decimal('26.102500')))
+        self.assertEqual(len(self.provider.calls), 1)
+
+    def test_not_found_is_cached_for_less_time(self):
+        self.assertEqual(geocode('Nowhere 0', self.provider), (None, None))
+        self.assertEqual(geocode('Nowhere 0', self.provider), (None, None))
+        self.assertEqual(len(self.provider.calls), 1)
+        GeocodeCache.objects.update(updated_at=timezone.now() - timedelta(days=2))
+        geocode('Nowhere 0', self.provider)
+        self.assertEqual(len(self.provider.calls), 2)
+
+    def test_errors_are_not_cached(self):
+        with self.assertLogs('restaurant.geocoding', 'WARNING'):
+            self.assertEqual(geocode('Str. Offline 1', self.provider), (None, None))
+        self.assertFalse(GeocodeCache.objects.exists())
+
+    def test_geocode_many_looks_up_each_distinct_address_once(self):
+        geocode('Nowhere 0', self.provider)
+        results = geocode_many(['Calea Victoriei 1, Bucuresti', 'CALEA VICTORIEI 1, BUCURESTI', 'Nowhere 0', ''], self.provider)
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(results[2:], [(None, None), (None, None)])
+        self.assertEqual(self.provider.calls, ['Nowhere 0', 'Calea Victoriei 1, Bucuresti'])
+
+    def test_fixture_provider_is_deterministic(self):
+        provider = FixtureProvider()
+        latitude, longitude = provider.geocode('Str. Lipscani 5')
+        self.assertEqual(provider.geocode('str lipscani 5'), (latitude, longitude))
+        self.assertTrue(44.33 <= latitude <= 44.54 and 25.97 <= longitude <= 26.23)
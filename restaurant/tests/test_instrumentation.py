@@ -0,0 +1,84 @@
+"""Request instrumentation: per-route histograms, N+1 detection, Server-Timing and the metrics endpoint."""
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from restaurant.instrumentation import Histogram, InstrumentationMiddleware, MetricsRegistry, RequestStats, _current, registry, timed_serialization
+from restaurant.models import Category
+
+
+class HistogramTests(SimpleTestCase):
+    def test_buckets_and_render(self):
+        histogram = Histogram((1, 5))
+        for value in (0, 1, 3, 9):
+            histogram.observe(value)
+        self.assertEqual((histogram.counts, histogram.sum, histogram.count), ([2, 1, 1], 13, 4))
+
+        metrics = MetricsRegistry()
+        stats = RequestStats()
+        stats.queries, stats.repeated_query = 3, 'SELECT 1'
+        metrics.record('api/x/', 'GET', 404, stats, size=None)
+        text = metrics.render()
+        self.assertIn('http_request_db_queries_bucket{route="api/x/",method="GET",le="5"} 1', text)
+        self.assertIn('http_request_db_queries_bucket{route="api/x/",method="GET",le="+Inf"} 1', text)
+        self.assertIn('http_request_duration_seconds_count{route="api/x/",method="GET",status="4xx"} 1', text)
+        self.assertIn('http_request_repeated_queries_total{route="api/x/",method="GET"} 1', text)
+        self.assertNotIn('http_response_size_bytes_bucket', text) # Streaming responses have no size
+
+    def test_nested_serializers_are_timed_once(self):
+        stats = RequestStats()
+        token = _current.set(stats)
+        try:
+            with timed_serialization():
+                with timed_serialization():
+                    pass
+                inner = stats.serializer_time
+        finally:
+            _current.reset(token)
+        self.assertEqual(inner, 0.0) # Only the outermost block adds its time
+        self.assertGreater(stats.serializer_time, 0.0)
+
+
+@override_settings(INSTRUMENTATION_ENABLED=True, INSTRUMENTATION_REPEATED_QUERY_THRESHOLD=2, METRICS_TOKEN='metrics-token')
+class InstrumentationMiddlewareTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Category.objects.create(title='Pizza', slug='pizza')
+
+    def setUp(self):
+        registry.reset()
+        self.addCleanup(registry.reset)
+
+    def test_requests_are_recorded_by_route(self):
+        self.assertEqual(self.client.get('/api/categories/').status_code, 200)
+        self.client.get('/api/categories/9999/')
+        self.client.get('/nowhere/')
+        text = registry.render()
+        self.assertIn('http_request_duration_seconds_count{route="api/categories/",method="GET",status="2xx"} 1', text)
+        self.assertIn('route="api/categories/(?P<pk>[^/.]+)/",method="GET",status="4xx"} 1', text) # Router patterns are regexes
+        self.assertIn('route="unmatched"', text)
+        self.assertNotIn('categories/9999', text) # Labels use the route pattern, not the path
+
+    def test_repeated_queries_are_flagged(self):
+        def view(request):
+            list(Category.objects.all())
+            list(Category.objects.all())
+            return HttpResponse('ok')
+
+        request = RequestFactory().get('/x/')
+        request.resolver_match = None
+        with self.assertLogs('restaurant.instrumentation', 'WARNING') as logs:
+            InstrumentationMiddleware(view)(request)
+        self.assertIn('Repeated query on GET unmatched (2 times)', logs.output[0])
+        self.assertIn('http_request_repeated_queries_total{route="unmatched",method="GET"} 1', registry.render())
+
+    @override_settings(INSTRUMENTATION_SERVER_TIMING=True)
+    def test_server_timing_header(self):
+        response = self.client.get('/api/categories/')
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", ser;dur=[\d.]+, total;dur=[\d.]+$')
+
+    def test_metrics_endpoint_requires_the_token(self):
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+        self.assertEqual(self.client.get('/api/metrics/', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        response = self.client.get('/api/metrics/', HTTP_AUTHORIZATION='Bearer metrics-token')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('# TYPE http_request_db_queries histogram', response.content.decode())
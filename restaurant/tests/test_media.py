@@ -0,0 +1,75 @@
+"""Content-hashed uploads and the media view's caching, conditional and range handling."""
+import shutil
+import tempfile
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+
+from restaurant.storage import name_digest
+
+PAYLOAD = bytes(range(256)) * 4
+
+
+class MediaTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        settings_override = override_settings(MEDIA_ROOT=self.root, INSTRUMENTATION_ENABLED=False, MEDIA_SERVE_HANDOFF=None)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.name = default_storage.save('menu_items/dish.png', ContentFile(PAYLOAD))
+
+    def test_uploads_get_content_hashed_names(self):
+        self.assertRegex(self.name, r'^menu_items/dish\.[0-9a-f]{12}\.png$')
+        self.assertEqual(default_storage.save('menu_items/dish.png', ContentFile(PAYLOAD)), self.name) # Same bytes, same file
+        changed = default_storage.save('menu_items/dish.png', ContentFile(PAYLOAD[::-1]))
+        self.assertNotEqual(changed, self.name)
+        self.assertEqual(default_storage.open(self.name).read(), PAYLOAD)
+
+    def test_hashed_files_are_immutable(self):
+        response = self.client.get(f'/media/{self.name}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), PAYLOAD)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(response['ETag'], f'"{name_digest(self.name)}"')
+        self.assertEqual(response['Content-Type'], 'image/png')
+
+        revalidated = self.client.get(f'/media/{self.name}', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+
+    def test_unhashed_files_are_revalidated(self):
+        with open(f'{self.root}/legacy.png', 'wb') as legacy:
+            legacy.write(PAYLOAD)
+        response = self.client.get('/media/legacy.png')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        self.assertEqual(self.client.get('/media/legacy.png', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_byte_ranges(self):
+        path = f'/media/{self.name}'
+        cases = [('bytes=0-9', 0, 9), ('bytes=1000-', 1000, 1023), ('bytes=-24', 1000, 1023), ('bytes=1020-5000', 1020, 1023)]
+        for header, start, end in cases:
+            with self.subTest(header=header):
+                response = self.client.get(path, HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(response['Content-Range'], f'bytes {start}-{end}/{len(PAYLOAD)}')
+                self.assertEqual(b''.join(response.streaming_content), PAYLOAD[start:end + 1])
+
+        self.assertEqual(self.client.get(path, HTTP_RANGE='bytes=2000-').status_code, 416)
+        self.assertEqual(self.client.get(path, HTTP_RANGE='bytes=0-1,5-6').status_code, 200) # Multiple ranges: whole file
+        self.assertEqual(self.client.get(path, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"').status_code, 200)
+
+    def test_handoff_to_front_server(self):
+        with self.settings(MEDIA_SERVE_HANDOFF='x-accel-redirect'):
+            response = self.client.get(f'/media/{self.name}')
+            self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.name}')
+            self.assertEqual(response.content, b'')
+            self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        with self.settings(MEDIA_SERVE_HANDOFF='x-sendfile'):
+            self.assertEqual(self.client.get(f'/media/{self.name}')['X-Sendfile'], default_storage.path(self.name))
+
+    def test_missing_and_outside_files(self):
+        self.assertEqual(self.client.get('/media/menu_items/nope.png').status_code, 404)
+        self.assertEqual(self.client.get('/media/../manage.py').status_code, 404)
+        self.assertEqual(self.client.get('/media/menu_items/').status_code, 404)
+        self.assertEqual(self.client.post(f'/media/{self.name}').status_code, 405)
@@ -0,0 +1,89 @@
+"""Outbox draining: batching, retry with backoff, giving up, and isolating rejected payloads."""
+from datetime import timedelta
+
+import requests
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from restaurant.models import WebhookOutbox
+from restaurant.outbox import DELIVERED, FAILED, PENDING, drain_outbox, retry_delay
+
+URL = 'https://hooks.example/outbox'
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.text = 'error' if status_code >= 400 else ''
+
+
+class FakeSession:
+    """Answers each POST with the next status (or exception); a callable decides per payload."""
+
+    def __init__(self, *answers):
+        self.answers = list(answers)
+        self.payloads = []
+
+    def post(self, url, json, timeout):
+        self.payloads.append(json)
+        answer = self.answers.pop(0) if len(self.answers) > 1 else self.answers[0]
+        if callable(answer):
+            answer = answer(json)
+        if isinstance(answer, Exception):
+            raise answer
+        return FakeResponse(answer)
+
+
+@override_settings(OUTBOX_MAX_ATTEMPTS=3, OUTBOX_BACKOFF_BASE_SECONDS=10, OUTBOX_BACKOFF_MAX_SECONDS=60)
+class DrainOutboxTests(TestCase):
+    def event(self, name):
+        return WebhookOutbox.objects.create(payload=[{'name': name, 'phone_number': '+40700000000'}])
+
+    def test_due_events_are_sent_in_one_batch(self):
+        first, second = self.event('Ana'), self.event('Ion')
+        session = FakeSession(200)
+        result = drain_outbox(session=session, webhook_url=URL)
+        self.assertEqual((result.batches, result.delivered), (1, 2))
+        self.assertEqual(session.payloads, [first.payload + second.payload])
+        self.assertEqual(set(WebhookOutbox.objects.values_list('status', flat=True)), {DELIVERED})
+
+    def test_server_errors_are_retried_with_backoff(self):
+        event = self.event('Ana')
+        before = timezone.now()
+        result = drain_outbox(session=FakeSession(requests.ConnectionError('down')), webhook_url=URL)
+        self.assertEqual(result.retried, 1)
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.attempts, event.last_error), (PENDING, 1, 'down'))
+        self.assertGreaterEqual(event.next_attempt_at, before + timedelta(seconds=5)) # First retry: 5-10 s
+        self.assertLessEqual(event.next_attempt_at, timezone.now() + timedelta(seconds=10))
+
+        session = FakeSession(200)
+        self.assertEqual(drain_outbox(session=session, webhook_url=URL).batches, 0) # Not due yet
+        WebhookOutbox.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(drain_outbox(session=session, webhook_url=URL).delivered, 1)
+
+    def test_gives_up_after_max_attempts(self):
+        event = self.event('Ana')
+        with self.assertLogs('restaurant.outbox', 'ERROR'):
+            for _ in range(3):
+                drain_outbox(session=FakeSession(503), webhook_url=URL)
+                WebhookOutbox.objects.update(next_attempt_at=timezone.now())
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.attempts), (FAILED, 3))
+        self.assertEqual(drain_outbox(session=FakeSession(200), webhook_url=URL).batches, 0)
+
+    def test_rejected_batch_is_resent_one_by_one(self):
+        good, bad = self.event('Ana'), self.event('Bad')
+        session = FakeSession(lambda payload: 400 if any(entry['name'] == 'Bad' for entry in payload) else 200)
+        result = drain_outbox(session=session, webhook_url=URL)
+        self.assertEqual(len(session.payloads), 3) # The batch, then each event alone
+        self.assertEqual((result.delivered, result.retried), (1, 1))
+        good.refresh_from_db()
+        bad.refresh_from_db()
+        self.assertEqual((good.status, bad.status, bad.attempts), (DELIVERED, PENDING, 1))
+
+    def test_retry_delay_doubles_up_to_the_cap(self):
+        for attempts, low, high in ((1, 5, 10), (2, 10, 20), (3, 20, 40), (10, 30, 60)):
+            delay = retry_delay(attempts, base=10, cap=60).total_seconds()
+            self.assertTrue(low <= delay <= high, (attempts, delay))
@@ -0,0 +1,496 @@
+"""
+Query-count regression tests for every route in restaurant/urls.py.
+
+Each endpoint runs once with SMALL and once with LARGE rows of whatever it
+renders or touches (menu items, cart items, order items, pings...). The two
+query counts must be equal, so a change that adds per-row queries fails
+here, and must stay within the endpoint's QUERY_BUDGETS entry. In-process
+caches (roles, token generations, API keys, store index, ETA stats) are
+cleared before every measured request, so counts are cold-cache counts.
+"""
+from contextlib import ExitStack, contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.test import TestCase, override_settings
+from django.urls import URLResolver
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_api_key.models import APIKey
+
+from restaurant import eta, geocoding, store_index, urls
+from restaurant.api_keys import verified_keys
+from restaurant.models import (
+    Cart, Category, MenuItem, OptionChoice, OptionGroup, Order, OrderItem, StoreLocation, UserAddress, UserProfile,
+)
+from restaurant.serializers import ClaimsTokenObtainPairSerializer
+from restaurant.tracking import tracker
+
+SMALL, LARGE = 1, 50
+
+# Queries allowed per request, keyed by '<url name> <METHOD>'. Every route
+# in restaurant/urls.py must be listed (see test_every_route_has_a_budget).
+QUERY_BUDGETS = {
+    'category-list GET': 1,
+    'category-list POST': 4,
+    'category-detail GET': 2,
+    'category-detail PUT': 5,
+    'category-detail PATCH': 5,
+    'category-detail DELETE': 5,
+    'menuitem-list GET': 1,
+    'menuitem-list POST': 4,
+    'menuitem-detail GET': 5,
+    'menuitem-detail PUT': 5,
+    'menuitem-detail PATCH': 5,
+    'menuitem-detail DELETE': 13,
+    'cart-item-list GET': 3,
+    'cart-item-list POST': 10,
+    'cart-item-detail GET': 3,
+    'cart-item-detail PUT': 4,
+    'cart-item-detail PATCH': 4,
+    'cart-item-detail DELETE': 4,
+    'cart-item-flush DELETE': 4,
+    'order-list GET': 6,
+    'order-list POST': 17,
+    'order-detail GET': 7,
+    'order-detail PUT': 12,
+    'order-detail PATCH': 12,
+    'order-detail DELETE': 8,
+    'order-assign-delivery-crew PUT': 12,
+    'order-update-order-status-to-delivered PUT': 12,
+    'order-dispatch-orders POST': 10,
+    'order-courier-location GET': 4,
+    'order-export GET': 6,
+    'group-list GET': 2,
+    'group-add-user PUT': 4,
+    'group-remove-user DELETE': 5,
+    'direct-order-create POST': 12,
+    'delivery-eligibility GET': 3,
+    'delivery-eligibility POST': 5,
+    'courier-locations POST': 2,
+    'metrics GET': 0,
+    'async-category-list GET': 1,
+    'async-menuitem-list GET': 1,
+    'async-menuitem-detail GET': 4,
+    'async-cart-item-list GET': 3,
+    'async-order-status GET': 4,
+}
+
+
+class JSONClient(APIClient):
+    def generic_json(self, method, path, payload):
+        return getattr(self, method.lower())(path, payload, format='json')
+
+
+def reset_process_caches():
+    cache.clear()
+    verified_keys.clear()
+    eta._stats.clear()
+    store_index._index = None
+    geocoding._provider = None
+    tracker.reset()
+
+
+@contextmanager
+def count_queries():
+    """Counts queries on every database alias, like the instrumentation middleware."""
+    queries = []
+
+    def record(execute, sql, params, many, context):
+        queries.append(sql)
+        return execute(sql, params, many, context)
+
+    with ExitStack() as stack:
+        for alias in settings.DATABASES:
+            stack.enter_context(connections[alias].execute_wrapper(record))
+        yield queries
+
+
+def route_keys(patterns):
+    """'<url name> <METHOD>' for every route and HTTP method in a URLconf."""
+    keys = set()
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            keys |= route_keys(pattern.url_patterns)
+            continue
+        callback = pattern.callback
+        if hasattr(callback, 'actions'): # ViewSet routes
+            methods = callback.actions
+        elif hasattr(callback, 'view_class'): # APIView
+            methods = [method for method in callback.view_class.http_method_names if hasattr(callback.view_class, method)]
+        else: # Plain function views
+            methods = ['get']
+        keys |= {f'{pattern.name} {method.upper()}' for method in methods if method not in ('options', 'head')}
+    return keys
+
+
+@override_settings(
+    GEOCODING_PROVIDER='restaurant.geocoding.FixtureProvider',
+    GEOCODING_FIXTURE_PATH=None,
+    INSTRUMENTATION_ENABLED=False,
+    TRACKING_BACKGROUND_FLUSH=False,
+    METRICS_TOKEN='metrics-token',
+    ALLOWED_HOSTS=['testserver'],
+)
+class QueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        manager_group = Group.objects.get_or_create(name='Manager')[0]
+        crew_group = Group.objects.get_or_create(name='Delivery crew')[0]
+        cls.store = StoreLocation.objects.create(
+            name='Central', address='Calea Victoriei 1', latitude=Decimal('44.4355'), longitude=Decimal('26.1025'),
+        )
+        cls.customer = User.objects.create_user('customer', password='x')
+        cls.manager = User.objects.create_user('manager', password='x')
+        cls.manager.groups.add(manager_group)
+        cls.courier = User.objects.create_user('courier', password='x')
+        cls.courier.groups.add(crew_group)
+        UserProfile.objects.filter(user=cls.courier).update(store_location=cls.store)
+        cls.admin = User.objects.create_user('admin', password='x', is_staff=True)
+        cls.category = Category.objects.create(slug='mains', title='Mains')
+        cls.dish = MenuItem.objects.create(title='Dish', price=Decimal('30.00'), category=cls.category)
+        cls.side = MenuItem.objects.create(title='Side', price=Decimal('5.00'), category=cls.category, is_standalone_item=False)
+        _, cls.api_key = APIKey.objects.create_key(name='voice')
+
+    # --- helpers ---
+
+    def client_for(self, user=None):
+        client = JSONClient()
+        if user:
+            token = ClaimsTokenObtainPairSerializer.get_token(user).access_token
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        return client
+
+    def assertConstantQueries(self, key, build):
+        """
+        build(size) creates the data and returns a zero-argument callable
+        that sends the request. Runs SMALL and LARGE, each in a rolled-back
+        transaction, and compares their query counts.
+        """
+        counts = {}
+        for size in (SMALL, LARGE):
+            with transaction.atomic():
+                send = build(size)
+                reset_process_caches()
+                with count_queries() as queries:
+                    response = send()
+                    if response.streaming:
+                        b''.join(response.streaming_content) # Export queries run while streaming
+                self.assertLess(response.status_code, 300, f"{key} at size {size}: {getattr(response, 'data', response)}")
+                counts[size] = queries
+                transaction.set_rollback(True)
+
+        small, large = len(counts[SMALL]), len(counts[LARGE])
+        self.assertEqual(small, large, f"{key}: {small} queries for {SMALL} rows, {large} for {LARGE}:\n" + '\n'.join(counts[LARGE]))
+        self.assertLessEqual(large, QUERY_BUDGETS[key], f"{key}: over budget:\n" + '\n'.join(counts[LARGE]))
+
+    def make_menu_items(self, count, with_options=False):
+        categories = Category.objects.bulk_create(Category(slug=f'c-{i}', title=f'C {i}') for i in range(count))
+        items = MenuItem.objects.bulk_create(
+            MenuItem(title=f'Item {i}', price=Decimal('20.00'), category=categories[i]) for i in range(count)
+        )
+        if with_options:
+            groups = OptionGroup.objects.bulk_create(OptionGroup(name='Side', menu_item=item) for item in items)
+            OptionChoice.objects.bulk_create(OptionChoice(group=group, item=self.side) for group in groups)
+        return items
+
+    def make_options(self, count, menu_item=None):
+        """count option choices, each in its own group of menu_item."""
+        groups = OptionGroup.objects.bulk_create(OptionGroup(name=f'G{i}', menu_item=menu_item or self.dish) for i in range(count))
+        sides = MenuItem.objects.bulk_create(
+            MenuItem(title=f'Side {i}', price=Decimal('2.00'), category=self.category, is_standalone_item=False) for i in range(count)
+        )
+        return OptionChoice.objects.bulk_create(
+            OptionChoice(group=group, item=side, price_adjustment=Decimal('1.00')) for group, side in zip(groups, sides)
+        )
+
+    def make_cart(self, count, user=None):
+        items = self.make_menu_items(count)
+        choices = self.make_options(count)
+        carts = Cart.objects.bulk_create(
+            Cart(user=user or self.customer, menuitem=item, quantity=1, unit_price=Decimal('21.00'), price=Decimal('21.00'))
+            for item in items
+        )
+        Cart.selected_options.through.objects.bulk_create(
+            Cart.selected_options.through(cart_id=cart.pk, optionchoice_id=choice.pk) for cart, choice in zip(carts, choices)
+        )
+        return carts
+
+    def make_orders(self, count, items_per_order=1, **fields):
+        fields = {'user': self.customer, 'store_location': self.store, 'total': Decimal('21.00'), **fields}
+        start = Order.objects.count()
+        orders = Order.objects.bulk_create(Order(order_code=f'T-{start + i}', **fields) for i in range(count))
+        menu = self.make_menu_items(items_per_order)
+        choices = self.make_options(items_per_order)
+        order_items = OrderItem.objects.bulk_create(
+            OrderItem(order=order, menuitem=item, quantity=1, price=Decimal('21.00')) for order in orders for item in menu
+        )
+        through = OrderItem.selected_options.through
+        through.objects.bulk_create(
+            through(orderitem_id=order_item.pk, optionchoice_id=choice.pk)
+            for order_item, choice in zip(order_items, choices * count)
+        )
+        return orders
+
+    # --- coverage ---
+
+    def test_every_route_has_a_budget(self):
+        self.assertEqual(route_keys(urls.urlpatterns), set(QUERY_BUDGETS))
+
+    # --- categories ---
+
+    def test_category_list(self):
+        def build(size):
+            self.make_menu_items(size)
+            return lambda: self.client_for().get('/api/categories/')
+        self.assertConstantQueries('category-list GET', build)
+
+    def test_category_create(self):
+        def build(size):
+            self.make_menu_items(size)
+            return lambda: self.client_for(self.manager).post('/api/categories/', {'slug': 'new', 'title': 'New'}, format='json')
+        self.assertConstantQueries('category-list POST', build)
+
+    def test_category_detail(self):
+        for method in ('GET', 'PUT', 'PATCH', 'DELETE'):
+            with self.subTest(method=method):
+                def build(size):
+                    self.make_menu_items(size)
+                    category = Category.objects.create(slug='target', title='Target')
+                    payload = {'slug': 'target', 'title': 'Renamed'}
+                    return lambda: self.client_for(self.manager).generic_json(method, f'/api/categories/{category.pk}/', payload)
+                self.assertConstantQueries(f'category-detail {method}', build)
+
+    # --- menu items ---
+
+    def test_menu_item_list(self):
+        def build(size):
+            self.make_menu_items(size, with_options=True)
+            return lambda: self.client_for().get('/api/menu-items/')
+        self.assertConstantQueries('menuitem-list GET', build)
+
+    def test_menu_item_create(self):
+        def build(size):
+            self.make_menu_items(size)
+            payload = {'title': 'New dish', 'price': '12.50', 'category_id': self.category.pk}
+            return lambda: self.client_for(self.manager).post('/api/menu-items/', payload, format='json')
+        self.assertConstantQueries('menuitem-list POST', build)
+
+    def test_menu_item_detail(self):
+        for method in ('GET', 'PUT', 'PATCH', 'DELETE'):
+            with self.subTest(method=method):
+                def build(size):
+                    item = MenuItem.objects.create(title='Target', price=Decimal('10.00'), category=self.category)
+                    self.make_options(size, menu_item=item) # Option groups are what the detail view renders
+                    payload = {'title': 'Renamed', 'price': '11.00', 'category_id': self.category.pk}
+                    return lambda: self.client_for(self.manager).generic_json(method, f'/api/menu-items/{item.pk}/', payload)
+                self.assertConstantQueries(f'menuitem-detail {method}', build)
+
+    # --- cart ---
+
+    def test_cart_list(self):
+        def build(size):
+            self.make_cart(size)
+            return lambda: self.client_for(self.customer).get('/api/cart/items/')
+        self.assertConstantQueries('cart-item-list GET', build)
+
+    def test_cart_add(self):
+        def build(size):
+            # Existing lines of the same dish with other options: the merge check compares all of them
+            choices = self.make_options(size + 1)
+            carts = Cart.objects.bulk_create(
+                Cart(user=self.customer, menuitem=self.dish, quantity=1, unit_price=Decimal('31.00'), price=Decimal('31.00'))
+                for _ in range(size)
+            )
+            Cart.selected_options.through.objects.bulk_create(
+                Cart.selected_options.through(cart_id=cart.pk, optionchoice_id=choice.pk) for cart, choice in zip(carts, choices)
+            )
+            payload = {'menuitem_id': self.dish.pk, 'quantity': 1, 'selected_options': [choices[-1].pk]}
+            return lambda: self.client_for(self.customer).post('/api/cart/items/', payload, format='json')
+        self.assertConstantQueries('cart-item-list POST', build)
+
+    def test_cart_detail(self):
+        for method in ('GET', 'PUT', 'PATCH', 'DELETE'):
+            with self.subTest(method=method):
+                def build(size):
+                    cart = Cart.objects.create(user=self.customer, menuitem=self.dish, quantity=1, unit_price=Decimal('30.00'), price=Decimal('30.00'))
+                    cart.selected_options.set(self.make_options(size))
+                    return lambda: self.client_for(self.customer).generic_json(method, f'/api/cart/items/{cart.pk}/', {'quantity': 2})
+                self.assertConstantQueries(f'cart-item-detail {method}', build)
+
+    def test_cart_flush(self):
+        def build(size):
+            self.make_cart(size)
+            return lambda: self.client_for(self.customer).delete('/api/cart/items/flush/')
+        self.assertConstantQueries('cart-item-flush DELETE', build)
+
+    # --- orders ---
+
+    def test_order_list(self):
+        for role in ('manager', 'courier', 'customer'):
+            with self.subTest(role=role):
+                def build(size):
+                    self.make_orders(size, items_per_order=2, delivery_crew=self.courier)
+                    return lambda: self.client_for(getattr(self, role)).get('/api/orders/')
+                self.assertConstantQueries('order-list GET', build)
+
+    def test_order_create(self):
+        def build(size):
+            self.make_cart(size)
+            return lambda: self.client_for(self.customer).post('/api/orders/', {}, format='json')
+        self.assertConstantQueries('order-list POST', build)
+
+    def test_order_detail(self):
+        for method in ('GET', 'PUT', 'PATCH', 'DELETE'):
+            with self.subTest(method=method):
+                def build(size):
+                    order = self.make_orders(1, items_per_order=size)[0]
+                    payload = {'user': self.customer.pk, 'total': '21.00', 'status': 0}
+                    return lambda: self.client_for(self.manager).generic_json(method, f'/api/orders/{order.pk}/', payload)
+                self.assertConstantQueries(f'order-detail {method}', build)
+
+    def test_order_assign_delivery_crew(self):
+        def build(size):
+            order = self.make_orders(1, items_per_order=size)[0]
+            payload = {'delivery_crew_id': self.courier.pk}
+            return lambda: self.client_for(self.manager).put(f'/api/orders/{order.pk}/assign_delivery_crew/', payload, format='json')
+        self.assertConstantQueries('order-assign-delivery-crew PUT', build)
+
+    def test_order_mark_delivered(self):
+        def build(size):
+            order = self.make_orders(1, items_per_order=size, delivery_crew=self.courier, status=1, delivering_at=timezone.now())[0]
+            return lambda: self.client_for(self.courier).put(f'/api/orders/{order.pk}/update_order_status_to_delivered/')
+        self.assertConstantQueries('order-update-order-status-to-delivered PUT', build)
+
+    def test_order_dispatch(self):
+        def build(size):
+            crew = Group.objects.get(name='Delivery crew')
+            couriers = User.objects.bulk_create(User(username=f'crew-{i}') for i in range(size))
+            crew.user_set.add(*couriers)
+            UserProfile.objects.bulk_create(UserProfile(user=courier, store_location=self.store) for courier in couriers)
+            self.make_orders(size, delivery_address=f'Strada Test {size}')
+            payload = {'store_id': self.store.pk}
+            return lambda: self.client_for(self.manager).post('/api/orders/dispatch/', payload, format='json')
+        self.assertConstantQueries('order-dispatch-orders POST', build)
+
+    def test_order_courier_location(self):
+        def build(size):
+            order = self.make_orders(size, delivery_crew=self.courier)[0]
+            return lambda: self.client_for(self.customer).get(f'/api/orders/{order.pk}/courier-location/')
+        self.assertConstantQueries('order-courier-location GET', build)
+
+    def test_order_export(self):
+        def build(size):
+            self.make_orders(size, items_per_order=2)
+            return lambda: self.client_for(self.manager).get('/api/orders/export/?file_format=jsonl')
+        self.assertConstantQueries('order-export GET', build)
+
+    # --- groups ---
+
+    def test_group_list(self):
+        def build(size):
+            Group.objects.bulk_create(Group(name=f'group-{i}') for i in range(size))
+            return lambda: self.client_for(self.admin).get('/api/groups/')
+        self.assertConstantQueries('group-list GET', build)
+
+    def test_group_membership(self):
+        for key, method in (('group-add-user PUT', 'PUT'), ('group-remove-user DELETE', 'DELETE')):
+            with self.subTest(key=key):
+                def build(size):
+                    groups = Group.objects.bulk_create(Group(name=f'group-{i}') for i in range(size))
+                    self.customer.groups.add(*groups)
+                    target = groups[0]
+                    path = f"/api/groups/{target.pk}/{'add_user' if method == 'PUT' else 'remove_user'}/"
+                    return lambda: self.client_for(self.admin).generic_json(method, path, {'username': 'customer'})
+                self.assertConstantQueries(key, build)
+
+    # --- other views ---
+
+    def test_direct_order(self):
+        def build(size):
+            items = self.make_menu_items(size)
+            payload = {
+                'items': [{'menuitem_id': item.pk, 'quantity': 1} for item in items],
+                'customer_name': 'Phone Customer', 'customer_phone': '+40700000000', 'delivery_address': 'Strada Test 1',
+            }
+            client = JSONClient(HTTP_AUTHORIZATION=f'Api-Key {self.api_key}')
+            return lambda: client.post('/api/direct-order/', payload, format='json')
+        self.assertConstantQueries('direct-order-create POST', build)
+
+    def make_addresses(self, count, geocoded=True):
+        point = {'latitude': Decimal('44.4300'), 'longitude': Decimal('26.1000')} if geocoded else {}
+        return UserAddress.objects.bulk_create(
+            UserAddress(user=self.customer, nickname=f'A{i}', street_address=f'Strada {i}', city='Bucuresti', postal_code='010000', **point)
+            for i in range(count)
+        )
+
+    def test_delivery_eligibility_saved(self):
+        def build(size):
+            self.make_addresses(size)
+            return lambda: self.client_for(self.customer).get('/api/delivery-eligibility/')
+        self.assertConstantQueries('delivery-eligibility GET', build)
+
+    def test_delivery_eligibility_mixed(self):
+        def build(size):
+            addresses = self.make_addresses(size, geocoded=False)
+            payload = {
+                'address_ids': [address.pk for address in addresses],
+                'addresses': [f'Bulevardul Test {i}, Bucuresti' for i in range(size)],
+                'coordinates': [],
+            }
+            return lambda: self.client_for(self.customer).post('/api/delivery-eligibility/', payload, format='json')
+        self.assertConstantQueries('delivery-eligibility POST', build)
+
+    def test_courier_locations(self):
+        def build(size):
+            now = timezone.now()
+            payload = {'pings': [
+                {'latitude': 44.43, 'longitude': 26.10, 'recorded_at': (now - timedelta(seconds=size - i)).isoformat()}
+                for i in range(size)
+            ]}
+            return lambda: self.client_for(self.courier).post('/api/courier/locations/', payload, format='json')
+        self.assertConstantQueries('courier-locations POST', build)
+
+    def test_metrics(self):
+        def build(size):
+            return lambda: self.client_for().get('/api/metrics/', HTTP_AUTHORIZATION='Bearer metrics-token')
+        self.assertConstantQueries('metrics GET', build)
+
+    # --- async read endpoints (cold catalogue cache) ---
+
+    def test_async_category_list(self):
+        def build(size):
+            self.make_menu_items(size)
+            return lambda: self.client_for().get('/api/async/categories/')
+        self.assertConstantQueries('async-category-list GET', build)
+
+    def test_async_menu_item_list(self):
+        def build(size):
+            self.make_menu_items(size, with_options=True)
+            return lambda: self.client_for().get('/api/async/menu-items/')
+        self.assertConstantQueries('async-menuitem-list GET', build)
+
+    def test_async_menu_item_detail(self):
+        def build(size):
+            item = MenuItem.objects.create(title='Target', price=Decimal('10.00'), category=self.category)
+            self.make_options(size, menu_item=item)
+            return lambda: self.client_for().get(f'/api/async/menu-items/{item.pk}/')
+        self.assertConstantQueries('async-menuitem-detail GET', build)
+
+    def test_async_cart_list(self):
+        def build(size):
+            self.make_cart(size)
+            return lambda: self.client_for(self.customer).get('/api/async/cart/items/')
+        self.assertConstantQueries('async-cart-item-list GET', build)
+
+    def test_async_order_status(self):
+        for role in ('manager', 'courier', 'customer'):
+            with self.subTest(role=role):
+                def build(size):
+                    order = self.make_orders(1, items_per_order=size)[0]
+                    return lambda: self.client_for(getattr(self, role)).get(f'/api/async/orders/{order.order_code}/status/')
+                self.assertConstantQueries('async-order-status GET', build)
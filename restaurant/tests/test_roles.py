@@ -0,0 +1,46 @@
+"""Role lookups: memoised per request, cached across requests, dropped when groups change."""
+from django.contrib.auth.models import AnonymousUser, Group, User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from restaurant.roles import DELIVERY_CREW, MANAGER, get_roles, is_manager
+
+
+@override_settings(ROLE_CACHE_TTL=300)
+class RoleCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager_group = Group.objects.get_or_create(name=MANAGER)[0]
+        cls.user = User.objects.create_user('staff', password='x')
+        cls.user.groups.add(cls.manager_group)
+
+    def setUp(self):
+        cache.clear()
+
+    def fresh_user(self):
+        return User.objects.get(pk=self.user.pk) # A new request's user object
+
+    def test_roles_are_memoised_and_cached(self):
+        user = self.fresh_user()
+        with self.assertNumQueries(1):
+            self.assertEqual(get_roles(user), frozenset([MANAGER]))
+            self.assertTrue(is_manager(user))
+        user = self.fresh_user()
+        with self.assertNumQueries(0): # Next request, served from the cache
+            self.assertTrue(is_manager(user))
+
+    def test_group_changes_invalidate_after_commit(self):
+        get_roles(self.fresh_user())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.groups.remove(self.manager_group)
+        self.assertFalse(is_manager(self.fresh_user()))
+
+        crew = Group.objects.get_or_create(name=DELIVERY_CREW)[0]
+        get_roles(self.fresh_user())
+        with self.captureOnCommitCallbacks(execute=True):
+            crew.user_set.add(self.user) # From the group side
+        self.assertEqual(get_roles(self.fresh_user()), frozenset([DELIVERY_CREW]))
+
+    def test_anonymous_has_no_roles(self):
+        self.assertEqual(get_roles(AnonymousUser()), frozenset())
+        self.assertEqual(get_roles(None), frozenset())
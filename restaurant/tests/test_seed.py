@@ -0,0 +1,41 @@
+"""`manage.py seed`: deterministic synthetic data without timestamps in the future."""
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db.models import F, Q
+from django.test import TestCase
+from django.utils import timezone
+
+from restaurant.models import Order, OrderItem, StoreLocation
+
+
+def seed(*args):
+    call_command(
+        'seed', '--categories', '2', '--menu-items', '10', '--sides', '4', '--stores', '2', '--couriers-per-store', '2',
+        '--users', '30', '--orders', '300', '--days', '1', '--chunk-size', '100', *args, stdout=StringIO(),
+    )
+
+
+class SeedCommandTests(TestCase):
+    def seed(self, *args):
+        seed(*args)
+
+    def test_seeds_every_table(self):
+        self.seed()
+        self.assertEqual(StoreLocation.objects.count(), 2)
+        self.assertEqual(User.objects.filter(username__startswith='seed1-user-').count(), 30)
+        self.assertEqual(Order.objects.count(), 300)
+        self.assertEqual(Order.objects.values('order_code').distinct().count(), 300)
+        self.assertFalse(Order.objects.filter(order_items__isnull=True).exists())
+        self.assertTrue(OrderItem.objects.exists())
+        with self.assertRaises(CommandError):
+            self.seed() # Same seed twice
+
+    def test_no_transitions_in_the_future(self):
+        self.seed('--seed', '2')
+        now = timezone.now()
+        self.assertTrue(Order.objects.filter(status__gte=1, created_at__gt=now - timezone.timedelta(minutes=40)).exists())
+        self.assertFalse(Order.objects.filter(Q(delivering_at__gt=now) | Q(delivered_at__gt=now)).exists())
+        self.assertFalse(Order.objects.filter(delivered_at__lt=F('delivering_at')).exists())
+        self.assertTrue(Order.objects.filter(created_at__lt=now - timezone.timedelta(hours=12)).exists()) # Not stamped by auto_now_add
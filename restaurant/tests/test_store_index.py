@@ -0,0 +1,79 @@
+"""The in-memory store index: nearest/covering lookups and invalidation across processes."""
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from restaurant import store_index
+from restaurant.models import StoreLocation
+from restaurant.store_index import VERSION_CACHE_KEY, StoreIndex, get_store_index, haversine_km
+
+
+def store(name, latitude, longitude, radius=5, **kwargs):
+    return StoreLocation(name=name, address=name, latitude=Decimal(latitude), longitude=Decimal(longitude),
+                         delivery_radius_km=Decimal(radius), **kwargs)
+
+
+class StoreIndexTests(TestCase):
+    def setUp(self):
+        # Bucharest: a small-radius store right next to the point and a wide one 4 km away
+        self.near = store('Near', '44.4300', '26.1000', radius=0.5)
+        self.wide = store('Wide', '44.4300', '26.1500', radius=8)
+        self.far = store('Far', '45.7500', '21.2300') # Timisoara
+        self.index = StoreIndex([self.near, self.wide, self.far])
+
+    def test_distances_match_haversine(self):
+        distances = self.index.distances(44.4350, 26.1000)
+        self.assertAlmostEqual(distances[2], haversine_km(44.4350, 26.1000, 45.75, 21.23), places=6)
+        self.assertAlmostEqual(distances[0], 0.556, places=2)
+
+    def test_covering_store_wins_over_closer_one(self):
+        self.assertEqual(self.index.covering(44.4350, 26.1000), [(self.wide, self.index.distances(44.4350, 26.1000)[1])])
+        nearest, distance, can_deliver = self.index.nearest(44.4350, 26.1000)
+        self.assertEqual((nearest, can_deliver), (self.wide, True))
+        self.assertAlmostEqual(distance, 4.0, places=0)
+
+    def test_nearest_without_coverage(self):
+        nearest, distance, can_deliver = self.index.nearest(46.77, 23.59) # Cluj
+        self.assertEqual((nearest, can_deliver), (self.far, False))
+        self.assertGreater(distance, 200)
+        self.assertEqual(StoreIndex([]).nearest(44.43, 26.1), (None, None, False))
+
+    def test_stores_spanning_many_cells_are_always_checked(self):
+        huge = store('Huge', '44.4300', '26.1000', radius=900)
+        index = StoreIndex([huge])
+        self.assertEqual(index._wide, [0])
+        self.assertEqual(index.covering(45.75, 21.23)[0][0], huge)
+
+
+@override_settings(STORE_INDEX_VERSION_CHECK_INTERVAL=0)
+class StoreIndexInvalidationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        store_index._index = None
+        self.addCleanup(setattr, store_index, '_index', None)
+        store('Central', '44.4355', '26.1025').save()
+
+    def test_index_is_reused_until_a_store_changes(self):
+        index = get_store_index()
+        self.assertIs(get_store_index(), index)
+        with self.captureOnCommitCallbacks(execute=True):
+            store('Second', '44.4000', '26.0500').save()
+        self.assertEqual(len(get_store_index()), 2)
+
+    def test_version_bump_from_another_process_rebuilds(self):
+        index = get_store_index()
+        StoreLocation.objects.update(is_active=False) # No signal: only the shared version tells us
+        self.assertIs(get_store_index(), index)
+        store_index._bump_shared_version() # What another worker's invalidate_store_index() does on commit
+        self.assertEqual(len(get_store_index()), 0)
+        self.assertIsNotNone(cache.get(VERSION_CACHE_KEY))
+
+    def test_invalidation_waits_for_commit(self):
+        get_store_index()
+        version = store_index._shared_version()
+        with self.captureOnCommitCallbacks() as callbacks:
+            store('Second', '44.4000', '26.0500').save()
+        self.assertEqual(store_index._shared_version(), version)
+        callbacks[0]()
+        self.assertNotEqual(store_index._shared_version(), version)
@@ -0,0 +1,144 @@
+"""The queue-backed JSON log handler, correlation ids and sampling."""
+import io
+import json
+import logging
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework_api_key.models import APIKey
+
+from restaurant.models import Category, MenuItem, Order
+from restaurant.structured_logging import CorrelationFilter, QueueLogHandler, SamplingFilter, bind
+
+
+class QueueLogHandlerTests(SimpleTestCase):
+    def setUp(self):
+        self.stream = io.StringIO()
+        self.handler = QueueLogHandler(self.stream)
+        self.handler.addFilter(CorrelationFilter())
+        self.logger = logging.getLogger('restaurant.tests.structured')
+        self.logger.addHandler(self.handler)
+        self.logger.propagate = False
+        self.addCleanup(setattr, self.logger, 'propagate', True)
+        self.addCleanup(self.logger.removeHandler, self.handler)
+        self.addCleanup(self.handler.close)
+
+    def records(self):
+        self.handler.stop() # Drains the queue
+        return [json.loads(line) for line in self.stream.getvalue().splitlines()]
+
+    def test_json_lines_with_correlation_ids(self):
+        with bind(request_id='req-1'):
+            with bind(order_id=7):
+                self.logger.warning("Order %s stuck", 7, extra={'courier': 3})
+                self.logger.warning("Reassigned", extra={'order_id': 8}) # extra= wins over the bound id
+        self.logger.warning("Outside")
+        first, second, third = self.records()
+        self.assertEqual(first['message'], 'Order 7 stuck')
+        self.assertEqual((first['level'], first['logger']), ('WARNING', 'restaurant.tests.structured'))
+        self.assertEqual((first['request_id'], first['order_id'], first['courier']), ('req-1', 7, 3))
+        self.assertEqual((second['request_id'], second['order_id']), ('req-1', 8))
+        self.assertNotIn('request_id', third)
+
+    def test_exceptions_are_rendered_before_queueing(self):
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            self.logger.exception("Failed")
+        record, = self.records()
+        self.assertIn('ValueError: boom', record['exception'])
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        self.handler.stop()
+        self.handler.queue.maxsize = 2
+        for i in range(5):
+            self.logger.warning("Message %s", i)
+        self.assertEqual(self.handler.dropped, 3)
+
+
+class SamplingFilterTests(SimpleTestCase):
+    def record(self, name, level=logging.WARNING):
+        return logging.LogRecord(name, level, __file__, 0, 'message', (), None)
+
+    def test_rates_by_logger_prefix(self):
+        sampling = SamplingFilter({'restaurant.instrumentation': 0, 'restaurant': 0.5})
+        self.assertFalse(sampling.filter(self.record('restaurant.instrumentation')))
+        self.assertTrue(sampling.filter(self.record('restaurant.instrumentation', logging.ERROR)))
+        self.assertTrue(sampling.filter(self.record('django.request')))
+        self.assertEqual(sampling.rate_for('restaurant.views'), 0.5)
+
+    def test_same_decision_for_a_whole_request(self):
+        sampling = SamplingFilter({'restaurant': 0.5})
+        for request_id in ('a', 'b', 'c', 'd'):
+            with bind(request_id=request_id):
+                decisions = {sampling.filter(self.record('restaurant.views')) for _ in range(10)}
+            self.assertEqual(len(decisions), 1)
+
+
+@override_settings(INSTRUMENTATION_ENABLED=False)
+class RequestIdMiddlewareTests(TestCase):
+    def test_request_id_is_generated_or_propagated(self):
+        generated = self.client.get('/api/categories/')['X-Request-ID']
+        self.assertRegex(generated, r'^[0-9a-f]{32}$')
+        self.assertEqual(self.client.get('/api/categories/', HTTP_X_REQUEST_ID='proxy-42')['X-Request-ID'], 'proxy-42')
+        for unsafe in ('a b', 'id"}{', 'ș', 'x' * 65):
+            with self.subTest(unsafe=unsafe):
+                self.assertRegex(self.client.get('/api/categories/', HTTP_X_REQUEST_ID=unsafe)['X-Request-ID'], r'^[0-9a-f]{32}$')
+
+    def test_request_id_reaches_log_records(self):
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        handler.addFilter(CorrelationFilter())
+        logger = logging.getLogger('restaurant.views')
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+
+        def filter_menu_items(queryset, params):
+            logger.warning("Filtering")
+            return queryset
+
+        with mock.patch('restaurant.views.filter_menu_items', filter_menu_items):
+            self.client.get('/api/menu-items/', HTTP_X_REQUEST_ID='proxy-43')
+        self.assertEqual(records[0].request_id, 'proxy-43')
+
+    def test_order_id_is_bound_around_order_creation(self):
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        handler.addFilter(CorrelationFilter())
+        logger = logging.getLogger('restaurant')
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+
+        dish = MenuItem.objects.create(title='Dish', price=Decimal('30.00'), category=Category.objects.create(slug='mains', title='Mains'))
+        _, key = APIKey.objects.create_key(name='voice')
+        payload = {
+            'items': [{'menuitem_id': dish.pk, 'quantity': 1}], 'customer_name': 'Ana',
+            'customer_phone': '+40700000000', 'delivery_address': 'Str. X 1',
+        }
+
+        serialized = []
+
+        def failing_serializer(order):
+            serialized.append(order.pk)
+            logger.warning("Serializing")
+            raise RuntimeError('boom')
+
+        with mock.patch('restaurant.views.OrderSerializer', side_effect=failing_serializer):
+            response = self.client.post('/api/direct-order/', payload, content_type='application/json', HTTP_AUTHORIZATION=f'Api-Key {key}')
+        self.assertEqual(response.status_code, 500)
+        warning, error = [record for record in records if record.levelno >= logging.WARNING]
+        self.assertEqual([warning.order_id], serialized) # Bound once the order existed
+        self.assertEqual(error.getMessage(), 'Error creating direct order')
+        self.assertEqual(error.request_id, response['X-Request-ID'])
+
+        customer = User.objects.create_user('customer', password='x')
+        order = Order.objects.create(user=customer, total=Decimal('30.00'))
+        records.clear()
+        order.status = 1
+        order.save() # No phone number on the profile: logged by the status-change signal
+        self.assertEqual({record.order_id for record in records if record.name == 'restaurant.signals'}, {order.pk})
+
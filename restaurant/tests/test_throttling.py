@@ -0,0 +1,150 @@
+"""Token-bucket limits on checkout and voice orders."""
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_api_key.models import APIKey
+
+from restaurant.models import Category, MenuItem
+from restaurant.serializers import ClaimsTokenObtainPairSerializer
+from restaurant.throttling import GCRA_SCRIPT, TokenBuckets, buckets, check_token_bucket_cache, parse_rate
+
+RATES = {'checkout': {'user': '2/min', 'ip': '5/min'}, 'voice': {'api_key': '3/min'}}
+
+
+@override_settings(TOKEN_BUCKET_RATES=RATES, INSTRUMENTATION_ENABLED=False)
+class TokenBucketThrottleTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customers = [User.objects.create_user(f'customer-{i}', password='x') for i in range(3)]
+        cls.dish = MenuItem.objects.create(
+            title='Dish', price=Decimal('30.00'), category=Category.objects.create(slug='mains', title='Mains'),
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def checkout(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {ClaimsTokenObtainPairSerializer.get_token(user).access_token}')
+        return client.post('/api/orders/', {}, format='json') # Empty cart: 400, but still throttled
+
+    def test_checkout_burst_then_retry_after(self):
+        customer = self.customers[0]
+        self.assertEqual([self.checkout(customer).status_code for _ in range(2)], [400, 400])
+        response = self.checkout(customer)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30') # 2/min: one token every 30 seconds
+        self.assertEqual(self.checkout(self.customers[1]).status_code, 400) # Other users have their own bucket
+
+    def test_ip_bucket_is_shared_by_users(self):
+        statuses = [self.checkout(user).status_code for user in self.customers for _ in range(2)]
+        self.assertEqual(statuses, [400] * 5 + [429])
+
+    def test_other_endpoints_are_not_throttled(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {ClaimsTokenObtainPairSerializer.get_token(self.customers[0]).access_token}')
+        self.assertEqual({client.get('/api/orders/').status_code for _ in range(6)}, {200})
+
+    def test_voice_orders_per_api_key(self):
+        _, key = APIKey.objects.create_key(name='voice')
+        _, other_key = APIKey.objects.create_key(name='backup')
+        payload = {
+            'items': [{'menuitem_id': self.dish.pk, 'quantity': 1}], 'customer_name': 'Ana',
+            'customer_phone': '+40700000000', 'delivery_address': 'Str. X 1',
+        }
+
+        def order(api_key):
+            return APIClient().post('/api/direct-order/', payload, format='json', HTTP_AUTHORIZATION=f'Api-Key {api_key}').status_code
+
+        self.assertEqual([order(key) for _ in range(4)], [201, 201, 201, 429])
+        self.assertEqual(order(other_key), 201)
+        self.assertEqual(APIClient().post('/api/direct-order/', payload, format='json').status_code, 401) # Permission before throttle
+
+    def test_refill_and_all_or_nothing(self):
+        limits = [('throttle:test:a', 2, 60), ('throttle:test:b', 1, 60)]
+        self.assertEqual(buckets.take(limits, now=1000), 0)
+        self.assertEqual(buckets.take(limits, now=1000), 60) # b is empty for a full interval
+        self.assertEqual(buckets.take(limits[:1], now=1000), 0) # ... and the denied request took nothing from a
+        self.assertEqual(buckets.take(limits[:1], now=1000), 30)
+        self.assertEqual(buckets.take(limits, now=1060), 0)
+
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate('10/min'), (10, 60))
+        self.assertEqual(parse_rate('100/5m'), (100, 300))
+        self.assertEqual(parse_rate('3/s'), (3, 1))
+        for rate in ('0/min', '10/fortnight', 'ten/min'):
+            with self.subTest(rate=rate), self.assertRaises(ValueError):
+                parse_rate(rate)
+
+
+class FakeRedis:
+    """Stands in for a redis-py client: runs GCRA_SCRIPT's logic in Python over a dict."""
+
+    def __init__(self):
+        self.store = {}
+        self.calls = []
+
+    def get_client(self, key, write=False):
+        return self
+
+    def register_script(self, source):
+        self.registered = source
+        return self.run
+
+    def run(self, keys, args, client):
+        self.calls.append((keys, args))
+        now, wait, arrivals = args[0], 0, []
+        for i, key in enumerate(keys):
+            interval, burst = args[2 * i + 1], args[2 * i + 2]
+            arrival = max(self.store.get(key, now), now) + interval
+            wait = max(wait, arrival - now - burst)
+            arrivals.append(arrival)
+        if wait > 0:
+            return wait
+        self.store.update(zip(keys, arrivals))
+        return 0
+
+
+class FakeRedisCache:
+    """The parts of django.core.cache.backends.redis.RedisCache that TokenBuckets uses."""
+
+    def __init__(self):
+        self._cache = FakeRedis()
+
+    def make_and_validate_key(self, key):
+        return f':1:{key}'
+
+
+class RedisScriptTests(SimpleTestCase):
+    def test_buckets_go_through_one_script_call(self):
+        fake = FakeRedisCache()
+        token_buckets = TokenBuckets()
+        limits = [('throttle:test:a', 2, 60), ('throttle:test:b', 1, 60)]
+        with mock.patch('restaurant.throttling.caches', {'default': fake}):
+            self.assertEqual(token_buckets.take(limits, now=1000), 0)
+            self.assertEqual(token_buckets.take(limits, now=1000), 60)
+            self.assertEqual(token_buckets.take(limits[:1], now=1000), 0)
+
+        redis = fake._cache
+        self.assertEqual(redis.registered, GCRA_SCRIPT)
+        keys, args = redis.calls[0]
+        self.assertEqual(keys, [':1:throttle:test:a', ':1:throttle:test:b'])
+        self.assertEqual(args, [1000 * 10 ** 6, 30 * 10 ** 6, 60 * 10 ** 6, 60 * 10 ** 6, 60 * 10 ** 6]) # now, (interval, burst) per key
+        self.assertEqual(len(token_buckets._scripts), 1) # Registered once per client
+
+
+class TokenBucketCacheCheckTests(SimpleTestCase):
+    def test_local_memory_cache_is_reported(self):
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://localhost'}}
+        with override_settings(CACHES=locmem, TOKEN_BUCKET_CACHE='default'):
+            self.assertEqual([warning.id for warning in check_token_bucket_cache(None)], ['restaurant.W001'])
+            with override_settings(TOKEN_BUCKET_RATES={}):
+                self.assertEqual(check_token_bucket_cache(None), [])
+        with override_settings(CACHES=redis, TOKEN_BUCKET_CACHE='default'):
+            self.assertEqual(check_token_bucket_cache(None), [])
+
@@ -0,0 +1,97 @@
+"""Courier tracking: sampling, accepted counts, freshness and the newest position across workers."""
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import OperationalError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from restaurant.models import CourierLocation
+from restaurant.tracking import CourierTracker, Ping, is_fresh
+
+
+@override_settings(TRACKING_SAMPLE_SECONDS=30, TRACKING_FLUSH_INTERVAL=3600, TRACKING_BACKGROUND_FLUSH=False, TRACKING_STALE_AFTER=120)
+class CourierTrackerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.courier = User.objects.create_user('courier', password='x')
+
+    def setUp(self):
+        cache.clear()
+        self.now = timezone.now()
+        self.tracker = CourierTracker()
+        self.addCleanup(self.tracker.reset)
+
+    def ping(self, seconds_ago, longitude=26.10):
+        return Ping(44.43, longitude, self.now - timedelta(seconds=seconds_ago))
+
+    def test_returns_accepted_count(self):
+        self.assertEqual(self.tracker.ingest(self.courier.pk, [self.ping(20), self.ping(30), self.ping(20)]), 2)
+        # Replayed and older pings are dropped
+        self.assertEqual(self.tracker.ingest(self.courier.pk, [self.ping(30), self.ping(25), self.ping(10)]), 1)
+        self.assertEqual(self.tracker.ingest(self.courier.pk, []), 0)
+
+    def test_history_is_sampled(self):
+        pings = [self.ping(seconds) for seconds in range(120, -1, -10)] # Every 10 s for two minutes
+        self.tracker.ingest(self.courier.pk, pings)
+        self.assertEqual(self.tracker.flush(), 5) # One per 30 s
+        stored = list(CourierLocation.objects.order_by('recorded_at').values_list('recorded_at', flat=True))
+        self.assertEqual(stored, [ping.recorded_at for ping in pings[::3]])
+        self.assertEqual(self.tracker.flush(), 0)
+
+    def test_freshness(self):
+        self.assertTrue(is_fresh(self.ping(120), self.now))
+        self.assertFalse(is_fresh(self.ping(121), self.now))
+        self.assertFalse(is_fresh(None, self.now))
+        self.tracker.ingest(self.courier.pk, [self.ping(300)])
+        self.assertEqual(self.tracker.live_positions([self.courier.pk], self.now), {})
+
+    def test_newest_position_wins_across_workers(self):
+        other_worker = CourierTracker()
+        self.addCleanup(other_worker.reset)
+        self.tracker.ingest(self.courier.pk, [self.ping(60, longitude=26.10)])
+        other_worker.ingest(self.courier.pk, [self.ping(10, longitude=26.20)])
+
+        # This worker's own ring is older than the shared cache
+        self.assertEqual(self.tracker.latest(self.courier.pk).longitude, 26.20)
+        self.assertEqual(self.tracker.live_positions([self.courier.pk], self.now), {self.courier.pk: (44.43, 26.20)})
+
+        # A late batch with older pings must not roll the shared position back
+        third_worker = CourierTracker()
+        self.addCleanup(third_worker.reset)
+        third_worker.ingest(self.courier.pk, [self.ping(40, longitude=26.30)])
+        self.assertEqual(other_worker.latest(self.courier.pk).longitude, 26.20)
+
+    def test_latest_falls_back_to_history(self):
+        CourierLocation.objects.create(courier=self.courier, latitude=44.43, longitude=26.15, recorded_at=self.ping(600).recorded_at)
+        self.assertEqual(self.tracker.latest(self.courier.pk).longitude, 26.15)
+
+    def test_failed_flush_keeps_rows_for_the_next_one(self):
+        self.tracker.ingest(self.courier.pk, [self.ping(60), self.ping(0)])
+        with mock.patch.object(CourierLocation.objects, 'bulk_create', side_effect=OperationalError('database is locked')):
+            with self.assertRaises(OperationalError), self.assertLogs('restaurant.tracking', 'ERROR'):
+                self.tracker.flush()
+        self.tracker.ingest(self.courier.pk, [self.ping(-30)])
+        self.assertEqual(self.tracker.flush(), 3)
+        self.assertEqual(CourierLocation.objects.filter(courier=self.courier).count(), 3)
+
+    @override_settings(TRACKING_MAX_PENDING=2)
+    def test_requeued_rows_are_capped(self):
+        self.tracker.ingest(self.courier.pk, [self.ping(60), self.ping(30), self.ping(0)])
+        with mock.patch.object(CourierLocation.objects, 'bulk_create', side_effect=OperationalError('database is locked')):
+            with self.assertRaises(OperationalError), self.assertLogs('restaurant.tracking', 'ERROR'):
+                self.tracker.flush()
+        self.tracker.flush()
+        self.assertEqual(list(CourierLocation.objects.values_list('recorded_at', flat=True).order_by('recorded_at')), [self.ping(30).recorded_at, self.ping(0).recorded_at])
+
+    @override_settings(TRACKING_FLUSH_INTERVAL=0.01, TRACKING_BACKGROUND_FLUSH=True)
+    def test_background_flush(self):
+        flushed = []
+        self.tracker.flush = lambda: flushed.append(len(self.tracker._pending)) # Keep the worker thread off the test database
+        self.tracker.ingest(self.courier.pk, [self.ping(0)])
+        self.tracker._stop.wait(0.2)
+        self.assertIn(1, flushed)
+        self.tracker.reset()
+        self.assertFalse(self.tracker._flusher)
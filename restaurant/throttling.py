@@ -0,0 +1,165 @@
+"""
+Token-bucket throttling for the endpoints that create orders.
+
+Each scope (view.throttle_scope) has rates per kind of client in
+TOKEN_BUCKET_RATES: 'user' (authenticated user), 'api_key' (the voice
+agent's key, by its public prefix) and 'ip' (DRF's get_ident, which honours
+NUM_PROXIES). A rate of 'N/period' is a bucket of N tokens refilled at N
+per period, so a client may burst N requests and then continue at the
+average rate. A request takes one token from every bucket it belongs to,
+or from none if any of them is empty; the 429 carries the time until all of
+them have a token again as Retry-After.
+
+Buckets are stored as GCRA "theoretical arrival times" (one integer per
+bucket, in microseconds) in the TOKEN_BUCKET_CACHE cache so that every
+worker shares them. With Django's Redis backend the check-and-update is a
+single atomic Lua script. Other backends update under a per-process lock,
+which is exact for the per-process local-memory cache; on a shared
+memcached or database cache concurrent workers may let a request or two
+past the limit. A local-memory TOKEN_BUCKET_CACHE gives every worker its
+own buckets, multiplying the limits by the worker count, so it is reported
+by a system check (restaurant.W001) at startup.
+"""
+import re
+import threading
+import time
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+from rest_framework_api_key.permissions import KeyParser
+
+LOCAL_CACHE_BACKENDS = ('django.core.cache.backends.locmem.LocMemCache',)
+
+PERIODS = {'s': 1, 'sec': 1, 'second': 1, 'm': 60, 'min': 60, 'minute': 60, 'h': 3600, 'hour': 3600, 'd': 86400, 'day': 86400}
+RATE_PATTERN = re.compile(r'^\s*(\d+)\s*/\s*(\d*)\s*([a-z]+)\s*$')
+
+# KEYS: bucket keys; ARGV: now, then (interval, burst) per key, all in microseconds.
+# Returns 0 and takes a token from every bucket, or the microseconds to wait and changes nothing.
+GCRA_SCRIPT = """
+local now = tonumber(ARGV[1])
+local wait = 0
+local arrivals = {}
+for i, key in ipairs(KEYS) do
+    local interval, burst = tonumber(ARGV[2 * i]), tonumber(ARGV[2 * i + 1])
+    local arrival = math.max(tonumber(redis.call('GET', key) or now), now) + interval
+    wait = math.max(wait, arrival - now - burst)
+    arrivals[i] = arrival
+end
+if wait > 0 then
+    return wait
+end
+for i, key in ipairs(KEYS) do
+    redis.call('SET', key, arrivals[i], 'PX', math.ceil((arrivals[i] - now) / 1000))
+end
+return 0
+"""
+
+
+def parse_rate(rate):
+    """'10/min', '100/5m' or '3/s' -> (tokens, seconds to refill them)."""
+    match = RATE_PATTERN.match(rate)
+    if not match or match.group(3) not in PERIODS or int(match.group(1)) < 1:
+        raise ValueError(f"Invalid token bucket rate {rate!r}.")
+    tokens, multiplier, unit = match.groups()
+    return int(tokens), int(multiplier or 1) * PERIODS[unit]
+
+
+class TokenBuckets:
+    """Atomic take-one-from-each over a set of GCRA buckets in a Django cache."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._scripts = {}
+
+    def take(self, buckets, now=None):
+        """
+        buckets: [(key, tokens, period seconds)]. Returns 0.0 if a token was
+        taken from each, else the seconds until one is available in all.
+        """
+        cache = caches[getattr(settings, 'TOKEN_BUCKET_CACHE', 'default')]
+        now = int((time.time() if now is None else now) * 1_000_000)
+        limits = []
+        for key, tokens, period in buckets:
+            interval = period * 1_000_000 // tokens
+            limits.append((key, interval, interval * tokens)) # Arrivals may run ahead of now by a full bucket
+
+        client = self._redis_client(cache, limits[0][0])
+        if client is not None:
+            script = self._scripts.get(client)
+            if script is None:
+                script = self._scripts[client] = client.register_script(GCRA_SCRIPT)
+            keys = [cache.make_and_validate_key(key) for key, _, _ in limits]
+            args = [now] + [value for _, interval, burst in limits for value in (interval, burst)]
+            return int(script(keys=keys, args=args, client=client)) / 1_000_000
+
+        with self._lock:
+            stored = cache.get_many([key for key, _, _ in limits])
+            arrivals, wait = [], 0
+            for key, interval, burst in limits:
+                arrival = max(stored.get(key, now), now) + interval
+                wait = max(wait, arrival - now - burst)
+                arrivals.append(arrival)
+            if wait > 0:
+                return wait / 1_000_000
+            for (key, _, _), arrival in zip(limits, arrivals):
+                cache.set(key, arrival, (arrival - now) / 1_000_000) # Gone once the bucket is full again
+        return 0.0
+
+    @staticmethod
+    def _redis_client(cache, key):
+        get_client = getattr(getattr(cache, '_cache', None), 'get_client', None) # django.core.cache.backends.redis
+        return get_client(cache.make_and_validate_key(key), write=True) if get_client else None
+
+
+buckets = TokenBuckets()
+
+
+def check_token_bucket_cache(app_configs, **kwargs):
+    """System check: token buckets need a cache shared by every worker process."""
+    if not getattr(settings, 'TOKEN_BUCKET_RATES', {}):
+        return []
+    alias = getattr(settings, 'TOKEN_BUCKET_CACHE', 'default')
+    backend = settings.CACHES.get(alias, {}).get('BACKEND')
+    if backend not in LOCAL_CACHE_BACKENDS:
+        return []
+    return [checks.Warning(
+        f"TOKEN_BUCKET_CACHE {alias!r} uses {backend}, which is private to each process: "
+        "every worker keeps its own token buckets and clients get the limits once per worker.",
+        hint="Point it at a shared cache (e.g. django.core.cache.backends.redis.RedisCache) when running several workers.",
+        id='restaurant.W001',
+    )]
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Throttles views by their throttle_scope with the TOKEN_BUCKET_RATES for
+    that scope; kinds of client without a rate are not limited.
+    """
+
+    def __init__(self):
+        self.wait_seconds = None
+
+    def get_buckets(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        rates = getattr(settings, 'TOKEN_BUCKET_RATES', {}).get(scope, {})
+        idents = {'ip': self.get_ident(request)}
+        if request.user and request.user.is_authenticated:
+            idents['user'] = request.user.pk
+        key = KeyParser().get(request)
+        if key:
+            idents['api_key'] = key.partition('.')[0] # The public prefix; the secret part never reaches the cache
+        return [
+            (f'throttle:{scope}:{kind}:{ident}', *parse_rate(rates[kind]))
+            for kind, ident in idents.items() if kind in rates
+        ]
+
+    def allow_request(self, request, view):
+        limits = self.get_buckets(request, view)
+        if not limits:
+            return True
+        self.wait_seconds = buckets.take(limits)
+        return self.wait_seconds == 0
+
+    def wait(self):
+        return self.wait_seconds
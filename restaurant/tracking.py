@@ -0,0 +1,202 @@
+import atexit
+import logging
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.utils import timezone
+from .models import CourierLocation
+
+logger = logging.getLogger(__name__)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _cache_key(courier_id):
+    return f'courier_location:{courier_id}'
+
+
+@dataclass(frozen=True)
+class Ping:
+    latitude: float
+    longitude: float
+    recorded_at: datetime
+
+    def as_dict(self):
+        return {'latitude': self.latitude, 'longitude': self.longitude, 'recorded_at': self.recorded_at}
+
+
+class CourierTracker:
+    """
+    Per-process live courier positions. Every ping lands in a small ring
+    buffer per courier; the newest one is also written to the shared cache
+    (one cache write per batch) so any worker can answer "where is my
+    courier". Pings at least TRACKING_SAMPLE_SECONDS apart are queued and
+    written to CourierLocation with bulk_create every TRACKING_FLUSH_INTERVAL
+    seconds by a background thread (or, with TRACKING_BACKGROUND_FLUSH off,
+    by the next ingest once the interval has passed).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._flusher = None
+        self._clear()
+
+    def _clear(self):
+        self._recent = {}
+        self._last_sampled = {}
+        self._pending = []
+        self._last_flush = time.monotonic()
+
+    def reset(self):
+        """Stops the background flusher and forgets everything held in memory, unflushed history included."""
+        self._stop.set()
+        if self._flusher is not None and self._flusher.is_alive():
+            self._flusher.join()
+        with self._lock:
+            self._clear()
+            self._stop = threading.Event()
+            self._flusher = None
+
+    def ingest(self, courier_id, pings):
+        """Records a batch of pings (any order) for one courier. Returns the number accepted."""
+        pings = sorted(pings, key=lambda ping: ping.recorded_at)
+        if not pings:
+            return 0
+        sample_every = timedelta(seconds=_setting('TRACKING_SAMPLE_SECONDS', 30))
+
+        accepted = 0
+        with self._lock:
+            recent = self._recent.get(courier_id)
+            if recent is None:
+                recent = self._recent[courier_id] = deque(maxlen=_setting('TRACKING_RING_SIZE', 32))
+            last_sampled = self._last_sampled.get(courier_id)
+            for ping in pings:
+                if recent and ping.recorded_at <= recent[-1].recorded_at:
+                    continue # Duplicate or late delivery of an older ping
+                recent.append(ping)
+                accepted += 1
+                if last_sampled is None or ping.recorded_at - last_sampled >= sample_every:
+                    self._pending.append(CourierLocation(
+                        courier_id=courier_id,
+                        latitude=round(ping.latitude, 6),
+                        longitude=round(ping.longitude, 6),
+                        recorded_at=ping.recorded_at,
+                    ))
+                    last_sampled = ping.recorded_at
+            self._last_sampled[courier_id] = last_sampled
+            latest = recent[-1] if accepted else None
+            background = self._ensure_flusher()
+
+        if latest:
+            cached = cache.get(_cache_key(courier_id))
+            # Another worker may already hold a newer ping for this courier
+            if not cached or cached['recorded_at'] < latest.recorded_at:
+                cache.set(_cache_key(courier_id), latest.as_dict(), _setting('TRACKING_LATEST_TTL', 15 * 60))
+        if not background:
+            self.maybe_flush()
+        return accepted
+
+    def latest(self, courier_id):
+        """Newest known Ping for a courier: the newer of the shared cache and this process, else stored history."""
+        newest = self._newest({courier_id: cache.get(_cache_key(courier_id))}).get(courier_id)
+        if newest:
+            return newest
+
+        row = CourierLocation.objects.filter(courier_id=courier_id).order_by('-recorded_at').first()
+        if row:
+            return Ping(float(row.latitude), float(row.longitude), row.recorded_at)
+        return None
+
+    def live_positions(self, courier_ids, now=None):
+        """{courier_id: (latitude, longitude)} for couriers with a fresh ping; one cache round trip, no queries."""
+        cached = cache.get_many([_cache_key(courier_id) for courier_id in courier_ids])
+        found = self._newest({courier_id: cached.get(_cache_key(courier_id)) for courier_id in courier_ids})
+        return {
+            courier_id: (ping.latitude, ping.longitude)
+            for courier_id, ping in found.items() if is_fresh(ping, now)
+        }
+
+    def _newest(self, cached):
+        """
+        {courier_id: Ping} from {courier_id: cached dict or None}, replacing
+        each cached ping with this process's own when that one is newer. The
+        cache comes first: another worker may have received later pings.
+        """
+        found = {courier_id: Ping(**value) for courier_id, value in cached.items() if value}
+        with self._lock:
+            for courier_id in cached:
+                recent = self._recent.get(courier_id)
+                if recent and (courier_id not in found or recent[-1].recorded_at > found[courier_id].recorded_at):
+                    found[courier_id] = recent[-1]
+        return found
+
+    def _ensure_flusher(self):
+        """Starts the background flush thread once per process (again after a fork). Call with the lock held."""
+        if not _setting('TRACKING_BACKGROUND_FLUSH', True):
+            return False
+        if self._flusher is None or not self._flusher.is_alive():
+            self._flusher = threading.Thread(target=self._flush_periodically, name='courier-location-flush', daemon=True)
+            self._flusher.start()
+        return True
+
+    def _flush_periodically(self):
+        stop = self._stop
+        while not stop.wait(_setting('TRACKING_FLUSH_INTERVAL', 10)):
+            try:
+                self.flush()
+            except Exception: # Logged and requeued by flush(); the thread must survive a database hiccup
+                pass
+            finally:
+                close_old_connections() # This thread's connection follows CONN_MAX_AGE like a request's
+
+    def maybe_flush(self):
+        if time.monotonic() - self._last_flush >= _setting('TRACKING_FLUSH_INTERVAL', 10):
+            self.flush()
+
+    def flush(self):
+        """
+        Writes queued history rows in one bulk_create. When the write fails
+        the rows go back to the front of the queue for the next flush (the
+        oldest are dropped beyond TRACKING_MAX_PENDING) and the error is
+        raised.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+            self._last_flush = time.monotonic()
+        if not pending:
+            return 0
+        try:
+            CourierLocation.objects.bulk_create(pending, batch_size=500)
+        except Exception:
+            with self._lock:
+                queued = pending + self._pending
+                limit = _setting('TRACKING_MAX_PENDING', 10_000)
+                self._pending = queued[-limit:]
+            logger.error("Could not write %d courier locations; kept for the next flush, %d dropped", len(pending), max(len(queued) - limit, 0))
+            raise
+        return len(pending)
+
+
+tracker = CourierTracker()
+
+
+@atexit.register
+def _flush_on_exit():
+    try:
+        tracker.flush()
+    except Exception as e: # Database may already be gone at interpreter shutdown
+        logger.warning("Could not flush courier locations on exit: %s", e)
+
+
+def is_fresh(ping, now=None):
+    """Whether a ping is recent enough to be shown as a live position."""
+    now = now or timezone.now()
+    return ping is not None and now - ping.recorded_at <= timedelta(seconds=_setting('TRACKING_STALE_AFTER', 120))
@@ -1,6 +1,8 @@
 from django.urls import path, include
 from rest_framework.routers import SimpleRouter
-from .views import CartViewSet, CategoryViewSet, GroupViewSet, MenuItemViewSet, OrderViewSet, DirectOrderCreateView
+from . import async_views
+from .instrumentation import metrics_view
+from .views import CartViewSet, CategoryViewSet, GroupViewSet, MenuItemViewSet, OrderViewSet, DirectOrderCreateView, DeliveryEligibilityView, CourierLocationView
 
 router = SimpleRouter()
 router.register(r'categories', CategoryViewSet, basename='category') # 'categories' is the URL prefix
@@ -12,4 +14,13 @@ router.register(r'groups', GroupViewSet, basename='group')
 urlpatterns = [
     path('', include(router.urls)),
     path('direct-order/', DirectOrderCreateView.as_view(), name='direct-order-create'),
+    path('delivery-eligibility/', DeliveryEligibilityView.as_view(), name='delivery-eligibility'),
+    path('courier/locations/', CourierLocationView.as_view(), name='courier-locations'),
+    path('metrics/', metrics_view, name='metrics'),
+    # Async read endpoints for ASGI deployments (see async_views.py)
+    path('async/categories/', async_views.category_list, name='async-category-list'),
+    path('async/menu-items/', async_views.menu_item_list, name='async-menuitem-list'),
+    path('async/menu-items/<int:pk>/', async_views.menu_item_detail, name='async-menuitem-detail'),
+    path('async/cart/items/', async_views.cart_list, name='async-cart-item-list'),
+    path('async/orders/<str:order_code>/status/', async_views.order_status, name='async-order-status'),
 ]
\ No newline at end of file
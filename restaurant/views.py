@@ -1,28 +1,65 @@
+import logging
 from django.shortcuts import render
 from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from .models import Cart, Category, MenuItem, Order, OrderItem, OptionChoice
+from .models import Cart, Category, MenuItem, Order, OrderItem, OptionChoice, StoreLocation, UserAddress
 from .serializers import (
-    CartItemSerializer, CategorySerializer, DirectOrderInputSerializer, 
+    CartItemSerializer, CategorySerializer, CourierPingBatchSerializer, DeliveryEligibilityInputSerializer, DirectOrderInputSerializer, 
     GroupSerializer, MenuItemSerializer, MenuItemDetailSerializer, OrderSerializer
 )
 from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from rest_framework.decorators import api_view, permission_classes, action
 from django.shortcuts import get_object_or_404
 from django.contrib.auth.models import User, Group
-from .permissions import IsManager, IsDeliveryCrew # Import custom permission classes
+from .permissions import CachedHasAPIKey, IsManager, IsDeliveryCrew # Import custom permission classes
+from .roles import DELIVERY_CREW, MANAGER, has_role, invalidate_roles, is_manager
 from django.contrib.auth.models import Group
 from decimal import Decimal
 from django.db import transaction
-from rest_framework_api_key.permissions import HasAPIKey
-
-# Create groups if they don't exist (run only once on app startup)
-def create_groups():
-    Group.objects.get_or_create(name='Manager')
-    Group.objects.get_or_create(name='Delivery crew')
+from django.db.models import Prefetch, prefetch_related_objects
+from django.http import StreamingHttpResponse
+from django.conf import settings
+from django.utils import timezone
+from .exports import EXPORT_FORMATS, ExportFilterError, get_export_queryset, iter_export, parse_export_filters
+from .location_utils import check_delivery_many, geocode_addresses
+from .dispatch import apply_plan, plan_dispatch
+from .tracking import Ping, is_fresh, tracker
+from .fast_serializers import serialize_categories, serialize_menu_items, serialize_orders
+from .throttling import TokenBucketThrottle
+from .structured_logging import bind
+
+logger = logging.getLogger(__name__)
+
+# Nested rows rendered by OrderSerializer; fetched per query, not per order item
+ORDER_ITEMS_PREFETCH = Prefetch(
+    'order_items',
+    queryset=OrderItem.objects.select_related('menuitem__category').prefetch_related('selected_options__item'),
+)
 
-create_groups() # Call the function to ensure groups are created on app startup
+def cart_queryset(user): # The user's cart lines with everything CartItemSerializer renders
+    return Cart.objects.filter(user=user).select_related('menuitem__category').prefetch_related('selected_options')
+
+def order_queryset():
+    return Order.objects.select_related('store_location', 'delivery_address_link').prefetch_related(ORDER_ITEMS_PREFETCH)
+
+def filter_menu_items(queryset, params):
+    """The public menu listing: available standalone items, filtered by the category/to_price/search/ordering query parameters."""
+    queryset = queryset.filter(is_standalone_item=True, is_available=True)
+    category_name = params.get('category')
+    to_price = params.get('to_price')
+    search = params.get('search')
+    ordering = params.get('ordering')
+
+    if category_name:
+        queryset = queryset.filter(category__slug=category_name)
+    if to_price:
+        queryset = queryset.filter(price__lte=to_price)
+    if search:
+        queryset = queryset.filter(title__icontains=search)
+    if ordering:
+        queryset = queryset.order_by(ordering)
+    return queryset
 
 class CategoryViewSet(viewsets.ViewSet):
     """
@@ -49,9 +86,7 @@ class CategoryViewSet(viewsets.ViewSet):
         """
         List all categories. Publicly accessible.
         """
-        queryset = Category.objects.all()
-        serializer = CategorySerializer(queryset, many=True, context={'request': request})
-        return Response(serializer.data)
+        return Response(serialize_categories(Category.objects.all(), request))
 
     def retrieve(self, request, pk=None):
         """
@@ -124,21 +159,7 @@ class MenuItemViewSet(viewsets.ModelViewSet):
 
         # For list view, only show available, standalone items
         if self.action == 'list':
-            queryset = queryset.filter(is_standalone_item=True, is_available=True)
-            # Apply existing filters from original code
-            category_name = self.request.query_params.get('category')
-            to_price = self.request.query_params.get('to_price')
-            search = self.request.query_params.get('search')
-            ordering = self.request.query_params.get('ordering')
-
-            if category_name:
-                queryset = queryset.filter(category__slug=category_name)
-            if to_price:
-                queryset = queryset.filter(price__lte=to_price)
-            if search:
-                queryset = queryset.filter(title__icontains=search)
-            if ordering:
-                queryset = queryset.order_by(ordering)
+            queryset = filter_menu_items(queryset, self.request.query_params)
 
         # For retrieve view, prefetch related options for efficiency
         elif self.action == 'retrieve':
@@ -156,11 +177,17 @@ class MenuItemViewSet(viewsets.ModelViewSet):
             permission_classes = [IsAuthenticated, IsManager]
         return [permission() for permission in permission_classes]
 
+    def list(self, request):
+        """
+        List available standalone menu items. Publicly accessible.
+        """
+        return Response(serialize_menu_items(self.get_queryset(), request))
+
     def retrieve(self, request, pk=None):
         """
         Retrieve a specific menu item. Publicly accessible.
         """
-        queryset = MenuItem.objects.select_related('category').all() # Optimize with select_related
+        queryset = MenuItem.objects.select_related('category').prefetch_related('option_groups__choices__item')
         menuitem = get_object_or_404(queryset, pk=pk)
         serializer = MenuItemDetailSerializer(menuitem, context={'request': request})
         return Response(serializer.data)
@@ -218,7 +245,7 @@ class CartViewSet(viewsets.ViewSet):
         """
         Retrieve the current user's cart items.
         """
-        cart_items = Cart.objects.filter(user=request.user).select_related('menuitem', 'menuitem__category') # Get cart items for current user
+        cart_items = cart_queryset(request.user) # Get cart items for current user
         serializer = CartItemSerializer(cart_items, many=True, context={'request': request})
         return Response(serializer.data)
 
@@ -243,7 +270,7 @@ class CartViewSet(viewsets.ViewSet):
         # --- Smart Cart Item Logic ---
         # Look for an existing cart item with the exact same options
         cart_item = None
-        existing_items = Cart.objects.filter(user=request.user, menuitem=menuitem)
+        existing_items = Cart.objects.filter(user=request.user, menuitem=menuitem).prefetch_related('selected_options')
         for item in existing_items:
             if set(item.selected_options.all()) == set(selected_options):
                 cart_item = item
@@ -277,7 +304,7 @@ class CartViewSet(viewsets.ViewSet):
         URL: GET /api/cart/items/{cart_item_id}/
         """
         try:
-            cart_item = Cart.objects.get(user=request.user, pk=pk)
+            cart_item = cart_queryset(request.user).get(pk=pk)
             serializer = CartItemSerializer(cart_item, context={'request': request})
             return Response(serializer.data)
         except Cart.DoesNotExist:
@@ -303,7 +330,7 @@ class CartViewSet(viewsets.ViewSet):
             return Response({"error": "Invalid quantity."}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            cart_item = Cart.objects.get(user=request.user, pk=pk)
+            cart_item = cart_queryset(request.user).get(pk=pk)
         except Cart.DoesNotExist:
             return Response({"error": "Cart item not found in your cart."}, status=status.HTTP_404_NOT_FOUND)
 
@@ -351,7 +378,7 @@ class OrderViewSet(viewsets.ViewSet):
     """
     lookup_url_kwarg = 'pk'  # Explicitly define lookup_url_kwarg
     lookup_field = 'pk'     # Explicitly define lookup_field
-    queryset = Order.objects.all()
+    queryset = order_queryset()
     permission_classes_by_action = {
         'list': [IsAuthenticated], # For all authenticated users (customers, managers, delivery crew) - will refine further
         'retrieve': [IsAuthenticated], # For all authenticated users - will refine further
@@ -361,7 +388,11 @@ class OrderViewSet(viewsets.ViewSet):
         'destroy': [IsAuthenticated, IsManager], # Use IsManager for manager-only delete
         'assign_delivery_crew': [IsAuthenticated, IsManager], # Use IsManager for assign_delivery_crew
         'update_order_status_to_delivered': [IsAuthenticated, IsDeliveryCrew], # Use IsDeliveryCrew for delivery crew status update
+        'export': [IsAuthenticated, IsManager], # Accounting exports are manager-only
+        'dispatch_orders': [IsAuthenticated, IsManager], # Bulk courier assignment is manager-only
+        'courier_location': [IsAuthenticated], # Owner, assigned courier or manager; checked in the action
     }
+    throttle_scope = 'checkout' # Checkout only (see get_throttles)
 
     def get_permissions(self):
         try:
@@ -369,17 +400,22 @@ class OrderViewSet(viewsets.ViewSet):
         except KeyError:
             return [permission() for permission in self.permission_classes]
 
+    def get_throttles(self):
+        if self.action == 'create':
+            return [TokenBucketThrottle()]
+        return super().get_throttles()
+
     def list(self, request):
         """
         List orders based on user role, with optional filtering by status for managers.
          Customers: See their own order history.
          Managers/Delivery Crew: See all orders (with filtering by status for managers).
         """
-        queryset = Order.objects.all() # Start with all orders queryset
+        queryset = Order.objects.all() # serialize_orders() fetches the nested items and ETA columns itself
         status_filter_str = request.query_params.get('status') # Get status as string from query params (important for validation)
         status_filter = None # Initialize status_filter to None
 
-        if request.user.groups.filter(name='Manager').exists() or request.user.is_superuser: # Managers and Admin can see all orders, with filtering
+        if is_manager(request.user): # Managers and Admin can see all orders, with filtering
             if status_filter_str: # If status filter is provided
                 valid_status_choices = [str(code) for code, label in Order.STATUS_CHOICES] # Get valid status codes as strings
                 if status_filter_str in valid_status_choices: # Validate against valid choices (as strings)
@@ -388,25 +424,21 @@ class OrderViewSet(viewsets.ViewSet):
                 else:
                     return Response({"error": f"Invalid status value. Allowed values are: {', '.join(valid_status_choices)}"}, status=status.HTTP_400_BAD_REQUEST) # Return 400 for invalid status
 
-            serializer = OrderSerializer(queryset, many=True)
-            return Response(serializer.data)
-        elif request.user.groups.filter(name='Delivery crew').exists(): # Delivery crew sees assigned orders (to be implemented filtering later)
-            queryset = Order.objects.filter(delivery_crew=request.user) # For now, just delivery crew user's orders
-            serializer = OrderSerializer(queryset, many=True)
-            return Response(serializer.data)
+            return Response(serialize_orders(queryset))
+        elif has_role(request.user, DELIVERY_CREW): # Delivery crew sees assigned orders (to be implemented filtering later)
+            queryset = queryset.filter(delivery_crew=request.user) # For now, just delivery crew user's orders
+            return Response(serialize_orders(queryset))
         else: # Customers see their own orders
-            queryset = Order.objects.filter(user=request.user)
-            serializer = OrderSerializer(queryset, many=True)
-            return Response(serializer.data)
+            queryset = queryset.filter(user=request.user)
+            return Response(serialize_orders(queryset))
 
     def retrieve(self, request, pk=None):
         """
         Retrieve a specific order. Access based on user role and order ownership.
         """
-        queryset = Order.objects.all()
-        order = get_object_or_404(queryset, pk=pk)
+        order = get_object_or_404(order_queryset(), pk=pk)
 
-        if request.user == order.user or request.user.groups.filter(name__in=['Manager', 'Delivery crew']).exists() or request.user.is_superuser: # Owner, Manager, Delivery crew can view
+        if order.user_id == request.user.pk or has_role(request.user, MANAGER, DELIVERY_CREW) or request.user.is_superuser: # Owner, Manager, Delivery crew can view
             serializer = OrderSerializer(order)
             return Response(serializer.data)
         else:
@@ -418,43 +450,45 @@ class OrderViewSet(viewsets.ViewSet):
         Creates an order from the user's cart.
         """
         user = request.user
-        cart_items = Cart.objects.filter(user=user)
-
-        if not cart_items.exists():
-            return Response({"error": "Your cart is empty."}, status=status.HTTP_400_BAD_REQUEST)
 
         # Use a transaction to ensure atomicity
         with transaction.atomic():
+            cart_items = list(Cart.objects.filter(user=user).prefetch_related('selected_options'))
+            if not cart_items:
+                return Response({"error": "Your cart is empty."}, status=status.HTTP_400_BAD_REQUEST)
+
             # Calculate total price
             total = sum(item.price for item in cart_items)
 
             # Create the order
             order = Order.objects.create(user=user, total=total, status=0)
 
-            # Create order items from cart items
-            for item in cart_items:
-                order_item = OrderItem.objects.create(
-                    order=order,
-                    menuitem=item.menuitem,
-                    quantity=item.quantity,
-                    price=item.price,
-                )
-                # --- CRUCIAL STEP: Copy selected options ---
-                order_item.selected_options.set(item.selected_options.all())
+            # Create order items from cart items, in one INSERT
+            order_items = OrderItem.objects.bulk_create(
+                OrderItem(order=order, menuitem_id=item.menuitem_id, quantity=item.quantity, price=item.price)
+                for item in cart_items
+            )
+            # --- CRUCIAL STEP: Copy selected options ---
+            OrderItem.selected_options.through.objects.bulk_create(
+                OrderItem.selected_options.through(orderitem_id=order_item.pk, optionchoice_id=option.pk)
+                for order_item, item in zip(order_items, cart_items)
+                for option in item.selected_options.all()
+            )
 
             # Clear the cart
-            cart_items.delete()
+            Cart.objects.filter(pk__in=[item.pk for item in cart_items]).delete()
 
-        serializer = OrderSerializer(order, context={'request': request})
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        with bind(order_id=order.pk):
+            prefetch_related_objects([order], ORDER_ITEMS_PREFETCH)
+            serializer = OrderSerializer(order, context={'request': request})
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
     def update(self, request, pk=None): # For managers to update order details (initially admin only)
         """
         Update an existing order (Manager action - initially admin only).
         """
-        queryset = Order.objects.all()
-        order = get_object_or_404(queryset, pk=pk)
+        order = get_object_or_404(order_queryset(), pk=pk)
         serializer = OrderSerializer(order, data=request.data)
         if serializer.is_valid():
             serializer.save()
@@ -463,8 +497,7 @@ class OrderViewSet(viewsets.ViewSet):
 
 
     def partial_update(self, request, pk=None): # For managers to partially update orders
-        queryset = Order.objects.all()
-        order = get_object_or_404(queryset, pk=pk)
+        order = get_object_or_404(order_queryset(), pk=pk)
         serializer = OrderSerializer(order, data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
@@ -485,7 +518,7 @@ class OrderViewSet(viewsets.ViewSet):
         Assign delivery crew to an order (Manager action).
         Expects delivery_crew_id in request data.
         """
-        if not request.user.groups.filter(name='Manager').exists() and not request.user.is_superuser: # Only managers can assign
+        if not is_manager(request.user): # Only managers can assign
             return Response({"error": "Only managers can assign delivery crew."}, status=status.HTTP_403_FORBIDDEN)
 
         delivery_crew_id = request.data.get('delivery_crew_id')
@@ -509,12 +542,12 @@ class OrderViewSet(viewsets.ViewSet):
         """
         Delivery crew updates order status to 'Delivered'.
         """
-        if not (request.user.groups.filter(name='Manager').exists() or request.user.groups.filter(name='Delivery crew').exists()): # Only delivery crew can update status
+        if not has_role(request.user, MANAGER, DELIVERY_CREW): # Only delivery crew can update status
             return Response({"error": "Only delivery crew or managers can update order status."}, status=status.HTTP_403_FORBIDDEN)
 
         order = self.get_object() # Helper to get Order instance
 
-        if request.user.groups.filter(name='Delivery crew').exists(): # Check for Delivery Crew *specifically*
+        if has_role(request.user, DELIVERY_CREW): # Check for Delivery Crew *specifically*
             if order.delivery_crew != request.user: # Delivery crew assignment check
                   return Response({"error": "You are not assigned to this order."}, status=status.HTTP_403_FORBIDDEN)
 
@@ -523,6 +556,102 @@ class OrderViewSet(viewsets.ViewSet):
         serializer = OrderSerializer(order)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['post'], url_path='dispatch') # Bulk-assign pending orders of a store to its couriers (Manager only)
+    def dispatch_orders(self, request): # Not named 'dispatch', which would shadow APIView.dispatch
+        """
+        Assign all unassigned pending orders of a store to that store's delivery crew
+        by proximity and current load. Expects store_id; dry_run=true only returns the plan.
+        Optional: max_orders_per_courier.
+        """
+        store_id = request.data.get('store_id')
+        if not store_id:
+            return Response({"error": "store_id is required."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            store = StoreLocation.objects.get(pk=store_id)
+        except (StoreLocation.DoesNotExist, ValueError, TypeError):
+            return Response({"error": "Store not found."}, status=status.HTTP_400_BAD_REQUEST)
+
+        max_orders = request.data.get('max_orders_per_courier')
+        if max_orders is not None:
+            try:
+                max_orders = int(max_orders)
+                if max_orders <= 0:
+                    raise ValueError
+            except (TypeError, ValueError):
+                return Response({"error": "max_orders_per_courier must be a positive integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+        dry_run = str(request.data.get('dry_run', '')).lower() in ('1', 'true', 'yes')
+        plan = plan_dispatch(store, max_orders_per_courier=max_orders)
+        assignments = plan.assignments if dry_run else apply_plan(plan)
+        applied_ids = {a.order.pk for a in assignments}
+
+        return Response({
+            "store_id": store.pk,
+            "dry_run": dry_run,
+            "assignments": [
+                {
+                    "order_id": a.order.pk,
+                    "order_code": a.order.order_code,
+                    "delivery_crew_id": a.courier.pk,
+                    "delivery_crew_username": a.courier.username,
+                    "distance_km": round(a.distance_km, 2) if a.distance_km is not None else None,
+                }
+                for a in assignments
+            ],
+            # Orders with no courier capacity left, or (when applying) assigned by someone else meanwhile
+            "unassigned_order_ids": [o.pk for o in plan.unassigned]
+                + [a.order.pk for a in plan.assignments if a.order.pk not in applied_ids],
+        })
+
+    @action(detail=True, methods=['get'], url_path='courier-location') # Live position of the courier delivering this order
+    def courier_location(self, request, pk=None):
+        queryset = Order.objects.select_related('delivery_crew__userprofile__store_location')
+        order = get_object_or_404(queryset, pk=pk)
+
+        if request.user != order.user and request.user != order.delivery_crew and not is_manager(request.user):
+            return Response({"error": "You do not have permission to view this order."}, status=status.HTTP_403_FORBIDDEN)
+        if order.delivery_crew is None:
+            return Response({"error": "No courier has been assigned to this order yet."}, status=status.HTTP_404_NOT_FOUND)
+
+        courier = order.delivery_crew
+        profile = getattr(courier, 'userprofile', None)
+        store = profile.store_location if profile else None
+        ping = tracker.latest(courier.pk)
+        return Response({
+            "order_id": order.pk,
+            "courier": {"id": courier.pk, "name": courier.get_full_name() or courier.username},
+            "store": {"id": store.pk, "name": store.name} if store else None,
+            "latitude": ping.latitude if ping else None,
+            "longitude": ping.longitude if ping else None,
+            "recorded_at": ping.recorded_at if ping else None,
+            "is_live": is_fresh(ping),
+        })
+
+    @action(detail=False, methods=['get']) # Streaming order export for accounting (Manager only)
+    def export(self, request):
+        """
+        Stream all orders as CSV or JSON Lines, one row per order item.
+        Query params: file_format (csv|jsonl), start/end (YYYY-MM-DD, inclusive), store (StoreLocation id).
+        """
+        export_format = request.query_params.get('file_format', 'csv') # Not 'format', which DRF reserves for renderer selection
+        if export_format not in EXPORT_FORMATS:
+            return Response({"error": f"Invalid file_format. Allowed values are: {', '.join(EXPORT_FORMATS)}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            start_date, end_date, store_id = parse_export_filters(
+                request.query_params.get('start'),
+                request.query_params.get('end'),
+                request.query_params.get('store'),
+            )
+        except ExportFilterError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = get_export_queryset(start_date, end_date, store_id)
+        content_type = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+        response = StreamingHttpResponse(iter_export(export_format, queryset), content_type=f'{content_type}; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="orders.{export_format}"'
+        return response
+
     def get_object(self): # Helper method to get Order instance for detail actions (assign_delivery_crew, update_order_status_to_delivered)
         queryset = self.queryset
         if queryset is None:
@@ -567,6 +696,7 @@ class GroupViewSet(viewsets.ViewSet):
             return Response({"error": "User not found."}, status=status.HTTP_400_BAD_REQUEST)
 
         group.user_set.add(user) # Add user to the group (using User.groups ManyToManyField)
+        invalidate_roles([user.pk]) # Cached roles would otherwise outlive the change
         return Response({"message": f"User '{user.username}' added to group '{group.name}'."}, status=status.HTTP_200_OK)
 
 
@@ -588,6 +718,7 @@ class GroupViewSet(viewsets.ViewSet):
             return Response({"error": "User not found."}, status=status.HTTP_400_BAD_REQUEST)
 
         group.user_set.remove(user) # Remove user from the group
+        invalidate_roles([user.pk])
         return Response({"message": f"User '{user.username}' removed from group '{group.name}'."}, status=status.HTTP_200_OK)
 
 
@@ -605,7 +736,9 @@ class DirectOrderCreateView(APIView):
     View to create an order directly from payload data for voice orders.
     Sets user to None and is_voice_order to True.
     """
-    permission_classes = [HasAPIKey]
+    permission_classes = [CachedHasAPIKey] # HasAPIKey without re-hashing the key on every voice order
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'voice'
 
     def post(self, request, *args, **kwargs):
         input_serializer = DirectOrderInputSerializer(data=request.data)
@@ -623,21 +756,16 @@ class DirectOrderCreateView(APIView):
 
             with transaction.atomic():
                 total_price = Decimal(0)
-                menu_items_map = {}
+                menu_items_map = MenuItem.objects.in_bulk({item_data['menuitem_id'] for item_data in items_data}) # One query for all items
                 order_item_instances = []
 
                 # Validate items and calculate total price (same logic as before)
                 for item_data in items_data:
                     menuitem_id = item_data['menuitem_id']
                     quantity = item_data['quantity']
-                    if menuitem_id not in menu_items_map:
-                         try:
-                             menu_item = MenuItem.objects.get(pk=menuitem_id)
-                             menu_items_map[menuitem_id] = menu_item
-                         except MenuItem.DoesNotExist:
-                             return Response({"error": f"MenuItem with id {menuitem_id} not found."}, status=status.HTTP_400_BAD_REQUEST)
-                    else:
-                         menu_item = menu_items_map[menuitem_id]
+                    menu_item = menu_items_map.get(menuitem_id)
+                    if menu_item is None: # Deleted since validation
+                        return Response({"error": f"MenuItem with id {menuitem_id} not found."}, status=status.HTTP_400_BAD_REQUEST)
                     item_total = menu_item.price * quantity
                     total_price += item_total
                     order_item_instances.append(OrderItem(menuitem=menu_item, quantity=quantity, price=item_total))
@@ -655,13 +783,106 @@ class DirectOrderCreateView(APIView):
                 )
                 # --- End Order Creation ---
 
-                for oi in order_item_instances:
-                    oi.order = order
-                OrderItem.objects.bulk_create(order_item_instances)
+                with bind(order_id=order.pk):
+                    for oi in order_item_instances:
+                        oi.order = order
+                    OrderItem.objects.bulk_create(order_item_instances)
+
+                    prefetch_related_objects([order], ORDER_ITEMS_PREFETCH)
+                    response_serializer = OrderSerializer(order)
+                    return Response(response_serializer.data, status=status.HTTP_201_CREATED)
+
+        except Exception:
+            logger.exception("Error creating direct order")
+            return Response({"error": "An internal error occurred while creating the order."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 
-                response_serializer = OrderSerializer(order)
-                return Response(response_serializer.data, status=status.HTTP_201_CREATED)
+class DeliveryEligibilityView(APIView):
+    """
+    Checks many delivery locations at once (e.g. for the address picker).
+    GET: all of the current user's saved addresses.
+    POST: any mix of saved 'address_ids', free-text 'addresses' and 'coordinates'.
+    All locations are matched against the in-memory store index in one call (see StoreIndex.nearest_many).
+    By default only cached geocodes are used: uncached addresses come back with "pending": true and
+    saved ones are resolved by `manage.py geocode_backfill`.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        addresses = list(UserAddress.objects.filter(user=request.user).order_by('-is_default', 'nickname'))
+        return Response({"results": self.check_locations(addresses, [], [])})
+
+    def post(self, request):
+        input_serializer = DeliveryEligibilityInputSerializer(data=request.data)
+        if not input_serializer.is_valid():
+            return Response(input_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        validated_data = input_serializer.validated_data
+        address_ids = validated_data.get('address_ids', [])
+        saved = UserAddress.objects.filter(user=request.user).in_bulk(address_ids) # Only the user's own addresses
+        missing = [str(pk) for pk in address_ids if pk not in saved]
+        if missing:
+            return Response({"error": f"Address not found: {', '.join(missing)}."}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = self.check_locations(
+            [saved[pk] for pk in address_ids],
+            validated_data.get('addresses', []),
+            validated_data.get('coordinates', []),
+        )
+        return Response({"results": results})
+
+    def check_locations(self, saved_addresses, address_strs, coordinates):
+        # Saved addresses without coordinates are resolved together with the free-text ones (one cache query).
+        # Nothing is written back, so GET stays read-only: `manage.py geocode_backfill` stores their coordinates.
+        # DELIVERY_ELIGIBILITY_MAX_LOOKUPS provider calls may be made in the request (0 by default, cache only).
+        # Each one blocks the worker for the provider's latency, about a second with Nominatim's 1/s limit;
+        # the addresses left over come back as pending.
+        ungeocoded = [address for address in saved_addresses if address.latitude is None or address.longitude is None]
+        to_geocode = [address.formatted_address for address in ungeocoded] + list(address_strs)
+        max_lookups = getattr(settings, 'DELIVERY_ELIGIBILITY_MAX_LOOKUPS', 0)
+        geocoded = iter(geocode_addresses(to_geocode, max_lookups=max_lookups) if to_geocode else [])
+
+        entries = []
+        for address in saved_addresses:
+            fields = {"address_id": address.pk, "nickname": address.nickname, "address": address.formatted_address}
+            has_point = address.latitude is not None and address.longitude is not None
+            entries.append((fields, (address.latitude, address.longitude) if has_point else next(geocoded)))
+        entries += [({"address": text}, next(geocoded)) for text in address_strs]
+        entries += [({}, (point['latitude'], point['longitude'])) for point in coordinates]
+        matches = check_delivery_many([point or (None, None) for _, point in entries])
+
+        results = []
+        for (fields, point), (store, distance_km, can_deliver) in zip(entries, matches):
+            latitude, longitude = point or (None, None)
+            results.append({
+                **fields,
+                "latitude": latitude,
+                "longitude": longitude,
+                "pending": point is None, # Not geocoded yet: ask again shortly
+                "store": {"id": store.pk, "name": store.name} if store else None,
+                "distance_km": round(distance_km, 2) if distance_km is not None else None,
+                "can_deliver": can_deliver,
+            })
+        return results
+
+
+class CourierLocationView(APIView):
+    """
+    GPS ingestion for delivery crew. The courier app buffers pings and posts
+    them in batches; they are kept in memory (see restaurant.tracking) and
+    only a sample is written to the database.
+    """
+    permission_classes = [IsAuthenticated, IsDeliveryCrew]
+
+    def post(self, request):
+        input_serializer = CourierPingBatchSerializer(data=request.data)
+        if not input_serializer.is_valid():
+            return Response(input_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-        except Exception as e:
-            print(f"Error creating direct order: {e}")
-            return Response({"error": "An internal error occurred while creating the order."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+        received_at = timezone.now()
+        pings = [
+            Ping(ping['latitude'], ping['longitude'], ping.get('recorded_at') or received_at)
+            for ping in input_serializer.validated_data['pings']
+        ]
+        accepted = tracker.ingest(request.user.pk, pings)
+        return Response({"accepted": accepted}, status=status.HTTP_202_ACCEPTED)
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
 import datetime
+import sys
 from pathlib import Path
 from decouple import config
 
@@ -33,6 +34,16 @@ ALLOWED_HOSTS = ['127.0.0.1', 'localhost', '10.0.2.2', '192.168.1.146']
 MEDIA_URL = '/media/' # Base URL for serving media files
 MEDIA_ROOT = BASE_DIR / 'media' # Absolute filesystem path to the directory for user uploads
 
+# Uploads are stored under content-hashed names and served with immutable caching (see restaurant/storage.py
+# and restaurant/media.py). Set MEDIA_SERVE_HANDOFF to 'x-accel-redirect' (nginx, with an internal location
+# for MEDIA_ACCEL_REDIRECT_PREFIX aliased to MEDIA_ROOT) or 'x-sendfile' to let the front server send the bytes.
+STORAGES = {
+    'default': {'BACKEND': 'restaurant.storage.HashedMediaStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+MEDIA_SERVE_HANDOFF = config('MEDIA_SERVE_HANDOFF', default=None)
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -57,7 +68,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
-    'restaurant.debug_middleware.RequestDebugMiddleware',
+    'restaurant.structured_logging.RequestIdMiddleware', # Binds request_id before anything logs
+    'restaurant.instrumentation.InstrumentationMiddleware', # First, so it times the whole stack
+    'restaurant.db.ReadYourWritesMiddleware',
+    'restaurant.compression.CompressionMiddleware', # Outside everything that may still change the body
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -95,9 +109,150 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': 60, # Reuse connections so the pragmas below are not re-applied on every request
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE', # Take the write lock at BEGIN instead of failing to upgrade mid-transaction
+        },
+    },
+    # Same file through separate read-only connections; WAL lets them read while the primary writes
+    'read': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+DATABASE_ROUTERS = ['restaurant.db.ReadWriteRouter']
+
+# Applied to every new SQLite connection (see restaurant/db.py)
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL', # Durable across app crashes; WAL makes FULL unnecessary outside power loss
+    'busy_timeout': 5000, # Milliseconds to wait for a lock before "database is locked"
+    'mmap_size': 128 * 1024 * 1024,
+    'cache_size': -32000, # Negative = KiB, i.e. ~32 MB page cache per connection
+    'temp_store': 'MEMORY',
+}
+
+
+# Cache
+# Point CACHE_BACKEND/CACHE_LOCATION at a shared cache (e.g. django.core.cache.backends.redis.RedisCache)
+# in production so that invalidations (store index, ...) reach every worker process.
+
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='socului'),
     }
 }
 
+STORE_INDEX_MAX_AGE = 300 # Seconds before the in-memory store index is rebuilt regardless
+STORE_INDEX_VERSION_CHECK_INTERVAL = 1.0 # Seconds between checks of the shared invalidation version
+
+# Geocoding (see restaurant/geocoding.py). Use 'restaurant.geocoding.FixtureProvider' for tests/offline runs.
+GEOCODING_PROVIDER = config('GEOCODING_PROVIDER', default='restaurant.geocoding.NominatimProvider')
+GEOCODING_FIXTURE_PATH = config('GEOCODING_FIXTURE_PATH', default=None) # Optional JSON {"address": [lat, lon]}
+GEOCODING_MIN_INTERVAL = 1.0 # Nominatim usage policy: at most 1 request per second
+GEOCODE_CACHE_TTL_DAYS = 90
+GEOCODE_NOT_FOUND_TTL_HOURS = 24
+# Uncached provider lookups per delivery-eligibility request; the rest are 'pending'. 0 answers from the geocode
+# cache only; each lookup allowed here adds the provider's latency to the request (~1 s with Nominatim).
+DELIVERY_ELIGIBILITY_MAX_LOOKUPS = 0
+
+# Bulk courier dispatch (see restaurant/dispatch.py)
+DISPATCH_MAX_ORDERS_PER_COURIER = 3 # Including orders the courier already carries
+DISPATCH_LOAD_PENALTY_KM = 2.0 # Each order already carried counts like this many extra km
+
+# Delivery ETAs (see restaurant/eta.py); defaults apply until a store has history
+ETA_DEFAULT_PREP_MINUTES = 20
+ETA_DEFAULT_DELIVERY_MINUTES = 20
+ETA_DEFAULT_SPEED_KMH = 20.0
+ETA_SMOOTHING = 0.2 # Weight of the newest observation in the rolling averages
+ETA_STATS_RELOAD_INTERVAL = 60 # Seconds before a worker reloads a store's statistics written by `manage.py refresh_eta_stats`
+ETA_STATS_HISTORY_DAYS = 30 # Order history folded in for a store that has no statistics yet
+
+# Courier GPS tracking (see restaurant/tracking.py)
+TRACKING_RING_SIZE = 32 # Recent pings kept in memory per courier
+TRACKING_SAMPLE_SECONDS = 30 # Minimum spacing of pings written to CourierLocation
+TRACKING_FLUSH_INTERVAL = 10 # Seconds between bulk writes of sampled pings
+TRACKING_BACKGROUND_FLUSH = True # Write sampled pings from a background thread instead of the next ingest
+TRACKING_MAX_PENDING = 10_000 # Sampled pings kept for retry while the database cannot be written
+TRACKING_LATEST_TTL = 15 * 60 # Cache lifetime of a courier's latest position
+TRACKING_STALE_AFTER = 120 # Positions older than this are not reported as live
+
+# True when the default cache lives in each worker process, so invalidations do not reach the other workers
+CACHE_IS_PROCESS_LOCAL = CACHES['default']['BACKEND'] == 'django.core.cache.backends.locmem.LocMemCache'
+
+# Cross-request cache of group names used by permission checks (see restaurant/roles.py).
+# With a process-local cache a revoked role survives in other workers until this expires, so keep it short there.
+ROLE_CACHE_TTL = 5 if CACHE_IS_PROCESS_LOCAL else 300
+
+# Stateless auth: access tokens carry roles/store as claims and requests skip the user lookup
+# (see restaurant/authentication.py). Role changes bump a per-user generation that stale tokens fail.
+JWT_ROLE_CLAIMS = config('JWT_ROLE_CLAIMS', default=False, cast=bool)
+TOKEN_GENERATION_CACHE_TTL = 5 if CACHE_IS_PROCESS_LOCAL else 300 # Bumps only reach other workers through a shared cache
+
+# Verified API keys are remembered so the password hasher does not run per request (see restaurant/api_keys.py)
+API_KEY_CACHE_TTL = 300
+API_KEY_CACHE_SIZE = 256
+
+# Token-bucket limits on order creation, shared by all workers through the cache (see restaurant/throttling.py).
+# 'N/period' allows a burst of N, refilled at N per period; each user, API key and client IP has its own bucket.
+TOKEN_BUCKET_CACHE = 'default'
+TOKEN_BUCKET_RATES = {
+    'checkout': {'user': '10/min', 'ip': '30/min'}, # OrderViewSet.create
+    'voice': {'api_key': '120/min', 'ip': '120/min'}, # DirectOrderCreateView
+}
+
+# Async catalogue endpoints cache rendered responses; menu changes invalidate them (see restaurant/async_views.py)
+ASYNC_CATALOGUE_CACHE_TTL = 60 # 0 disables the cache
+
+# gzip/Brotli response compression; the catalogue routes keep their compressed variants in the cache
+# (see restaurant/compression.py). Brotli is used only when the `brotli` package is installed.
+COMPRESSION_MIN_SIZE = 1024 # bytes; smaller bodies are sent as they are
+COMPRESSION_CACHE_TTL = 3600
+COMPRESSION_THREAD_MIN_SIZE = 64 * 1024 # bytes; async requests compress bodies this large off the event loop
+COMPRESSION_EXCLUDED_PATHS = ['/api/auth/'] # Token responses (JWT, djoser) are never compressed (BREACH)
+COMPRESSION_CACHED_ROUTES = [
+    'category-list', 'category-detail', 'menuitem-list', 'menuitem-detail',
+    'async-category-list', 'async-menuitem-list', 'async-menuitem-detail',
+]
+
+# JSON logs written by a background thread, with request/order correlation ids (see restaurant/structured_logging.py).
+# LOG_SAMPLE_RATES keeps that fraction of a logger's sub-ERROR records, chosen per request.
+# The test runner gets a NullHandler: no listener thread and no JSON lines in the test output.
+TESTING = sys.argv[1:2] == ['test']
+LOG_SAMPLE_RATES = {
+    'restaurant.instrumentation': 0.1, # Repeated-query warnings fire on every request to an affected route
+    'restaurant.geocoding': 0.25,
+}
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'correlation': {'()': 'restaurant.structured_logging.CorrelationFilter'},
+        'sampling': {'()': 'restaurant.structured_logging.SamplingFilter', 'rates': LOG_SAMPLE_RATES},
+    },
+    'handlers': {
+        'structured': {
+            'class': 'logging.NullHandler' if TESTING else 'restaurant.structured_logging.QueueLogHandler',
+            'filters': ['correlation', 'sampling'],
+        },
+    },
+    'loggers': {
+        'restaurant': {'handlers': ['structured'], 'level': config('LOG_LEVEL', default='INFO'), 'propagate': False},
+    },
+}
+
+# Per-route request metrics (see restaurant/instrumentation.py), scraped from /api/metrics/
+INSTRUMENTATION_ENABLED = True
+INSTRUMENTATION_REPEATED_QUERY_THRESHOLD = 5 # Same SQL statement this many times in one request is logged as a likely N+1
+INSTRUMENTATION_SERVER_TIMING = DEBUG # Exposes DB/serializer timings to clients
+METRICS_TOKEN = config('METRICS_TOKEN', default='') # Bearer token for the Prometheus scraper; staff sessions also work
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -131,6 +286,12 @@ USE_TZ = True
 
 N8N_WEBHOOK_URL = 'https://deadstockro.app.n8n.cloud/webhook-test/54395520-dbcb-4927-bf9d-5699d67c0c2c'
 
+# Webhook outbox delivery (see restaurant/outbox.py and `manage.py drain_webhook_outbox`)
+OUTBOX_MAX_ATTEMPTS = 8 # Give up (status Failed) after this many attempts
+OUTBOX_BACKOFF_BASE_SECONDS = 5 # Retry delay doubles per attempt, starting here
+OUTBOX_BACKOFF_MAX_SECONDS = 3600
+OUTBOX_HTTP_TIMEOUT = 10
+
 
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.1/howto/static-files/
@@ -144,7 +305,11 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication', # Use JWT Authentication globally for API
+        'restaurant.authentication.ClaimsJWTAuthentication', # JWT authentication; trusts role claims when JWT_ROLE_CLAIMS is on
+    ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'restaurant.fast_serializers.FastJSONRenderer', # JSONRenderer output, encoded with orjson when installed
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticatedOrReadOnly', # Default permission: AllowAny read, IsAuthenticated for write
@@ -187,6 +352,8 @@ SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': datetime.timedelta(minutes=5),
     'REFRESH_TOKEN_LIFETIME': datetime.timedelta(minutes=5),
     'UPDATE_LAST_LOGIN': False,
+    'TOKEN_OBTAIN_SERIALIZER': 'restaurant.serializers.ClaimsTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'restaurant.serializers.ClaimsTokenRefreshSerializer',
     # 'ROTATE_REFRESH_TOKENS': True,
 }
 
@@ -198,7 +365,13 @@ JWT_AUTH = {
 # ==============================================================================
 # EMAIL CONFIGURATION (SendGrid SMTP)
 # ==============================================================================
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+# Outgoing mail is persisted by the queued backend and sent by `manage.py send_queued_email`
+# over QUEUED_EMAIL_DELIVERY_BACKEND. Set EMAIL_DELIVERY_BACKEND to
+# 'django.core.mail.backends.console.EmailBackend' (or the filebased backend + EMAIL_FILE_PATH) locally.
+EMAIL_BACKEND = 'restaurant.email_queue.QueuedEmailBackend'
+QUEUED_EMAIL_DELIVERY_BACKEND = config('EMAIL_DELIVERY_BACKEND', default='django.core.mail.backends.smtp.EmailBackend')
+QUEUED_EMAIL_MAX_ATTEMPTS = 5
+EMAIL_FILE_PATH = config('EMAIL_FILE_PATH', default=str(BASE_DIR / 'sent_emails'))
 EMAIL_HOST = 'smtp.sendgrid.net'
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings           # Import settings
-from django.conf.urls.static import static # Import static
+from restaurant.media import serve_media
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -10,5 +10,5 @@ urlpatterns = [
     path('api/auth/', include('djoser.urls.jwt')),
 ]
 
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+if settings.MEDIA_URL.startswith('/'): # Not when media is on a CDN or another host
+    urlpatterns.append(path(settings.MEDIA_URL.lstrip('/') + '<path:path>', serve_media, name='media'))
\ No newline at end of file